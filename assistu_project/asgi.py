@@ -3,4 +3,19 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'assistu_project.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+application = get_asgi_application()
+
+# Optionally load the embedding model in the background at startup so the
+# first note search does not pay for it
+from django.conf import settings
+
+if getattr(settings, 'EMBEDDING_WARMUP', False):
+    import threading
+    from notes.allMiniLm_utils import warm_up
+
+    threading.Thread(target=warm_up, name='embedding-warmup', daemon=True).start()
+
+# Resume PDF ingestion jobs queued or interrupted before this process started
+from notes.jobs import start_job_recovery
+
+start_job_recovery()
@@ -0,0 +1,49 @@
+"""
+In-process cache with the get/set/delete surface of a Django cache.
+
+Used where a per-process cache is the default and a Django cache alias
+(shared between workers) is the opt-in alternative, e.g. query embeddings
+(notes.query_cache) and the dashboard first page (tasks.dashboard), so
+either can be swapped in without changing the calling code.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    """Thread-safe LRU of at most max_entries entries, each expiring after its timeout"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Store value for timeout seconds (self.ttl when None)"""
+        timeout = self.ttl if timeout is None else timeout
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,31 @@
+"""
+Thread pools created on first use.
+
+Modules that fan work out to threads (LLM calls, PDF jobs, dashboard
+sections, profile counters) keep one pool per process. Building it lazily
+means importing the module, e.g. from a management command, starts no
+threads.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LazyExecutor:
+    """A ThreadPoolExecutor built by the first get(); on_start(executor) runs once after that"""
+
+    def __init__(self, max_workers, thread_name_prefix, on_start=None):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self.on_start = on_start
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix=self.thread_name_prefix)
+                    if self.on_start is not None:
+                        self.on_start(self._executor)
+        return self._executor
@@ -0,0 +1,254 @@
+"""
+Shared client for the Groq chat-completions API.
+
+Every LLM call in the project goes through here instead of a bare
+`requests.post`, so connections are pooled and kept alive across calls
+(no TCP + TLS handshake per request), concurrency is capped, and 429/5xx
+responses are retried with jittered exponential backoff.
+
+    data = chat_completion(payload, timeout=30)          # sync views/utils
+    data = await achat_completion(payload, timeout=30)   # async (ASGI) code
+
+Both return the decoded JSON response body, or `parse(body)` when a parse
+function is given. Passing `cache="<endpoint>"` opts the call into the
+response cache in assistu_project.llm_cache; only bodies that `parse`
+accepted are stored, so a malformed reply is not replayed to retries. The URL and key come from
+GROQ_LLM_URL / GROQ_API_KEY, so pointing GROQ_LLM_URL at a local stub
+(see assistu_project.llm_stub) exercises the real client end to end.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+
+import httpx
+from django.conf import settings
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """The LLM API could not be reached or kept failing after retries"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LLMClient:
+    def __init__(self, url=None, api_key=None, max_connections=None, max_concurrency=None,
+                 max_retries=None, backoff_base=None, backoff_max=None):
+        self.url = (url or getattr(settings, "GROQ_LLM_URL", "https://api.groq.com/openai/v1/chat/completions")).strip()
+        self.api_key = api_key if api_key is not None else settings.GROQ_API_KEY
+        self.max_connections = max_connections or getattr(settings, "LLM_MAX_CONNECTIONS", 20)
+        self.max_concurrency = max_concurrency or getattr(settings, "LLM_MAX_CONCURRENCY", 8)
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, "LLM_MAX_RETRIES", 3)
+        self.backoff_base = backoff_base or getattr(settings, "LLM_BACKOFF_BASE", 0.5)
+        self.backoff_max = backoff_max or getattr(settings, "LLM_BACKOFF_MAX", 8.0)
+
+        self._limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=60,
+        )
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        # httpx.AsyncClient and asyncio.Semaphore are bound to one event loop
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _headers(self):
+        if not self.api_key:
+            raise LLMError("GROQ_API_KEY is not set in settings")
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _sync_client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.Client(limits=self._limits)
+        return self._client
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None:
+            entry = (httpx.AsyncClient(limits=self._limits), asyncio.Semaphore(self.max_concurrency))
+            self._async_clients[loop] = entry
+        return entry
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # Full jitter keeps many workers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _result(self, response):
+        try:
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            raise LLMError(f"LLM API returned {response.status_code}: {response.text[:200]}",
+                           status_code=response.status_code) from e
+        except ValueError as e:
+            raise LLMError(f"LLM API returned invalid JSON: {e}") from e
+
+    def chat_completion(self, payload, timeout=30):
+        headers = self._headers()
+        client = self._sync_client()
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                with self._semaphore:
+                    response = client.post(self.url, json=payload, headers=headers, timeout=timeout)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise LLMError(f"LLM API request failed: {e}") from e
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return self._result(response)
+            time.sleep(self._backoff(attempt, response))
+
+    async def achat_completion(self, payload, timeout=30):
+        headers = self._headers()
+        client, semaphore = self._async_client()
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                async with semaphore:
+                    response = await client.post(self.url, json=payload, headers=headers, timeout=timeout)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise LLMError(f"LLM API request failed: {e}") from e
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return self._result(response)
+            await asyncio.sleep(self._backoff(attempt, response))
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+def json_content(data):
+    """
+    The JSON object in the first choice of a response body, with any ```json
+    fence the model added stripped. Raises ValueError if there is no choice
+    or the content is not valid JSON.
+    """
+    if not data.get("choices"):
+        raise ValueError("No choices in response")
+    content = (data["choices"][0]["message"]["content"] or "").strip()
+    if content.startswith('```json'):
+        content = content[7:]
+    if content.startswith('```'):
+        content = content[3:]
+    if content.endswith('```'):
+        content = content[:-3]
+    content = content.strip()
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        raise ValueError(f"Invalid JSON response: {content}")
+
+
+def json_with_fields(*fields):
+    """A parse function for chat_completion: json_content, rejecting objects without any of `fields`"""
+    def parse(data):
+        content = json_content(data)
+        for field in fields:
+            if field not in content:
+                raise ValueError(f"LLM response missing required field: {field}")
+        return content
+    return parse
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client configured from settings"""
+    global _default_client
+    if _default_client is None:
+        with _default_lock:
+            if _default_client is None:
+                _default_client = LLMClient()
+    return _default_client
+
+
+def set_client(client):
+    """Swap the process-wide client, e.g. for one pointed at a stub server"""
+    global _default_client
+    with _default_lock:
+        _default_client = client
+
+
+def _parsed(data, parse):
+    return parse(data) if parse is not None else data
+
+
+def _parsed_cached(llm_cache, key, data, parse):
+    """(True, result) for a cached body parse accepts; entries that fail are evicted"""
+    if data is None:
+        return False, None
+    try:
+        return True, _parsed(data, parse)
+    except Exception:
+        llm_cache.evict(key)
+        return False, None
+
+
+def chat_completion(payload, timeout=30, cache=None, cache_scope=None, parse=None):
+    """
+    `cache` names the calling endpoint (e.g. "notes.summary"); if that endpoint
+    is listed in LLM_CACHE_ENDPOINTS, identical payloads within the same
+    `cache_scope` are answered from the response cache (assistu_project.llm_cache).
+    `parse(body)` (e.g. json_content) is returned instead of the body; a body
+    it raises for is not cached.
+    """
+    if cache is None:
+        return _parsed(get_client().chat_completion(payload, timeout=timeout), parse)
+
+    from . import llm_cache
+    if not llm_cache.is_enabled(cache):
+        return _parsed(get_client().chat_completion(payload, timeout=timeout), parse)
+
+    key = llm_cache.cache_key(payload, cache_scope)
+    hit, result = _parsed_cached(llm_cache, key, llm_cache.lookup(cache, key), parse)
+    if hit:
+        return result
+    data = get_client().chat_completion(payload, timeout=timeout)
+    result = _parsed(data, parse)
+    llm_cache.store(cache, key, data)
+    return result
+
+
+async def achat_completion(payload, timeout=30, cache=None, cache_scope=None, parse=None):
+    if cache is None:
+        return _parsed(await get_client().achat_completion(payload, timeout=timeout), parse)
+
+    from . import llm_cache
+    if not llm_cache.is_enabled(cache):
+        return _parsed(await get_client().achat_completion(payload, timeout=timeout), parse)
+
+    # The cache lives in Mongo via mongoengine, which is synchronous
+    key = llm_cache.cache_key(payload, cache_scope)
+    data = await asyncio.to_thread(llm_cache.lookup, cache, key)
+    hit, result = await asyncio.to_thread(_parsed_cached, llm_cache, key, data, parse)
+    if hit:
+        return result
+    data = await get_client().achat_completion(payload, timeout=timeout)
+    result = _parsed(data, parse)
+    await asyncio.to_thread(llm_cache.store, cache, key, data)
+    return result
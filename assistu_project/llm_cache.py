@@ -0,0 +1,151 @@
+"""
+Content-addressed cache of LLM responses.
+
+Identical requests - the same lecture PDF re-uploaded, the same voice command
+repeated - are answered from Mongo instead of a Groq round-trip. The key is a
+SHA-256 of the model, messages and sampling parameters, plus an optional
+scope (the current date for prompts that resolve "today"/"tomorrow").
+
+Caching is opt-in per endpoint name (LLM_CACHE_ENDPOINTS); entries expire
+through a TTL index and the collection is pruned to LLM_CACHE_MAX_ENTRIES.
+Hit/miss counts are kept per endpoint, both per process and in Mongo.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from mongoengine import Document, fields
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = getattr(settings, "LLM_CACHE_TTL", 7 * 24 * 3600)
+CACHE_MAX_ENTRIES = getattr(settings, "LLM_CACHE_MAX_ENTRIES", 50000)
+CACHE_MAX_RESPONSE_BYTES = getattr(settings, "LLM_CACHE_MAX_RESPONSE_BYTES", 64 * 1024)
+CACHE_ENDPOINTS = set(getattr(settings, "LLM_CACHE_ENDPOINTS", {
+    "notes.summary",
+    "notes.summary_map",
+    "notes.tags",
+    "notes.content",
+    "tasks.create",
+}))
+# Check the collection size every this many writes
+PRUNE_EVERY = 500
+
+
+class CachedLLMResponse(Document):
+    key = fields.StringField(required=True, unique=True)
+    endpoint = fields.StringField(required=True)
+    response = fields.StringField(required=True)  # JSON body as returned by the API
+    size = fields.IntField()
+    hits = fields.IntField(default=0)
+    created_at = fields.DateTimeField(default=datetime.utcnow)
+
+    meta = {
+        'collection': 'llm_cache',
+        'indexes': [
+            {'fields': ['created_at'], 'expireAfterSeconds': CACHE_TTL},
+        ]
+    }
+
+
+class LLMCacheStats(Document):
+    endpoint = fields.StringField(primary_key=True)
+    hits = fields.IntField(default=0)
+    misses = fields.IntField(default=0)
+
+    meta = {'collection': 'llm_cache_stats'}
+
+
+_counters = {}
+_counters_lock = threading.Lock()
+_writes = 0
+
+
+def is_enabled(endpoint):
+    return endpoint in CACHE_ENDPOINTS
+
+
+def cache_key(payload, scope=None):
+    """Hash of everything that determines the response, plus the caller's scope"""
+    canonical = json.dumps({"payload": payload, "scope": scope}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _count(endpoint, hit):
+    with _counters_lock:
+        hits, misses = _counters.get(endpoint, (0, 0))
+        _counters[endpoint] = (hits + 1, misses) if hit else (hits, misses + 1)
+    LLMCacheStats.objects(endpoint=endpoint).update_one(
+        upsert=True, **{"inc__hits" if hit else "inc__misses": 1}
+    )
+
+
+def lookup(endpoint, key):
+    """Cached response body for key, or None. Cache errors count as misses."""
+    try:
+        entry = CachedLLMResponse.objects(key=key).modify(inc__hits=1)
+        _count(endpoint, entry is not None)
+        return json.loads(entry.response) if entry is not None else None
+    except Exception:
+        logger.exception("LLM cache lookup failed")
+        return None
+
+
+def store(endpoint, key, response):
+    global _writes
+    try:
+        body = json.dumps(response)
+        if len(body) > CACHE_MAX_RESPONSE_BYTES:
+            return
+        CachedLLMResponse.objects(key=key).update_one(
+            upsert=True,
+            set__endpoint=endpoint,
+            set__response=body,
+            set__size=len(body),
+            set__created_at=datetime.utcnow(),
+        )
+        with _counters_lock:
+            _writes += 1
+            should_prune = _writes % PRUNE_EVERY == 0
+        if should_prune:
+            prune()
+    except Exception:
+        logger.exception("LLM cache store failed")
+
+
+def evict(key):
+    """Drop an entry, e.g. one its caller could not parse"""
+    try:
+        CachedLLMResponse.objects(key=key).delete()
+    except Exception:
+        logger.exception("LLM cache evict failed")
+
+
+def prune():
+    """Drop the oldest entries beyond CACHE_MAX_ENTRIES"""
+    excess = CachedLLMResponse.objects.count() - CACHE_MAX_ENTRIES
+    if excess <= 0:
+        return 0
+    oldest = CachedLLMResponse.objects.order_by("created_at").only("id").limit(excess)
+    return CachedLLMResponse.objects(id__in=[entry.id for entry in oldest]).delete()
+
+
+def metrics():
+    """Per-endpoint hit counts: this process, and all processes (from Mongo)"""
+    with _counters_lock:
+        local = {
+            endpoint: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+            for endpoint, (hits, misses) in _counters.items()
+        }
+    shared = {}
+    for stats in LLMCacheStats.objects:
+        lookups = stats.hits + stats.misses
+        shared[stats.endpoint] = {
+            "hits": stats.hits,
+            "misses": stats.misses,
+            "hit_rate": stats.hits / lookups if lookups else 0.0,
+        }
+    return {"process": local, "all": shared}
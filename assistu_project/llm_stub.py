@@ -0,0 +1,93 @@
+"""
+Local stand-in for the Groq chat-completions API.
+
+Serves OpenAI-style responses on 127.0.0.1 with an injectable delay and
+failure rate, so the shared LLM client (assistu_project.llm) and the code
+paths built on it can be exercised and timed without network access:
+
+    server = StubLLMServer(delay=0.8, respond=lambda payload: {...})
+    server.start()
+    client = LLMClient(url=server.url, api_key="test")
+    ...
+    server.stop()
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def default_respond(payload):
+    return {"summary": "", "explanation": []}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with stub.lock:
+            stub.requests += 1
+            fail = stub.failure_rate and random.random() < stub.failure_rate
+
+        if stub.delay:
+            time.sleep(stub.delay)
+
+        if fail:
+            self._send(429, {"error": {"message": "rate limited (stub)"}}, {"Retry-After": "0"})
+            return
+
+        payload = json.loads(body or b"{}")
+        content = stub.respond(payload)
+        self._send(200, {
+            "id": "stub",
+            "object": "chat.completion",
+            "model": payload.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(content)},
+                "finish_reason": "stop"
+            }]
+        })
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubLLMServer:
+    def __init__(self, delay=0.0, failure_rate=0.0, respond=default_respond, port=0):
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.respond = respond
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/openai/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,91 @@
+"""
+Read models for the list endpoints.
+
+The list views need five or six fields per document. Building MongoEngine
+Documents for them converts every field of every document and dereferences
+references (Event.related_task, StudyPlan.user) only to read an id back.
+These functions query the raw pymongo collection with a projection and turn
+the BSON straight into the response dicts; references are already ObjectIds
+in the raw documents.
+
+Fields missing from a stored document fall back to the model's default, as
+they would on a hydrated Document, so the responses are unchanged.
+"""
+from bson import ObjectId
+
+from events.models import Event
+from notes.models import Note
+from planner.models import StudyPlan
+from tasks.models import Task
+
+
+def _user_id(user):
+    return ObjectId(str(getattr(user, 'id', user)))
+
+
+def _rows(model, user, fields, sort=None):
+    """Raw documents of a user with only `fields`, missing ones set to the model defaults"""
+    defaults = {name: model._fields[name].default for name in fields}
+    cursor = model._get_collection().find({'user': _user_id(user)}, {name: 1 for name in fields})
+    if sort:
+        cursor = cursor.sort(sort)
+    for document in cursor:
+        for name, default in defaults.items():
+            if name not in document:
+                document[name] = default() if callable(default) else default
+        yield document
+
+
+def _str_or_none(value):
+    return str(value) if value is not None else None
+
+
+def list_notes(user):
+    """get_all_notes rows"""
+    return [{
+        'id': str(n['_id']),
+        'title': n['title'],
+        'subject': n['subject'],
+        'importance': n['importance'],
+        'created_at': n['created_at'],
+    } for n in _rows(Note, user, ('title', 'subject', 'importance', 'created_at'))]
+
+
+def list_tasks(user):
+    """user_tasks_view rows"""
+    return [{
+        'id': str(t['_id']),
+        'title': t['title'],
+        'subject': t['subject'],
+        'status': t['status'],
+        'priority': t['priority'],
+        'due_date': t['due_date'],
+    } for t in _rows(Task, user, ('title', 'subject', 'status', 'priority', 'due_date'))]
+
+
+def list_events(user):
+    """list_events rows"""
+    fields = ('title', 'description', 'event_type', 'start_time', 'end_time', 'related_task')
+    return [{
+        'id': str(e['_id']),
+        'title': e['title'],
+        'description': e['description'],
+        'event_type': e['event_type'],
+        'start_time': e['start_time'],
+        'end_time': e['end_time'],
+        'related_task': _str_or_none(e['related_task']),
+    } for e in _rows(Event, user, fields)]
+
+
+def list_plans(user):
+    """planner list rows (serialize_plan), most recent first"""
+    fields = ('user', 'title', 'duration', 'sessions', 'created_at', 'updated_at')
+    return [{
+        'id': str(p['_id']),
+        'user_id': str(p['user']),
+        'title': p['title'],
+        'duration': p['duration'],
+        'sessions': p['sessions'],
+        'created_at': p['created_at'],
+        'updated_at': p['updated_at'],
+    } for p in _rows(StudyPlan, user, fields, sort=[('_id', -1)])]
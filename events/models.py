@@ -12,4 +12,9 @@ class Event(Document):
     related_task = fields.ReferenceField(Task, null=True)
     created_at = fields.DateTimeField(auto_now_add=True)
     
-    meta = {'collection': 'events'}
\ No newline at end of file
+    meta = {
+        'collection': 'events',
+        'indexes': [
+            {'fields': ['user', 'start_time']}
+        ]
+    }
\ No newline at end of file
@@ -1,18 +1,16 @@
-import json
-import requests
-from django.conf import settings
+from assistu_project.llm import chat_completion, json_with_fields, LLMError
+from users.stats import record_change
+from tasks.dashboard import invalidate_dashboard
 from .models import Event
 from datetime import datetime, timedelta
 from bson import ObjectId  # for ObjectId validation
 
 
 def plan_event_from_llm(user, event_description):
-    llm_url = getattr(settings, "GROQ_LLM_URL", "https://api.groq.com/openai/v1/chat/completions").strip()
-    api_key = settings.GROQ_API_KEY
-
     # Get current date for context
     current_date = datetime.now().strftime("%Y-%m-%d")
-    current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Minute precision: relative requests ("in 30 minutes") resolve against it
+    current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M")
     
     prompt = f"""
     You are a professional event planner. The user wants to create an event based on this description: "{event_description}"
@@ -59,51 +57,10 @@ def plan_event_from_llm(user, event_description):
         "response_format": {"type": "json_object"}  # Force JSON response
     }
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
     try:
-        res = requests.post(llm_url, json=payload, headers=headers, timeout=30)
-        res.raise_for_status()
-        
-        data = res.json()
-        
-        if "choices" not in data or len(data["choices"]) == 0:
-            raise ValueError("Invalid API response: no choices returned")
-        
-        content = data["choices"][0]["message"]["content"]
-        
-        if not content:
-            raise ValueError("Empty response from LLM")
-        
-        print(f"Raw LLM response: {content}")  # Debug
-        
-        # Clean the response - remove any markdown code blocks
-        content = content.strip()
-        if content.startswith('```json'):
-            content = content[7:]  # Remove ```json
-        if content.startswith('```'):
-            content = content[3:]  # Remove ```
-        if content.endswith('```'):
-            content = content[:-3]  # Remove ```
-        content = content.strip()
-        
-        if not content:
-            raise ValueError("Cleaned response is empty")
-        
-        try:
-            event_data = json.loads(content)
-        except json.JSONDecodeError:
-            print(f"Failed to parse JSON: {content}")
-            raise ValueError(f"Invalid JSON response from LLM")
-        
-        # Validate required fields
-        required_fields = ['title', 'event_type', 'start_time', 'end_time']
-        for f in required_fields:
-            if f not in event_data:
-                raise ValueError(f"LLM response missing required field: {f}")
+        # Replies without the required fields raise ValueError and are not cached
+        event_data = chat_completion(payload, timeout=30, cache="events.create", cache_scope=current_date,
+                                     parse=json_with_fields('title', 'event_type', 'start_time', 'end_time'))
 
         # Validate field values
         valid_types = ['study_session', 'class', 'meeting', 'exam']
@@ -172,7 +129,7 @@ def plan_event_from_llm(user, event_description):
         )
         return event
         
-    except requests.exceptions.RequestException as e:
+    except LLMError as e:
         print(f"API request error: {e}")
         raise ValueError(f"Failed to connect to LLM service: {str(e)}")
     except Exception as e:
@@ -192,6 +149,8 @@ def delete_event(user, event_id):
     if not event or event.user.id != user.id:
         raise ValueError("Event not found or access denied")
     event.delete()
+    record_change(user.id, events=-1)
+    invalidate_dashboard(user.id)
     return True
 
 def update_event(user, event_id, update_data):
@@ -212,6 +171,7 @@ def update_event(user, event_id, update_data):
                         continue
             setattr(event, key, value)
     event.save()
+    invalidate_dashboard(user.id)
     return event
 
 def get_user_events(user):
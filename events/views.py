@@ -1,7 +1,10 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .utils import plan_event_from_llm, get_user_events, update_event, delete_event, get_event_by_id
+from users.stats import record_change
+from tasks.dashboard import invalidate_dashboard
+from assistu_project import read_models
+from .utils import plan_event_from_llm, update_event, delete_event, get_event_by_id
 from bson import ObjectId
 
 @api_view(["POST"])
@@ -16,6 +19,8 @@ def create_event(request):
     try:
         event = plan_event_from_llm(user, event_description)
         event.save()
+        record_change(user.id, events=1)
+        invalidate_dashboard(user.id)
         return Response({"success": True, "event_id": str(event.id)})
     except Exception as e:
         return Response({"error": str(e)}, status=400)
@@ -25,19 +30,7 @@ def create_event(request):
 @permission_classes([IsAuthenticated])
 def list_events(request):
     user = request.user
-    events = get_user_events(user)
-    res = []
-    for e in events:
-        res.append({
-            "id": str(e.id),
-            "title": e.title,
-            "description": e.description,
-            "event_type": e.event_type,
-            "start_time": e.start_time,
-            "end_time": e.end_time,
-            "related_task": str(e.related_task.id) if e.related_task else None
-        })
-    return Response(res)
+    return Response(read_models.list_events(user))
 
 
 @api_view(["GET"])
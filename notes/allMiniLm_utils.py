@@ -1,107 +1,403 @@
-import onnxruntime as ort
-from transformers import AutoTokenizer
 import numpy as np
 from django.conf import settings
 import os
+import threading
 
-# Initialize ONNX model and tokenizer (load once at module level)
+from .embedding_worker import EmbeddingBatcher
+from .query_cache import build_query_cache
+
+# The ONNX session and tokenizer are loaded on first use (or by warm_up()),
+# so importing this module - and every view that does - stays cheap
 MODEL_DIR = os.path.join(settings.BASE_DIR, "all-MiniLM-L6-v2")
-session = ort.InferenceSession(
-    f"{MODEL_DIR}/model.onnx", 
-    providers=["CPUExecutionProvider"]
+_sessions = {}
+_session_inputs = {}
+_tokenizer = None
+_load_lock = threading.Lock()
+
+# "int8" is the dynamically quantized, graph-optimized model produced by
+# `manage.py quantize_embedding_model`; only switch to it once
+# `manage.py evaluate_embedding_variant` passes
+MODEL_VARIANT = getattr(settings, "EMBEDDING_MODEL_VARIANT", "fp32")
+MODEL_FILES = {
+    "fp32": "model.onnx",
+    "int8": "model.int8.onnx",
+}
+
+
+class RustTokenizer:
+    """
+    Thin wrapper over the `tokenizers` library reading tokenizer.json directly,
+    which avoids importing all of `transformers`
+    """
+
+    def __init__(self, path):
+        from tokenizers import Tokenizer
+
+        self._tokenizer = Tokenizer.from_file(path)
+        # tokenizer.json ships with fixed 128-token padding/truncation;
+        # embed_texts pads per bucket and truncates itself
+        self._tokenizer.no_padding()
+        self._tokenizer.no_truncation()
+        self.pad_token_id = self._tokenizer.token_to_id("[PAD]") or 0
+
+    def encode(self, texts):
+        return [encoding.ids for encoding in self._tokenizer.encode_batch(list(texts))]
+
+
+class TransformersTokenizer:
+    """Fallback for environments without the standalone `tokenizers` package"""
+
+    def __init__(self, model_dir):
+        from transformers import AutoTokenizer
+
+        self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.pad_token_id = self._tokenizer.pad_token_id or 0
+
+    def encode(self, texts):
+        return self._tokenizer(list(texts), padding=False, truncation=False, verbose=False)["input_ids"]
+
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        with _load_lock:
+            if _tokenizer is None:
+                try:
+                    _tokenizer = RustTokenizer(os.path.join(MODEL_DIR, "tokenizer.json"))
+                except ImportError:
+                    _tokenizer = TransformersTokenizer(MODEL_DIR)
+    return _tokenizer
+
+def model_path(variant=None):
+    return os.path.join(MODEL_DIR, MODEL_FILES[variant or MODEL_VARIANT])
+
+def get_session(variant=None):
+    """ONNX session for a model variant (the configured one by default)"""
+    variant = variant or MODEL_VARIANT
+    session = _sessions.get(variant)
+    if session is None:
+        with _load_lock:
+            session = _sessions.get(variant)
+            if session is None:
+                import onnxruntime as ort
+
+                session_options = ort.SessionOptions()
+                session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                # 0 keeps onnxruntime's default (one thread per physical core)
+                session_options.intra_op_num_threads = getattr(settings, "EMBEDDING_INTRA_OP_THREADS", 0)
+                session_options.inter_op_num_threads = getattr(settings, "EMBEDDING_INTER_OP_THREADS", 0)
+                session = ort.InferenceSession(
+                    model_path(variant), 
+                    sess_options=session_options,
+                    providers=["CPUExecutionProvider"]
+                )
+                _session_inputs[variant] = {model_input.name for model_input in session.get_inputs()}
+                _sessions[variant] = session
+    return session
+
+# "local" loads the model in every worker process; "socket" sends texts to a
+# single `manage.py run_embedding_server` process that owns the model
+EMBEDDING_BACKEND = getattr(settings, "EMBEDDING_BACKEND", "local")
+EMBEDDING_SOCKET_PATH = getattr(settings, "EMBEDDING_SOCKET_PATH", "/tmp/assistu-embeddings.sock")
+_socket_client = None
+
+def get_socket_client():
+    global _socket_client
+    if _socket_client is None:
+        from .embedding_server import SocketEmbeddingClient
+        _socket_client = SocketEmbeddingClient(EMBEDDING_SOCKET_PATH)
+    return _socket_client
+
+def warm_up():
+    """Load the tokenizer and model and run one forward pass ahead of traffic"""
+    if EMBEDDING_BACKEND == "socket":
+        # The embedding server owns the model; just open this worker's connection
+        embed_texts(["warm up"])
+        return
+    get_tokenizer()
+    get_session()
+    embed_texts(["warm up"])
+
+# Stored alongside each Note embedding so vectors from a different model are
+# never compared against the current one
+EMBEDDING_MODEL_VERSION = getattr(settings, "EMBEDDING_MODEL_VERSION", None) or (
+    "all-MiniLM-L6-v2" if MODEL_VARIANT == "fp32" else f"all-MiniLM-L6-v2-{MODEL_VARIANT}"
 )
-tokenizer = AutoTokenizer.from_pretrained(MODEL_DIR)
+EMBEDDING_DIM = 384
 
-def embed_texts(texts):
+MAX_SEQ_LENGTH = 512
+# Texts are grouped so no sequence in a model call carries more than this
+# many padding tokens, and no call processes more than BUCKET_MAX_TOKENS
+BUCKET_MAX_PADDING = getattr(settings, "EMBEDDING_BUCKET_MAX_PADDING", 32)
+BUCKET_MAX_TOKENS = getattr(settings, "EMBEDDING_BUCKET_MAX_TOKENS", 16384)
+
+def plan_buckets(lengths, max_padding=None, max_tokens=None):
     """
-    Generate embeddings for a list of texts using ONNX model
+    Group text positions into length buckets with bounded padding.
+    Returns a list of index arrays; together they cover every position once.
     """
-    if not texts:
-        return np.array([])
-    
-    # Tokenize → return numpy instead of torch
-    inputs = tokenizer(
-        texts, 
-        return_tensors="np", 
-        padding=True, 
-        truncation=True,
-        max_length=512
-    )
+    max_padding = BUCKET_MAX_PADDING if max_padding is None else max_padding
+    max_tokens = BUCKET_MAX_TOKENS if max_tokens is None else max_tokens
+
+    lengths = np.asarray(lengths)
+    order = np.argsort(lengths, kind="stable")
+    buckets = []
+    start = 0
+    for end in range(1, len(order) + 1):
+        if end < len(order):
+            shortest = lengths[order[start]]
+            longest = lengths[order[end]]
+            # Sorted ascending, so the bucket is padded to its last element
+            if longest - shortest <= max_padding and longest * (end + 1 - start) <= max_tokens:
+                continue
+        buckets.append(order[start:end])
+        start = end
+    return buckets
+
+def run_model(input_ids, attention_mask, variant=None):
+    """
+    Forward a padded batch through the ONNX model and return mean-pooled,
+    L2-normalized float32 embeddings
+    """
+    feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+    variant = variant or MODEL_VARIANT
+    session = get_session(variant)
+    if "token_type_ids" in _session_inputs[variant]:
+        feeds["token_type_ids"] = np.zeros_like(input_ids)
 
     # ONNX forward pass
-    outputs = session.run(None, dict(inputs))
+    last_hidden = session.run(None, feeds)[0]  # shape (batch, seq, hidden)
 
-    # Mean pooling (last_hidden_state)
-    last_hidden = outputs[0]  # shape (batch, seq, hidden)
-    mask = inputs["attention_mask"][:, :, None]
-    mean_pooled = (last_hidden * mask).sum(1) / mask.sum(1)
+    # Mean pooling without materializing the (batch, seq, hidden) masked product
+    mask = attention_mask.astype(np.float32)
+    mean_pooled = np.einsum("bsh,bs->bh", last_hidden, mask) / mask.sum(1, keepdims=True)
 
     # Normalize
     norms = np.linalg.norm(mean_pooled, axis=1, keepdims=True)
-    embeddings = mean_pooled / norms
+    return (mean_pooled / norms).astype(np.float32)
+
+def pad_batch(token_ids):
+    """Right-pad a list of token id lists into (input_ids, attention_mask) arrays"""
+    seq_len = max(len(ids) for ids in token_ids)
+    input_ids = np.full((len(token_ids), seq_len), get_tokenizer().pad_token_id, dtype=np.int64)
+    attention_mask = np.zeros((len(token_ids), seq_len), dtype=np.int64)
+    for row, ids in enumerate(token_ids):
+        input_ids[row, :len(ids)] = ids
+        attention_mask[row, :len(ids)] = 1
+    return input_ids, attention_mask
+
+def tokenize(texts, max_length=MAX_SEQ_LENGTH):
+    """
+    Token ids per text (with [CLS]/[SEP]), unpadded. Sequences longer than
+    max_length keep their first tokens and the closing [SEP]; pass
+    max_length=None for the full sequence, e.g. to count tokens.
+    """
+    token_ids = get_tokenizer().encode(texts)
+    if max_length is None:
+        return token_ids
+    return [ids if len(ids) <= max_length else ids[:max_length - 1] + ids[-1:] for ids in token_ids]
+
+def count_tokens(texts):
+    """
+    Token count per text without the [CLS]/[SEP] markers. This is the
+    embedding model's WordPiece vocabulary, not the LLM's, so treat it as a
+    close estimate when budgeting prompts and leave some headroom.
+    """
+    return [max(len(ids) - 2, 0) for ids in tokenize(texts, max_length=None)]
+
+def embed_texts(texts, variant=None):
+    """
+    Generate embeddings for a list of texts, either with the in-process ONNX
+    model or, with EMBEDDING_BACKEND = "socket", via the shared embedding
+    server (see notes.embedding_server)
+    """
+    if EMBEDDING_BACKEND == "socket" and variant is None:
+        if not texts:
+            return np.array([])
+        return get_socket_client().embed(texts)
+    return embed_texts_local(texts, variant)
+
+def embed_texts_local(texts, variant=None):
+    """
+    Generate embeddings for a list of texts using the in-process ONNX model
+
+    Inputs are sorted by token length and run in buckets with bounded
+    padding, so one long summary no longer pads every short query to its
+    length. Results come back in the original order.
+    """
+    if not texts:
+        return np.array([])
+    
+    token_ids = tokenize(texts)
+    embeddings = np.empty((len(token_ids), EMBEDDING_DIM), dtype=np.float32)
+
+    for bucket in plan_buckets([len(ids) for ids in token_ids]):
+        input_ids, attention_mask = pad_batch([token_ids[i] for i in bucket])
+        embeddings[bucket] = run_model(input_ids, attention_mask, variant)
+
     return embeddings
 
+# Query embeddings from concurrent requests are coalesced into one batch
+# (see notes.embedding_worker); disable to call the session per request
+MICRO_BATCHING = getattr(settings, "EMBEDDING_MICRO_BATCHING", True)
+batcher = EmbeddingBatcher(
+    embed_texts,
+    max_batch_size=getattr(settings, "EMBEDDING_BATCH_MAX_SIZE", 32),
+    max_wait_ms=getattr(settings, "EMBEDDING_BATCH_MAX_WAIT_MS", 5),
+    timeout=getattr(settings, "EMBEDDING_BATCH_TIMEOUT", 10),
+)
+
+# Query vectors keyed by normalized text + model version (see notes.query_cache)
+query_cache = build_query_cache(EMBEDDING_MODEL_VERSION)
+
+def _embed_query_uncached(text):
+    if MICRO_BATCHING:
+        return batcher.embed([text])[0]
+    return embed_texts([text])[0]
+
+def embed_query(text):
+    """
+    Embed a single search query. Repeated queries are served from the query
+    cache; misses share a model call with other in-flight queries when
+    micro-batching is enabled
+    """
+    return query_cache.get_or_compute(text, _embed_query_uncached)
+
+def get_embedding_metrics():
+    """Per-process micro-batching and query cache counters"""
+    return {
+        "batcher": batcher.metrics(),
+        "query_cache": query_cache.metrics(),
+    }
+
 def calculate_cosine_similarity(embedding1, embedding2):
     """
     Calculate cosine similarity between two embeddings
     """
     return np.dot(embedding1, embedding2)
 
-def search_similar_notes(user, query_text, similarity_threshold=0.2):
+def embedding_to_bytes(embedding):
+    """
+    Pack a single embedding into compact float32 bytes for storage on the Note
+    """
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+def embedding_from_bytes(data):
+    """
+    Unpack float32 bytes stored on a Note back into a vector (no copy)
+    """
+    return np.frombuffer(data, dtype=np.float32)
+
+def has_current_embedding(note):
+    """
+    True if the note carries an embedding computed with the current model version
+    """
+    return bool(note.embedding) and note.embedding_model == EMBEDDING_MODEL_VERSION
+
+def embed_notes(notes):
+    """
+    Compute summary embeddings for the given notes in one batch and attach
+    them to the documents. Notes without a summary get their embedding cleared.
+    The caller is responsible for saving.
+    """
+    with_summary = [note for note in notes if note.summary]
+    for note in notes:
+        if not note.summary:
+            note.embedding = None
+            note.embedding_model = None
+
+    if not with_summary:
+        return notes
+
+    embeddings = embed_texts([note.summary for note in with_summary])
+    for note, embedding in zip(with_summary, embeddings):
+        note.embedding = embedding_to_bytes(embedding)
+        note.embedding_model = EMBEDDING_MODEL_VERSION
+
+    return notes
+
+def embed_note(note):
+    """
+    Compute and attach the summary embedding of a single note (does not save)
+    """
+    embed_notes([note])
+    return note
+
+def ensure_embeddings(notes):
+    """
+    Embed notes whose stored embedding is missing or from an older model
+    version, and write the new vectors back to Mongo and the embedding store
+    """
+    from .models import Note
+    from .embedding_store import store_note
+
+    stale_notes = [note for note in notes if note.summary and not has_current_embedding(note)]
+    if not stale_notes:
+        return notes
+
+    embed_notes(stale_notes)
+    for note in stale_notes:
+        Note.objects(id=note.id).update_one(
+            set__embedding=note.embedding,
+            set__embedding_model=note.embedding_model
+        )
+        store_note(note)
+    return notes
+
+# Fields the search endpoint serializes; everything else stays in Mongo
+SEARCH_RESULT_FIELDS = ('id', 'title', 'subject', 'summary', 'importance', 'created_at', 'keywords', 'tags')
+
+def search_similar_notes(user, query_text, limit=None, offset=0, min_score=None):
     """
     Search for notes with similar content based on semantic similarity
-    Returns ALL notes with relevance scores scaled to 100%
+
+    Scoring runs against the user's in-memory vector index (see
+    notes.vector_index), the on-disk embedding store when it is enabled
+    (notes.embedding_store), or their memory-mapped IVF index when one was
+    built (notes.ann_index); only the query is embedded per request, and only the
+    requested page of notes is loaded from Mongo, with a field projection.
     
     Args:
         user: User object
         query_text: Search query string
-        similarity_threshold: Not used anymore (kept for backward compatibility)
+        limit: Maximum number of notes to return (None for all)
+        offset: Number of ranked notes to skip
+        min_score: Minimum cosine similarity (0-1) a note needs to be returned
     
     Returns:
-        List of ALL notes with similarity scores (0-100%), sorted by relevance
+        (results, total) where results is a list of {'note', 'similarity'} dicts
+        with similarity scaled to 0-100%, sorted by relevance, and total is the
+        number of notes that passed min_score
     """
     from .models import Note
+    from .vector_index import get_user_index
+    from .ann_index import get_ann_index
+    from .embedding_store import get_store_index
     
-    # Get all notes for the user
-    notes = Note.objects(user=user)
-    
-    if not notes:
-        return []
+    index = get_ann_index(user)
+    if index is None:
+        index = get_store_index(user)
+    if index is None:
+        index = get_user_index(user)
+    if not len(index):
+        return [], 0
     
     # Generate query embedding
-    query_embedding = embed_texts([query_text])[0] 
-    
-    # Collect all summaries and note data
-    summaries = []
-    note_data = []
-    
-    for note in notes:
-        if note.summary:  # Only include notes with summaries
-            summaries.append(note.summary)
-            note_data.append(note)
-    
-    if not summaries:
-        return []
+    query_embedding = embed_query(query_text)
     
-    # Generate embeddings for all summaries
-    summary_embeddings = embed_texts(summaries)
+    ranked, total = index.search(query_embedding, k=limit, offset=offset, min_score=min_score)
+    if not ranked:
+        return [], total
     
-    # Calculate similarities for ALL notes and scale to 100%
-    results = []
-    for i, note in enumerate(note_data):
-        similarity = calculate_cosine_similarity(query_embedding, summary_embeddings[i])
-        
-        # Scale similarity to percentage (0-100%)
-        # Cosine similarity ranges from -1 to 1, but typically 0 to 1 for normalized embeddings
-        # We scale it to 0-100%
-        relevance_score = float(similarity * 100)
-        
-        results.append({
-            'note': note,
-            'similarity': relevance_score  # Now scaled to 0-100%
-        })
+    # Hydrate only the returned ids; notes deleted by another worker simply drop out
+    notes = Note.objects(id__in=[note_id for note_id, _ in ranked]).only(*SEARCH_RESULT_FIELDS)
+    notes_by_id = {str(note.id): note for note in notes}
     
-    # Sort by similarity (highest first)
-    results.sort(key=lambda x: x['similarity'], reverse=True)
+    # Scale similarity to percentage (0-100%)
+    # Cosine similarity ranges from -1 to 1, but typically 0 to 1 for normalized embeddings
+    results = [{
+        'note': notes_by_id[note_id],
+        'similarity': similarity * 100  # Now scaled to 0-100%
+    } for note_id, similarity in ranked if note_id in notes_by_id]
     
-    return results
\ No newline at end of file
+    return results, total
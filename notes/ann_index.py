@@ -0,0 +1,317 @@
+"""
+Approximate nearest-neighbour search (IVF) for users with very many notes.
+
+The brute-force UserVectorIndex scores every note per query; an inverted
+file index clusters the embeddings with spherical k-means and only scores
+the vectors in the `nprobe` clusters closest to the query:
+
+    index = IVFIndex.build(ids, vectors)
+    index.save(path)                  # centroids, list offsets, reordered vectors, ids
+    index = IVFIndex.load(path)       # np.load(mmap_mode="r"): no copy, pages shared between workers
+    results, total = index.search(query, k=10)
+
+Vectors are stored grouped by cluster, so each probed list is one contiguous
+slice of the memory-mapped matrix. Notes created after the build go to a
+small in-memory tail that is searched exactly; deleted notes are tombstoned
+in memory and appended to the index's deleted.ids, which every worker reads
+when it loads the index.
+`manage.py build_ann_index` (re)builds the per-user files under
+NOTES_ANN_DIR, and search_similar_notes uses them when NOTES_ANN_ENABLED is on.
+Loaded indexes are kept in a VectorIndexCache, so each worker re-reads the
+files (and the tail of notes saved elsewhere) after NOTES_VECTOR_INDEX_TTL.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from bson import ObjectId
+from django.conf import settings
+
+from .vector_index import OBJECT_ID_DTYPE, VectorIndexCache, top_k
+
+ANN_ENABLED = getattr(settings, "NOTES_ANN_ENABLED", False)
+ANN_DIR = getattr(settings, "NOTES_ANN_DIR", os.path.join(settings.BASE_DIR, "media", "ann_indexes"))
+# Users with fewer notes than this are served by the brute-force index
+ANN_MIN_VECTORS = getattr(settings, "NOTES_ANN_MIN_VECTORS", 20000)
+ANN_NPROBE = getattr(settings, "NOTES_ANN_NPROBE", 16)
+# Rows scored per matrix product while training/assigning (bounds temporary memory)
+ASSIGN_BATCH = 8192
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def assign(vectors, centroids):
+    """Index of the most similar centroid for each vector"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH):
+        labels[start:start + ASSIGN_BATCH] = np.argmax(vectors[start:start + ASSIGN_BATCH] @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(vectors, n_clusters, iterations=10, sample_size=None, seed=0):
+    """
+    Spherical k-means (cosine) on unit vectors. Trains on a random sample of
+    at most sample_size rows (default 64 per cluster) and returns unit centroids.
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = sample_size or n_clusters * 64
+    if len(vectors) > sample_size:
+        sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    else:
+        sample = np.asarray(vectors)
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        order = np.argsort(labels, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[order], starts[~empty])
+        # Re-seed empty clusters with random sample points
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """Inverted file index over unit-normalized float32 vectors"""
+
+    FILES = ("centroids", "offsets", "vectors", "ids")
+    DELETED_FILE = "deleted.ids"
+
+    def __init__(self, centroids, offsets, vectors, ids, meta=None):
+        self.centroids = centroids
+        self.offsets = offsets  # list i holds rows offsets[i]:offsets[i + 1]
+        self.vectors = vectors
+        self.ids = ids
+        self.meta = meta or {}
+        self.built_at = time.monotonic()
+        self._tail_ids = []
+        self._tail_vectors = np.empty((0, centroids.shape[1]), dtype=np.float32)
+        self._deleted = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, ids, vectors, n_lists=None, iterations=10, seed=0, meta=None):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        centroids = kmeans(vectors, n_lists, iterations=iterations, seed=seed)
+        labels = assign(vectors, centroids)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.searchsorted(labels[order], np.arange(n_lists + 1)).astype(np.int64)
+        ids = np.asarray(ids, dtype=OBJECT_ID_DTYPE)[order]
+        return cls(centroids, offsets, vectors[order], ids, meta)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map a saved index; nothing is read until lists are probed"""
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in cls.FILES}
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        index = cls(np.asarray(arrays["centroids"]), np.asarray(arrays["offsets"]),
+                    arrays["vectors"], arrays["ids"], meta)
+        index._deleted = read_deleted(path)
+        return index
+
+    def save(self, path):
+        """Write the index next to path and swap it in atomically"""
+        staging = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name in self.FILES:
+            np.save(os.path.join(staging, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+        with open(os.path.join(staging, self.DELETED_FILE), "w") as f:
+            f.writelines(f"{note_id}\n" for note_id in sorted(self._deleted))
+        previous = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, previous)
+        os.rename(staging, path)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @property
+    def nbytes(self):
+        # Counts the mapped matrix too: its pages stay resident while the index is searched
+        with self._lock:
+            tail = self._tail_vectors.nbytes
+        return self.centroids.nbytes + self.offsets.nbytes + self.vectors.nbytes + self.ids.nbytes + tail
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.ids) + len(self._tail_ids) - len(self._deleted)
+
+    def add(self, note_id, embedding):
+        """Record a note created after the build; it is searched exactly"""
+        with self._lock:
+            self._deleted.discard(str(note_id))
+            self._tail_ids.append(str(note_id))
+            self._tail_vectors = np.vstack([self._tail_vectors, np.asarray(embedding, dtype=np.float32)[None]])
+
+    def remove(self, note_id):
+        with self._lock:
+            self._deleted.add(str(note_id))
+
+    def search(self, query_embedding, k=None, offset=0, min_score=None, nprobe=None):
+        """
+        Score the vectors of the nprobe closest lists plus the tail and return
+        one page as (results, total). total only counts the probed candidates,
+        so it is a lower bound of the exact count.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        nprobe = min(nprobe or ANN_NPROBE, self.n_lists)
+        lists = top_k(self.centroids @ query, nprobe)
+
+        scores, ids = [], []
+        for list_id in lists:
+            start, end = int(self.offsets[list_id]), int(self.offsets[list_id + 1])
+            if start < end:
+                scores.append(self.vectors[start:end] @ query)
+                ids.append(self.ids[start:end])
+        with self._lock:
+            if self._tail_ids:
+                scores.append(self._tail_vectors @ query)
+                ids.append(np.asarray(self._tail_ids, dtype=OBJECT_ID_DTYPE))
+            deleted = set(self._deleted)
+        if not scores:
+            return [], 0
+        scores = np.concatenate(scores)
+        ids = np.concatenate(ids)
+
+        keep = np.ones(len(scores), dtype=bool)
+        if min_score is not None:
+            keep &= scores >= min_score
+        if deleted:
+            keep &= ~np.isin(ids, list(deleted))
+        candidates = np.flatnonzero(keep)
+        top = top_k(scores[candidates], k, offset)
+        return [(str(ids[candidates[i]]), float(scores[candidates[i]])) for i in top], len(candidates)
+
+
+class _StaleIndex:
+    """Cached in place of an index built with another model, so searches skip loading it until the TTL"""
+
+    nbytes = 0
+
+    def __init__(self):
+        self.built_at = time.monotonic()
+
+
+_loaded = VectorIndexCache()
+
+
+def ann_path(user_id):
+    return os.path.join(ANN_DIR, str(user_id))
+
+
+def read_deleted(path):
+    """Ids of the notes deleted since the index at path was built"""
+    try:
+        with open(os.path.join(path, IVFIndex.DELETED_FILE)) as f:
+            return {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def build_user_ann_index(user_id, n_lists=None):
+    """Build and save the IVF index of a user's current-model note embeddings"""
+    from .models import Note
+    from .allMiniLm_utils import EMBEDDING_DIM, EMBEDDING_MODEL_VERSION
+
+    started = datetime.now(timezone.utc)
+    notes = list(
+        Note.objects(user=ObjectId(user_id), embedding_model=EMBEDDING_MODEL_VERSION)
+        .only('id', 'embedding')
+        .as_pymongo()
+    )
+    if not notes:
+        return None
+    vectors = np.frombuffer(b''.join(note['embedding'] for note in notes), dtype=np.float32)
+    index = IVFIndex.build(
+        [str(note['_id']) for note in notes],
+        vectors.reshape(len(notes), EMBEDDING_DIM),
+        n_lists=n_lists,
+        meta={'model': EMBEDDING_MODEL_VERSION, 'built_at': started.isoformat(), 'count': len(notes)},
+    )
+    # Notes deleted while the build ran are in the old index's file; older entries are not in this build
+    path = ann_path(user_id)
+    index._deleted = read_deleted(path) & set(index.ids.tolist())
+    index.save(path)
+    _loaded.discard(str(user_id))
+    return index
+
+
+def get_ann_index(user):
+    """
+    The memory-mapped IVF index of a user, or None if ANN search is disabled,
+    no index was built for them, or it was built with another model.
+    Notes created since the build are loaded into the exact tail.
+    """
+    if not ANN_ENABLED:
+        return None
+    from .models import Note
+    from .allMiniLm_utils import EMBEDDING_MODEL_VERSION, embedding_from_bytes
+
+    user_id = str(getattr(user, 'id', user))
+    index = _loaded.get(user_id)
+    if index is not None:
+        return index if isinstance(index, IVFIndex) else None
+
+    # Not cached when missing, so an index built later is picked up on the next search
+    path = ann_path(user_id)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return None
+    index = IVFIndex.load(path)
+    if index.meta.get('model') != EMBEDDING_MODEL_VERSION:
+        _loaded.put(user_id, _StaleIndex())
+        return None
+
+    # ObjectIds carry their creation time
+    built_at = datetime.fromisoformat(index.meta['built_at'])
+    recent = Note.objects(
+        user=ObjectId(user_id),
+        embedding_model=EMBEDDING_MODEL_VERSION,
+        id__gte=ObjectId.from_datetime(built_at),
+    ).only('id', 'embedding')
+    recent = list(recent)
+    # ObjectId times have one-second resolution; skip notes the build already holds
+    known = np.isin(np.asarray([str(note.id) for note in recent], dtype=OBJECT_ID_DTYPE), index.ids)
+    for note, already_indexed in zip(recent, known):
+        if not already_indexed:
+            index.add(note.id, embedding_from_bytes(note.embedding))
+    return _loaded.put(user_id, index)
+
+
+def ann_index_note(note):
+    """Add a freshly saved note to its owner's ANN index if that index is loaded"""
+    from .allMiniLm_utils import embedding_from_bytes, has_current_embedding
+
+    index = _loaded.get(str(note.user.id))
+    if isinstance(index, IVFIndex) and has_current_embedding(note):
+        index.add(note.id, embedding_from_bytes(note.embedding))
+
+
+def ann_unindex_note(user_id, note_id):
+    """Tombstone a deleted note in the saved index of its owner and in the loaded one"""
+    path = ann_path(user_id)
+    if os.path.exists(os.path.join(path, "meta.json")):
+        # One short O_APPEND write, so concurrent deletes from other workers don't interleave
+        with open(os.path.join(path, IVFIndex.DELETED_FILE), "a") as f:
+            f.write(f"{note_id}\n")
+    index = _loaded.get(str(user_id))
+    if isinstance(index, IVFIndex):
+        index.remove(note_id)
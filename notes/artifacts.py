@@ -0,0 +1,171 @@
+"""
+Deduplication of identical PDF uploads.
+
+The same course PDF is uploaded by many students. The first upload runs the
+full pipeline; its extracted text, summary, explanation, tags, summary
+embedding and transcript chunk embeddings are then kept in a shared
+DocumentArtifact keyed by the sha256 of the PDF bytes. Later uploads with the
+same hash get their Note (and NoteChunks) copied from the artifact, with no
+extraction, LLM call or embedding.
+
+Notes record the hash in Note.content_hash and the artifact counts them:
+note_from_artifact/share_artifact increment the count, delete_note
+decrements it and the artifact is removed once no note refers to it.
+Notes own full copies of everything, so losing an artifact only costs the
+next upload a full run. `manage.py recount_document_artifacts` repairs counts
+that drifted (e.g. notes removed by a user cascade delete).
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+
+from tasks.dashboard import invalidate_dashboard
+from users.stats import record_change
+
+from .allMiniLm_utils import EMBEDDING_DIM, EMBEDDING_MODEL_VERSION
+from .lexical_index import index_note_terms
+from .models import DocumentArtifact, Note, NoteChunk
+from .vector_index import index_note, index_note_passages
+
+logger = logging.getLogger(__name__)
+
+DEDUP_ENABLED = getattr(settings, "NOTE_ARTIFACT_DEDUP", True)
+# Bytes read per hash update
+HASH_BLOCK = 1024 * 1024
+
+# Note fields copied to and from an artifact as they are
+SHARED_FIELDS = ('transcript', 'summary', 'explanation', 'categories', 'keywords',
+                 'importance', 'tags', 'embedding', 'embedding_model')
+
+
+def content_hash(pdf_file):
+    """sha256 hex digest of an upload or a stored file, read in HASH_BLOCK pieces"""
+    digest = hashlib.sha256()
+    if isinstance(pdf_file, str):
+        with open(pdf_file, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                digest.update(block)
+    else:
+        for block in pdf_file.chunks(HASH_BLOCK):
+            digest.update(block)
+        pdf_file.seek(0)
+    return digest.hexdigest()
+
+
+def note_from_artifact(user, digest, title, subject):
+    """
+    Create a user's note from the artifact of an identical upload. Returns
+    None if there is no artifact for the hash with the current embedding model.
+    """
+    artifact = DocumentArtifact.objects(content_hash=digest, embedding_model=EMBEDDING_MODEL_VERSION).modify(
+        new=True,
+        inc__refcount=1,
+        set__last_used_at=datetime.utcnow(),
+    )
+    if artifact is None:
+        return None
+
+    note = Note(user=user, title=title, subject=subject, content_hash=digest,
+                **{field: getattr(artifact, field) for field in SHARED_FIELDS})
+    try:
+        note.save()
+    except Exception:
+        release_artifact(digest)
+        raise
+    record_change(user.id, notes=1)
+    invalidate_dashboard(user.id)
+    index_note(note)
+    index_note_terms(note)
+    try:
+        _copy_chunks(note, artifact)
+    except Exception:
+        logger.exception("Copying passages of artifact %s to note %s failed", digest, note.id)
+    return note
+
+
+def _copy_chunks(note, artifact):
+    if not artifact.chunk_starts:
+        return 0
+    matrix = np.frombuffer(artifact.chunk_embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    documents = [NoteChunk(
+        user=note.user,
+        note=note,
+        position=position,
+        text=artifact.transcript[start:end],
+        start=start,
+        end=end,
+        tokens=tokens,
+        embedding=matrix[position].tobytes(),
+        embedding_model=artifact.embedding_model,
+    ) for position, (start, end, tokens) in enumerate(zip(artifact.chunk_starts, artifact.chunk_ends,
+                                                          artifact.chunk_tokens))]
+    chunk_ids = NoteChunk.objects.insert(documents, load_bulk=False)
+    index_note_passages(note.user.id, note.id, chunk_ids, matrix)
+    return len(documents)
+
+
+def share_artifact(note, pdf_file):
+    """
+    Store (or refresh) the artifact of a note freshly built from a PDF and
+    count the note as a reference. Failures are logged; the note is unaffected.
+    """
+    if not note.content_hash:
+        return
+    try:
+        size = os.path.getsize(pdf_file) if isinstance(pdf_file, str) else pdf_file.size
+        chunks = list(
+            NoteChunk.objects(note=note.id, embedding_model=EMBEDDING_MODEL_VERSION)
+            .order_by('position')
+            .only('start', 'end', 'tokens', 'embedding')
+            .as_pymongo()
+        )
+        # Overwrites the data of an existing artifact, so one left on an older
+        # embedding model is upgraded by the next full run
+        DocumentArtifact.objects(content_hash=note.content_hash).update_one(
+            upsert=True,
+            inc__refcount=1,
+            set__size=size,
+            set__chunk_starts=[chunk['start'] for chunk in chunks],
+            set__chunk_ends=[chunk['end'] for chunk in chunks],
+            set__chunk_tokens=[chunk['tokens'] for chunk in chunks],
+            set__chunk_embeddings=b''.join(chunk['embedding'] for chunk in chunks),
+            set__last_used_at=datetime.utcnow(),
+            set_on_insert__created_at=datetime.utcnow(),
+            **{f"set__{field}": getattr(note, field) for field in SHARED_FIELDS},
+        )
+    except Exception:
+        logger.exception("Storing the artifact of note %s failed", note.id)
+
+
+def release_artifact(digest):
+    """Drop a note's reference; the artifact is deleted with its last reference"""
+    if not digest:
+        return
+    DocumentArtifact.objects(content_hash=digest).update_one(dec__refcount=1)
+    # Conditional delete: an upload that took a reference meanwhile keeps it alive
+    DocumentArtifact.objects(content_hash=digest, refcount__lte=0).delete()
+
+
+def recount_artifacts():
+    """
+    Reset every artifact's count to the number of notes with its hash and
+    delete unreferenced ones. Returns (artifacts kept, artifacts deleted).
+    """
+    counts = {
+        row['_id']: row['notes'] for row in Note.objects(content_hash__ne=None).aggregate(
+            {'$group': {'_id': '$content_hash', 'notes': {'$sum': 1}}},
+        )
+    }
+    kept = deleted = 0
+    for digest in DocumentArtifact.objects.scalar('content_hash'):
+        refs = counts.get(digest, 0)
+        DocumentArtifact.objects(content_hash=digest).update_one(set__refcount=refs)
+        if refs:
+            kept += 1
+        else:
+            deleted += DocumentArtifact.objects(content_hash=digest, refcount__lte=0).delete() or 0
+    return kept, deleted
@@ -0,0 +1,137 @@
+"""
+Sentence-aware, token-budgeted chunking.
+
+    for chunk in iter_chunks(text, max_tokens=256, overlap_tokens=32):
+        chunk.text, chunk.start, chunk.end, chunk.tokens
+
+Sentences are found with a single regex pass, token counts come from the
+MiniLM tokenizer (in batches, so large documents are not tokenized in one
+go) and chunks are slices of the original text, so `text[chunk.start:chunk.end]
+== chunk.text` always holds. Everything is a generator; callers that only
+need the first few chunks never segment the rest of the document.
+"""
+import re
+from collections import deque
+from typing import NamedTuple
+
+from django.conf import settings
+
+from .allMiniLm_utils import count_tokens
+
+CHUNK_TOKENS = getattr(settings, "NOTE_CHUNK_TOKENS", 256)
+CHUNK_OVERLAP_TOKENS = getattr(settings, "NOTE_CHUNK_OVERLAP_TOKENS", 32)
+# Sentences tokenized per tokenizer call
+TOKENIZE_BATCH = 256
+
+# End of sentence: terminal punctuation (plus closing quotes/brackets) followed
+# by whitespace, or a blank line (headings, list items, PDF paragraphs)
+_BOUNDARY = re.compile(r"""([.!?]["')\]]*)\s+|\n\s*\n""")
+_WORD = re.compile(r"\S+")
+_ABBREVIATIONS = {
+    "e.g", "i.e", "etc", "vs", "cf", "al", "fig", "eq", "no", "vol", "pp", "ch",
+    "dr", "mr", "mrs", "ms", "prof", "st", "jr", "sr",
+}
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int
+    end: int
+    tokens: int
+
+
+def _is_abbreviation(text, end):
+    """True if the period ending text[:end] belongs to an abbreviation or initial"""
+    word_start = max(text.rfind(" ", 0, end), text.rfind("\n", 0, end)) + 1
+    word = text[word_start:end].rstrip(".").lower()
+    return (len(word) == 1 and word.isalpha()) or word in _ABBREVIATIONS
+
+
+def iter_sentences(text):
+    """Yield (start, end) spans of sentences in text, whitespace trimmed"""
+    start = 0
+    for match in _BOUNDARY.finditer(text):
+        end = match.end(1) if match.group(1) else match.start()
+        if match.group(1) == "." and _is_abbreviation(text, end):
+            continue
+        span = _trim(text, start, end)
+        if span:
+            yield span
+        start = match.end()
+    span = _trim(text, start, len(text))
+    if span:
+        yield span
+
+
+def _trim(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if start < end else None
+
+
+def _counted(text, spans):
+    """(start, end, tokens) for each span, tokenizing TOKENIZE_BATCH spans at a time"""
+    batch = []
+    for span in spans:
+        batch.append(span)
+        if len(batch) >= TOKENIZE_BATCH:
+            yield from _count_batch(text, batch)
+            batch = []
+    if batch:
+        yield from _count_batch(text, batch)
+
+
+def _count_batch(text, batch):
+    counts = count_tokens([text[start:end] for start, end in batch])
+    for (start, end), tokens in zip(batch, counts):
+        yield start, end, tokens
+
+
+def _split_long(text, start, end, max_tokens):
+    """Break a sentence longer than max_tokens at word boundaries"""
+    words = ((match.start(), match.end()) for match in _WORD.finditer(text, start, end))
+    piece_start, piece_tokens, piece_end = None, 0, None
+    for word_start, word_end, tokens in _counted(text, words):
+        if piece_start is not None and piece_tokens + tokens > max_tokens:
+            yield piece_start, piece_end, piece_tokens
+            piece_start, piece_tokens = None, 0
+        if piece_start is None:
+            piece_start = word_start
+        piece_end = word_end
+        piece_tokens += tokens
+    if piece_start is not None:
+        yield piece_start, piece_end, piece_tokens
+
+
+def iter_chunks(text, max_tokens=None, overlap_tokens=None):
+    """
+    Yield Chunks of whole sentences holding at most max_tokens tokens each
+    (sentences longer than that are split at word boundaries). Consecutive
+    chunks share up to overlap_tokens tokens of trailing sentences.
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+
+    window = deque()  # (start, end, tokens) of the sentences in the current chunk
+    window_tokens = 0
+    fresh = False  # window holds sentences not yet emitted
+
+    for start, end, tokens in _counted(text, iter_sentences(text)):
+        pieces = _split_long(text, start, end, max_tokens) if tokens > max_tokens else [(start, end, tokens)]
+        for piece in pieces:
+            if window and window_tokens + piece[2] > max_tokens:
+                if fresh:
+                    yield Chunk(text[window[0][0]:window[-1][1]], window[0][0], window[-1][1], window_tokens)
+                    fresh = False
+                # Keep the trailing sentences that fit in the overlap (and leave room for this one)
+                while window and (window_tokens > overlap_tokens or window_tokens + piece[2] > max_tokens):
+                    window_tokens -= window.popleft()[2]
+            window.append(piece)
+            window_tokens += piece[2]
+            fresh = True
+
+    if fresh:
+        yield Chunk(text[window[0][0]:window[-1][1]], window[0][0], window[-1][1], window_tokens)
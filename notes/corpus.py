@@ -0,0 +1,11 @@
+"""The fixture corpus the embedding, PDF extraction and ingestion benchmarks run on"""
+import json
+import os
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'embedding_corpus.json')
+
+
+def load_embedding_corpus(path=None):
+    """The "queries", "summaries" and "passages" lists of the fixture corpus (or of the JSON file at path)"""
+    with open(path or CORPUS_PATH) as f:
+        return json.load(f)
@@ -0,0 +1,141 @@
+"""
+Shared embedding process for multi-worker deployments.
+
+With EMBEDDING_BACKEND = "socket", Django workers do not load the ONNX model
+at all. A single `manage.py run_embedding_server` process owns the session
+and tokenizer, and workers send it texts over a Unix domain socket, so model
+RAM is paid once instead of once per uvicorn/gunicorn worker.
+
+Wire format (all integers big-endian uint32):
+    request:  count, then count x (length, UTF-8 bytes)
+    response: status, rows, dim, then rows * dim little-endian float32
+              (status 1 carries length + UTF-8 error message instead)
+Vectors are received straight into a NumPy buffer - no pickling.
+"""
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+
+HEADER = struct.Struct("!I")
+RESPONSE_HEADER = struct.Struct("!III")
+STATUS_OK = 0
+STATUS_ERROR = 1
+FLOAT32 = np.dtype("<f4")
+
+
+class EmbeddingServerError(Exception):
+    pass
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    _recv_into(sock, memoryview(buffer))
+    return bytes(buffer)
+
+
+def _recv_into(sock, view):
+    received = 0
+    while received < len(view):
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Embedding server connection closed")
+        received += count
+
+
+def _encode_texts(texts):
+    parts = [HEADER.pack(len(texts))]
+    for text in texts:
+        data = text.encode("utf-8")
+        parts.append(HEADER.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    """Serves requests on one persistent client connection until it closes"""
+
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                (count,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+            except ConnectionError:
+                return
+            texts = []
+            for _ in range(count):
+                (length,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+                texts.append(_recv_exact(sock, length).decode("utf-8"))
+
+            try:
+                embeddings = np.ascontiguousarray(self.server.embed_fn(texts), dtype=FLOAT32)
+                rows, dim = embeddings.shape if len(texts) else (0, 0)
+                sock.sendall(RESPONSE_HEADER.pack(STATUS_OK, rows, dim) + embeddings.tobytes())
+            except Exception as e:
+                message = str(e).encode("utf-8")
+                sock.sendall(RESPONSE_HEADER.pack(STATUS_ERROR, 0, 0) + HEADER.pack(len(message)) + message)
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, embed_fn):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.embed_fn = embed_fn
+        super().__init__(path, EmbeddingRequestHandler)
+        os.chmod(path, 0o660)
+
+
+class SocketEmbeddingClient:
+    """Per-thread persistent connections to the embedding server"""
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None or getattr(self._local, "pid", None) != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._local.sock = sock
+            self._local.pid = os.getpid()
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def embed(self, texts):
+        texts = list(texts)
+        request = _encode_texts(texts)
+        # One retry covers a server restart breaking an idle connection
+        for attempt in range(2):
+            try:
+                return self._request(request)
+            except (ConnectionError, OSError):
+                self._close()
+                if attempt:
+                    raise
+
+    def _request(self, request):
+        sock = self._connection()
+        sock.sendall(request)
+        status, rows, dim = RESPONSE_HEADER.unpack(_recv_exact(sock, RESPONSE_HEADER.size))
+        if status != STATUS_OK:
+            (length,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+            raise EmbeddingServerError(_recv_exact(sock, length).decode("utf-8"))
+
+        embeddings = np.empty((rows, dim), dtype=FLOAT32)
+        if embeddings.size == 0:
+            return embeddings
+        _recv_into(sock, memoryview(embeddings).cast("B"))
+        return embeddings.astype(np.float32, copy=False)
@@ -0,0 +1,380 @@
+"""
+Memory-mapped on-disk store of note embeddings, one directory per model version.
+
+Building a user's index from Mongo deserializes every note's embedding
+through MongoEngine. The store keeps the same vectors in flat files that
+every worker process maps into memory:
+
+    vectors.<gen>.bin      fixed-width rows of `dim` float32 (or float16) values
+    records.<gen>.bin      24 bytes per row: note ObjectId + user ObjectId
+    tombstones.<gen>.bin   one bit per row, set when the note is deleted
+    meta.json              dim, dtype and the current generation
+
+Ingestion appends (a re-embedded note tombstones its old row), delete_note
+sets the note's bit, and `manage.py compact_embedding_store` writes the live
+rows as the next generation's files, then points meta.json at them. Writers
+serialize on an flock; readers notice appends, deletes and compactions from
+other processes when they touch the store, and never mix files of two
+generations. Search scores a user's live rows straight from the mapping.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from bson import ObjectId
+from django.conf import settings
+
+from .vector_index import INDEX_TTL_SECONDS, top_k
+
+STORE_ENABLED = getattr(settings, "NOTES_EMBEDDING_STORE_ENABLED", False)
+STORE_DIR = getattr(settings, "NOTES_EMBEDDING_STORE_DIR", os.path.join(settings.BASE_DIR, "media", "embedding_store"))
+STORE_DTYPE = getattr(settings, "NOTES_EMBEDDING_STORE_DTYPE", "float32")
+
+FILES = ("vectors", "records", "tombstones")
+# Raw 12-byte fields: "S12" would strip the trailing NUL bytes some ObjectIds end with
+RECORD_DTYPE = np.dtype([("note", "V12"), ("user", "V12")])
+# Tombstone file growth step (bytes, i.e. 8 rows each)
+TOMBSTONE_CHUNK = 64 * 1024
+
+
+class EmbeddingStore:
+    """Append-only embedding file set for one model version"""
+
+    def __init__(self, path, dim, dtype=STORE_DTYPE):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        meta_path = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_path):
+            with self._writing():
+                if not os.path.exists(meta_path):
+                    self._write_meta(path, {"dim": dim, "dtype": dtype, "generation": 0})
+        self._generation = None
+        self._rows = 0
+        self._tombstones_size = 0
+        self._refresh()
+
+    # -- files ---------------------------------------------------------------
+
+    def _file(self, name, generation=None):
+        """Data file of a generation (default: the mapped one)"""
+        generation = self._generation if generation is None else generation
+        return os.path.join(self.path, f"{name}.{generation}.bin")
+
+    def _size(self, name, generation):
+        path = self._file(name, generation)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _read_meta(self):
+        with open(os.path.join(self.path, "meta.json")) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_meta(path, meta):
+        staging = os.path.join(path, "meta.json.tmp")
+        with open(staging, "w") as f:
+            json.dump(meta, f)
+        os.replace(staging, os.path.join(path, "meta.json"))
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive across threads and processes"""
+        with self._lock, open(os.path.join(self.path, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_at(self, name, data, offset):
+        # Not O_APPEND: Linux pwrite ignores the offset on append-mode files
+        fd = os.open(self._file(name), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+
+    def _map(self, name, generation, dtype, shape=None):
+        path = self._file(name, generation)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty(shape or (0,), dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def _refresh(self):
+        """Re-map the files if another process appended, deleted or compacted"""
+        with self._lock:
+            while True:
+                meta = self._read_meta()
+                try:
+                    self._load(meta)
+                except FileNotFoundError:
+                    pass  # a compaction removed this generation's files while we read them
+                else:
+                    # Mapped the generation meta.json still points at: done
+                    if self._read_meta()["generation"] == self._generation:
+                        return
+
+    def _load(self, meta):
+        generation = meta["generation"]
+        rows = self._size("records", generation) // RECORD_DTYPE.itemsize
+        tombstones_size = self._size("tombstones", generation)
+        if generation == self._generation and rows == self._rows and tombstones_size == self._tombstones_size:
+            return
+
+        self.dim = meta["dim"]
+        self.dtype = np.dtype(meta["dtype"])
+        self.row_bytes = self.dim * self.dtype.itemsize
+        compacted = generation != self._generation
+        first_new = 0 if compacted else self._rows
+
+        vectors = self._map("vectors", generation, self.dtype, (rows, self.dim) if rows else (0, self.dim))
+        records = self._map("records", generation, RECORD_DTYPE, (rows,) if rows else None)
+        tombstones = self._map("tombstones", generation, np.uint8)
+        self.vectors, self.records, self.tombstones = vectors, records, tombstones
+        self._tombstones_size = tombstones_size
+
+        if compacted:
+            self._note_rows = {}
+            self._user_rows = {}
+        self._index_rows(first_new, rows)
+        self._generation = generation
+        self._rows = rows
+
+    def _index_rows(self, start, end):
+        """Extend the note id -> row and user -> rows maps with rows [start, end)"""
+        if start >= end:
+            return
+        records = self.records[start:end]
+        for offset, note in enumerate(records["note"].tolist()):
+            self._note_rows[note] = start + offset
+        users = records["user"]
+        order = np.argsort(users, kind="stable")
+        unique, first = np.unique(users[order], return_index=True)
+        for user, rows in zip(unique.tolist(), np.split(order + start, first[1:])):
+            existing = self._user_rows.get(user)
+            self._user_rows[user] = rows if existing is None else np.concatenate([existing, rows])
+
+    # -- writes --------------------------------------------------------------
+
+    def append(self, note_id, user_id, embedding):
+        """Store a note's vector, tombstoning any earlier row for the note"""
+        vector = np.asarray(embedding, dtype=self.dtype).reshape(self.dim)
+        record = np.array([(ObjectId(str(note_id)).binary, ObjectId(str(user_id)).binary)], dtype=RECORD_DTYPE)
+        with self._writing():
+            self._refresh()
+            self._delete_rows(self._note_rows.get(ObjectId(str(note_id)).binary))
+            row = self._rows
+            # Positional writes: a crash between the two leaves a stray vector
+            # that the next append simply overwrites
+            self._write_at("vectors", vector.tobytes(), row * self.row_bytes)
+            self._ensure_tombstone_capacity(row + 1)
+            self._write_at("records", record.tobytes(), row * RECORD_DTYPE.itemsize)
+            self._refresh()
+        return row
+
+    def extend(self, note_ids, user_ids, matrix):
+        """Bulk append, e.g. when (re)loading the store from Mongo"""
+        matrix = np.ascontiguousarray(matrix, dtype=self.dtype).reshape(-1, self.dim)
+        records = np.array([(ObjectId(str(note_id)).binary, ObjectId(str(user_id)).binary)
+                            for note_id, user_id in zip(note_ids, user_ids)], dtype=RECORD_DTYPE)
+        with self._writing():
+            self._refresh()
+            for note in records["note"].tolist():
+                self._delete_rows(self._note_rows.get(note))
+            row = self._rows
+            self._write_at("vectors", matrix.tobytes(), row * self.row_bytes)
+            self._ensure_tombstone_capacity(row + len(records))
+            self._write_at("records", records.tobytes(), row * RECORD_DTYPE.itemsize)
+            self._refresh()
+
+    def clear(self):
+        """Drop every row (starts a new generation)"""
+        with self._writing():
+            self._refresh()
+            self._switch_generation(self._generation + 1)
+
+    def delete(self, note_id):
+        """Tombstone a note's row; False if the store does not hold it"""
+        with self._writing():
+            self._refresh()
+            row = self._note_rows.get(ObjectId(str(note_id)).binary)
+            if row is None:
+                return False
+            self._delete_rows(row)
+            self._refresh()
+            return True
+
+    def _delete_rows(self, row):
+        if row is None:
+            return
+        with open(self._file("tombstones"), "r+b") as f:
+            f.seek(row >> 3)
+            current = f.read(1)[0]
+            f.seek(row >> 3)
+            f.write(bytes([current | (1 << (row & 7))]))
+
+    def _ensure_tombstone_capacity(self, rows):
+        path = self._file("tombstones")
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        needed = (rows + 7) >> 3
+        if needed > size:
+            with open(path, "ab") as f:
+                f.truncate(((needed // TOMBSTONE_CHUNK) + 1) * TOMBSTONE_CHUNK)
+
+    def compact(self):
+        """Rewrite the files without dead rows; returns (rows kept, rows dropped)"""
+        with self._writing():
+            self._refresh()
+            live = np.flatnonzero(~self._dead(np.arange(self._rows)))
+            # Group rows by user so each user's vectors become one contiguous run
+            live = live[np.argsort(self.records["user"][live], kind="stable")]
+            generation = self._generation + 1
+            with open(self._file("vectors", generation), "wb") as f:
+                for start in range(0, len(live), 65536):
+                    f.write(np.ascontiguousarray(self.vectors[live[start:start + 65536]]).tobytes())
+            self.records[live].tofile(self._file("records", generation))
+            np.zeros(((len(live) // (TOMBSTONE_CHUNK * 8)) + 1) * TOMBSTONE_CHUNK, dtype=np.uint8).tofile(
+                self._file("tombstones", generation))
+            dropped = self._rows - len(live)
+            self._switch_generation(generation)
+            return len(live), dropped
+
+    def _switch_generation(self, generation):
+        """
+        Point meta.json at a generation whose files are fully written, then
+        remove the previous generation's files. Readers still mapping them
+        keep their mappings; the next _refresh moves them to the new files.
+        """
+        previous = self._generation
+        self._write_meta(self.path, {"dim": self.dim, "dtype": self.dtype.name, "generation": generation})
+        self._refresh()
+        for name in FILES:
+            if os.path.exists(self._file(name, previous)):
+                os.remove(self._file(name, previous))
+
+    # -- reads ---------------------------------------------------------------
+
+    def _dead(self, rows):
+        if not len(self.tombstones):
+            return np.zeros(len(rows), dtype=bool)
+        return ((self.tombstones[rows >> 3] >> (rows & 7).astype(np.uint8)) & 1).astype(bool)
+
+    def __len__(self):
+        self._refresh()
+        return self._rows
+
+    def live_count(self):
+        self._refresh()
+        return int(self._rows - self._dead(np.arange(self._rows)).sum())
+
+    def user_rows(self, user_id):
+        """Live rows of a user"""
+        self._refresh()
+        rows = self._user_rows.get(ObjectId(str(user_id)).binary)
+        if rows is None:
+            return np.empty(0, dtype=np.int64)
+        return rows[~self._dead(rows)]
+
+    def search(self, user_id, query_embedding, k=None, offset=0, min_score=None):
+        """Same contract as UserVectorIndex.search, over a user's rows in the mapping"""
+        # Rows and the mappings they index into, taken together; scoring runs
+        # unlocked, and a concurrent refresh only rebinds the attributes
+        with self._lock:
+            rows = self.user_rows(user_id)
+            vectors, records = self.vectors, self.records
+        if not len(rows):
+            return [], 0
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if rows[-1] - rows[0] + 1 == len(rows):
+            # Compacted users: a slice of the mapping, no gather copy
+            rows = slice(int(rows[0]), int(rows[-1]) + 1)
+        scores = vectors[rows].astype(np.float32, copy=False) @ query
+        notes = records["note"][rows]
+
+        candidates = np.arange(len(scores))
+        if min_score is not None:
+            candidates = np.flatnonzero(scores >= min_score)
+        top = top_k(scores[candidates], k, offset)
+        return [(str(ObjectId(bytes(notes[candidates[i]]))), float(scores[candidates[i]])) for i in top], len(candidates)
+
+
+class StoreUserIndex:
+    """Adapter giving search_similar_notes one user's view of the store"""
+
+    def __init__(self, store, user_id):
+        self.store = store
+        self.user_id = user_id
+
+    def __len__(self):
+        return len(self.store.user_rows(self.user_id))
+
+    def search(self, query_embedding, k=None, offset=0, min_score=None):
+        return self.store.search(self.user_id, query_embedding, k=k, offset=offset, min_score=min_score)
+
+
+_store = None
+_store_lock = threading.Lock()
+# user id -> (monotonic time, summarized notes in Mongo), see get_store_index
+_note_counts = {}
+
+
+def get_store():
+    """The store for the current embedding model version, or None if disabled"""
+    global _store
+    if not STORE_ENABLED:
+        return None
+    if _store is None:
+        from .allMiniLm_utils import EMBEDDING_DIM, EMBEDDING_MODEL_VERSION
+        with _store_lock:
+            if _store is None:
+                _store = EmbeddingStore(os.path.join(STORE_DIR, EMBEDDING_MODEL_VERSION), EMBEDDING_DIM)
+    return _store
+
+
+def get_store_index(user):
+    """
+    The store's view of a user, or None (search builds the index from Mongo)
+    if the store is disabled or holds fewer vectors than the user has
+    summarized notes, e.g. notes created before the store was enabled or
+    before a model switch, until `compact_embedding_store --rebuild`.
+    """
+    from .models import Note
+
+    store = get_store()
+    if store is None:
+        return None
+    user_id = str(getattr(user, 'id', user))
+    # Counted at most once per NOTES_VECTOR_INDEX_TTL; notes saved since are in the store too
+    counted = _note_counts.get(user_id)
+    if counted is None or time.monotonic() - counted[0] > INDEX_TTL_SECONDS:
+        counted = (time.monotonic(), Note.objects(user=ObjectId(user_id), summary__nin=[None, '']).count())
+        _note_counts[user_id] = counted
+    index = StoreUserIndex(store, user_id)
+    if len(index) < counted[1]:
+        return None
+    return index
+
+
+def store_note(note):
+    """Append a freshly saved note's embedding to the store"""
+    from .allMiniLm_utils import embedding_from_bytes, has_current_embedding
+
+    store = get_store()
+    if store is None:
+        return
+    if has_current_embedding(note):
+        # note.user is an ObjectId when the queryset used no_dereference()
+        store.append(note.id, getattr(note.user, 'id', note.user), embedding_from_bytes(note.embedding))
+    else:
+        store.delete(note.id)
+
+
+def unstore_note(note_id, user_id=None):
+    store = get_store()
+    if store is not None and store.delete(note_id) and user_id is not None:
+        # The cached count still includes the note; recount on the next search
+        _note_counts.pop(str(user_id), None)
@@ -0,0 +1,169 @@
+"""
+Dynamic micro-batching for the ONNX embedding session.
+
+Request threads submit texts and get a Future back. A single worker thread
+takes everything already queued and, if that is more than one request,
+keeps collecting for up to `max_wait_ms` (or until `max_batch_size` texts
+are queued); it then runs them through the model as one padded batch and
+resolves each Future with its own rows. A request that finds the queue
+empty runs straight away. Under concurrent search load this replaces many
+tiny `session.run` calls competing for the CPU with a few larger ones:
+requests arriving while a batch runs queue up and form the next one.
+
+`embed` waits at most `timeout` seconds for the worker; past that (a dead
+or stuck worker) the request is withdrawn and run in the calling thread,
+and a dead worker is restarted by the next submit.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    __slots__ = ('texts', 'future', 'enqueued_at')
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """Collects embedding requests from many threads into batched model calls"""
+
+    def __init__(self, embed_fn, max_batch_size=32, max_wait_ms=5, timeout=10, log_every=500):
+        self.embed_fn = embed_fn
+        self.timeout = timeout
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+        self.log_every = log_every
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        with self._metrics_lock:
+            self._batches = 0
+            self._texts = 0
+            self._requests = 0
+            self._max_batch = 0
+            self._queue_wait_total = 0.0
+            self._queue_wait_max = 0.0
+            self._run_time_total = 0.0
+
+    def _ensure_started(self):
+        # The worker thread does not survive a fork, so restart it per process
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, texts):
+        """Queue texts for embedding; the Future resolves to their (n, dim) array"""
+        self._ensure_started()
+        request = _Request(list(texts))
+        self._queue.put(request)
+        return request.future
+
+    def embed(self, texts, timeout=None):
+        """Embed texts through the worker, or in this thread if it has not answered within timeout"""
+        future = self.submit(texts)
+        try:
+            return future.result(timeout or self.timeout)
+        except FutureTimeoutError:
+            logger.warning("Embedding batcher did not answer within %ss (worker alive: %s); embedding inline",
+                           timeout or self.timeout, self._thread.is_alive())
+            # Withdrawn unless the worker already picked it up, then its result is dropped
+            future.cancel()
+            return self.embed_fn(texts)
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        count = len(first.texts)
+        deadline = first.enqueued_at + self.max_wait
+
+        while count < self.max_batch_size:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                # Only wait while a batch is forming; a lone request is not delayed
+                remaining = deadline - time.perf_counter()
+                if len(batch) == 1 or remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(request)
+            count += len(request.texts)
+
+        return batch
+
+    def _run(self):
+        while True:
+            # Requests whose caller gave up waiting were cancelled
+            batch = [request for request in self._collect() if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            texts = [text for request in batch for text in request.texts]
+
+            try:
+                embeddings = self.embed_fn(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            row = 0
+            for request in batch:
+                request.future.set_result(embeddings[row:row + len(request.texts)])
+                row += len(request.texts)
+
+            self._record(batch, len(texts), started, time.perf_counter())
+
+    def _record(self, batch, batch_size, started, finished):
+        waits = [started - request.enqueued_at for request in batch]
+        with self._metrics_lock:
+            self._batches += 1
+            self._texts += batch_size
+            self._requests += len(batch)
+            self._max_batch = max(self._max_batch, batch_size)
+            self._queue_wait_total += sum(waits)
+            self._queue_wait_max = max(self._queue_wait_max, max(waits))
+            self._run_time_total += finished - started
+            should_log = self.log_every and self._batches % self.log_every == 0
+
+        if should_log:
+            logger.info("Embedding batcher: %s", self.metrics())
+
+    def metrics(self):
+        """Snapshot of batch-size and queue-wait statistics for this process"""
+        with self._metrics_lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                'batches': self._batches,
+                'requests': self._requests,
+                'texts': self._texts,
+                'mean_batch_size': self._texts / batches,
+                'max_batch_size': self._max_batch,
+                'mean_queue_wait_ms': self._queue_wait_total / requests * 1000,
+                'max_queue_wait_ms': self._queue_wait_max * 1000,
+                'mean_run_ms': self._run_time_total / batches * 1000,
+                'queue_depth': self._queue.qsize(),
+            }
@@ -0,0 +1,104 @@
+"""
+Lexical (BM25) and hybrid note search.
+
+Hybrid search takes the top RRF_DEPTH notes of the BM25 ranking
+(notes.lexical_index) and of the cosine ranking (notes.vector_index) and
+fuses them with reciprocal rank fusion: a note scores sum(1 / (RRF_K + rank))
+over the rankings it appears in. Ranks rather than raw scores are fused, so
+unbounded BM25 scores and 0-1 cosines need no calibration against each other.
+"""
+from django.conf import settings
+
+from .allMiniLm_utils import SEARCH_RESULT_FIELDS, embed_query
+from .embedding_store import get_store_index
+from .lexical_index import get_lexical_index
+from .models import Note
+from .vector_index import get_user_index
+
+RRF_K = getattr(settings, "NOTES_SEARCH_RRF_K", 60)
+# Notes taken from each ranking before fusing
+RRF_DEPTH = getattr(settings, "NOTES_SEARCH_RRF_DEPTH", 100)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse ranked id lists into [(id, fused_score)], best first. Ties keep the
+    order in which ids were first seen.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+def _hydrate(note_ids):
+    notes = Note.objects(id__in=note_ids).only(*SEARCH_RESULT_FIELDS)
+    return {str(note.id): note for note in notes}
+
+
+def search_lexical_notes(user, query_text, limit=None, offset=0):
+    """
+    BM25 search over title, keywords, tags and transcript
+
+    Returns:
+        (results, total) where results is a list of {'note', 'similarity'}
+        dicts with the BM25 score as similarity, best first, and total is the
+        number of notes matching any term
+    """
+    ranked, total = get_lexical_index(user).search(query_text, k=limit, offset=offset)
+    notes_by_id = _hydrate([note_id for note_id, _ in ranked])
+    results = [{
+        'note': notes_by_id[note_id],
+        'similarity': score,
+    } for note_id, score in ranked if note_id in notes_by_id]
+    return results, total
+
+
+def search_hybrid_notes(user, query_text, limit=None, offset=0, min_score=None):
+    """
+    Reciprocal rank fusion of BM25 and summary-embedding rankings. min_score
+    applies to the cosine similarity of the vector candidates only.
+
+    Returns:
+        (results, total) where results is a list of dicts with 'note',
+        'similarity' (fused score as 0-100% of the best possible, i.e. first
+        in both rankings), 'vector_similarity' (0-100%, None if not a vector
+        candidate) and 'lexical_score' (None if no term matched), best first,
+        and total is the number of fused candidates
+    """
+    depth = max(RRF_DEPTH, offset + (limit or RRF_DEPTH))
+
+    lexical, _ = get_lexical_index(user).search(query_text, k=depth)
+    vector_index = get_store_index(user)
+    if vector_index is None:
+        vector_index = get_user_index(user)
+    vector = []
+    if len(vector_index):
+        vector, _ = vector_index.search(embed_query(query_text), k=depth, min_score=min_score)
+
+    fused = reciprocal_rank_fusion([
+        [note_id for note_id, _ in vector],
+        [note_id for note_id, _ in lexical],
+    ])
+    total = len(fused)
+    page = fused[offset:offset + limit] if limit is not None else fused[offset:]
+    if not page:
+        return [], total
+
+    vector_scores = dict(vector)
+    lexical_scores = dict(lexical)
+    best_possible = 2.0 / (RRF_K + 1)
+    notes_by_id = _hydrate([note_id for note_id, _ in page])
+    results = []
+    for note_id, score in page:
+        if note_id not in notes_by_id:
+            continue
+        cosine = vector_scores.get(note_id)
+        results.append({
+            'note': notes_by_id[note_id],
+            'similarity': score / best_possible * 100,
+            'vector_similarity': cosine * 100 if cosine is not None else None,
+            'lexical_score': lexical_scores.get(note_id),
+        })
+    return results, total
@@ -0,0 +1,228 @@
+"""
+Background ingestion of uploaded PDFs.
+
+`create_note_from_pdf` stores the upload on disk, records a NoteJob in Mongo
+and returns 202 straight away; extraction, summarization, tagging and
+embedding then run off the request path. The queue is the `note_jobs`
+collection itself - no external broker:
+
+- NOTE_JOB_MODE = "thread" (default) runs jobs on a small thread pool inside
+  the web process that accepted the upload.
+- NOTE_JOB_MODE = "worker" only enqueues; `manage.py run_note_worker`
+  processes claim queued jobs from Mongo (and can share the upload dir).
+
+Jobs are claimed with an atomic status transition, so several pollers never
+run the same job twice, and jobs left "running" by a crashed process are
+re-queued once they go stale. A failed job is retried after an exponential
+backoff. In thread mode every web process sweeps the queue at start-up (see
+asgi.py) and every NOTE_JOB_RECOVERY_INTERVAL seconds, so jobs queued before
+a restart or waiting out their backoff do not depend on the next upload.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from mongoengine.queryset.visitor import Q
+
+from assistu_project.executors import LazyExecutor
+from django.core.files.move import file_move_safe
+
+from .artifacts import DEDUP_ENABLED, content_hash, note_from_artifact
+from .models import NoteJob
+from .utils import process_pdf_note
+
+logger = logging.getLogger(__name__)
+
+JOB_MODE = getattr(settings, "NOTE_JOB_MODE", "thread")
+JOB_WORKERS = getattr(settings, "NOTE_JOB_WORKERS", 2)
+JOB_MAX_ATTEMPTS = getattr(settings, "NOTE_JOB_MAX_ATTEMPTS", 2)
+# A running job not updated for this long is assumed to belong to a dead process
+JOB_STALE_SECONDS = getattr(settings, "NOTE_JOB_STALE_SECONDS", 15 * 60)
+# Wait before retry n is NOTE_JOB_RETRY_DELAY * 2 ** (n - 1) seconds
+JOB_RETRY_DELAY = getattr(settings, "NOTE_JOB_RETRY_DELAY", 30)
+JOB_RECOVERY_INTERVAL = getattr(settings, "NOTE_JOB_RECOVERY_INTERVAL", 60)
+UPLOAD_DIR = getattr(settings, "NOTE_UPLOAD_DIR", os.path.join(settings.BASE_DIR, "media", "note_uploads"))
+
+def _start_recovery(executor):
+    threading.Thread(target=_recovery_loop, name="note-job-recovery", daemon=True).start()
+
+
+_executor = LazyExecutor(JOB_WORKERS, "note-job", on_start=_start_recovery)
+
+
+def start_job_recovery():
+    """Start sweeping the queue in this process (thread mode only)"""
+    if JOB_MODE == "thread":
+        _executor.get()
+
+
+def store_upload(uploaded_file):
+    """
+    Move (large, already on disk) or copy (small, in memory) an upload to
+    UPLOAD_DIR and return its path
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.pdf")
+    if hasattr(uploaded_file, "temporary_file_path"):
+        file_move_safe(uploaded_file.temporary_file_path(), path)
+        return path
+    with open(path, "wb") as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+    return path
+
+
+def enqueue_pdf_job(user, pdf_file, title, subject):
+    """
+    Store the upload, record a queued job and schedule it. A PDF seen before
+    becomes a note straight away and its job is recorded as completed.
+    """
+    source_hash = None
+    if DEDUP_ENABLED:
+        source_hash = content_hash(pdf_file)
+        note = note_from_artifact(user, source_hash, title, subject)
+        if note is not None:
+            now = datetime.utcnow()
+            job = NoteJob(user=user, title=title, subject=subject, content_hash=source_hash,
+                          status="completed", stage="completed", progress=100, note=note,
+                          started_at=now, finished_at=now)
+            job.save()
+            return job
+
+    job = NoteJob(user=user, title=title, subject=subject, file_path=store_upload(pdf_file),
+                  content_hash=source_hash)
+    job.save()
+
+    if JOB_MODE == "thread":
+        _executor.get().submit(run_job_by_id, job.id)
+    return job
+
+
+def claim_job(job_id=None):
+    """
+    Atomically move a queued job (a specific one, or the oldest) to running.
+    Returns the claimed job, or None if there was nothing to claim.
+    """
+    now = datetime.utcnow()
+    queryset = NoteJob.objects(Q(retry_at=None) | Q(retry_at__lte=now), status="queued")
+    if job_id is not None:
+        queryset = queryset.filter(id=job_id)
+    return queryset.order_by("created_at").modify(
+        new=True,
+        set__status="running",
+        set__stage="starting",
+        set__started_at=now,
+        set__updated_at=now,
+        set__retry_at=None,
+        inc__attempts=1,
+    )
+
+
+def _set_progress(job, stage, percent):
+    NoteJob.objects(id=job.id).update_one(
+        set__stage=stage,
+        set__progress=percent,
+        set__updated_at=datetime.utcnow(),
+    )
+
+
+def run_job(job):
+    """Run the ingestion pipeline for a claimed job and record the outcome"""
+    try:
+        note = process_pdf_note(
+            job.user, job.file_path, job.title, job.subject,
+            progress=lambda stage, percent: _set_progress(job, stage, percent),
+            source_hash=job.content_hash,
+        )
+    except Exception as e:
+        logger.exception("Note job %s failed", job.id)
+        retry = job.attempts < JOB_MAX_ATTEMPTS and not isinstance(e, ValueError)
+        delay = JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        now = datetime.utcnow()
+        NoteJob.objects(id=job.id).update_one(
+            set__status="queued" if retry else "failed",
+            set__stage="retrying" if retry else "failed",
+            set__error=str(e),
+            set__retry_at=now + timedelta(seconds=delay) if retry else None,
+            set__updated_at=now,
+            set__finished_at=None if retry else now,
+        )
+        if retry and JOB_MODE == "thread":
+            timer = threading.Timer(delay, lambda: _executor.get().submit(run_job_by_id, job.id))
+            timer.daemon = True
+            timer.start()
+        elif not retry:
+            _remove_upload(job)
+        return None
+
+    now = datetime.utcnow()
+    NoteJob.objects(id=job.id).update_one(
+        set__status="completed",
+        set__stage="completed",
+        set__progress=100,
+        set__note=note,
+        set__error=None,
+        set__updated_at=now,
+        set__finished_at=now,
+    )
+    _remove_upload(job)
+    return note
+
+
+def run_job_by_id(job_id):
+    job = claim_job(job_id)
+    if job is not None:
+        run_job(job)
+
+
+def run_next_job():
+    """Claim and run the oldest queued job; False if the queue was empty"""
+    job = claim_job()
+    if job is None:
+        return False
+    run_job(job)
+    return True
+
+
+def requeue_stale_jobs():
+    """Put jobs abandoned by a crashed process back in the queue (or fail them)"""
+    now = datetime.utcnow()
+    stale = NoteJob.objects(status="running", updated_at__lt=now - timedelta(seconds=JOB_STALE_SECONDS))
+    stale.filter(attempts__gte=JOB_MAX_ATTEMPTS).update(
+        set__status="failed",
+        set__stage="failed",
+        set__error="Processing was interrupted",
+        set__updated_at=now,
+        set__finished_at=now,
+    )
+    return stale.filter(attempts__lt=JOB_MAX_ATTEMPTS).update(
+        set__status="queued",
+        set__stage="retrying",
+        set__updated_at=now,
+    )
+
+
+def _recover_jobs():
+    """Re-queue stale jobs and run every claimable one"""
+    try:
+        requeue_stale_jobs()
+        while run_next_job():
+            pass
+    except Exception:
+        logger.exception("Recovering note jobs failed")
+
+
+def _recovery_loop():
+    # Runs on the job pool, so recovery never exceeds NOTE_JOB_WORKERS jobs at once
+    while True:
+        _executor.get().submit(_recover_jobs).result()
+        time.sleep(JOB_RECOVERY_INTERVAL)
+
+
+def _remove_upload(job):
+    if job.file_path and os.path.exists(job.file_path):
+        os.remove(job.file_path)
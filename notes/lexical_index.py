@@ -0,0 +1,282 @@
+"""
+In-process per-user inverted index with BM25 scoring for exact-term note search.
+
+Course codes and formula names ("CS101", "Navier-Stokes") are what dense
+MiniLM embeddings rank worst, so notes are also indexed by term over their
+title, keywords, tags and transcript. Field matches are weighted (BM25F
+style: a title hit counts more than a transcript hit) into one term
+frequency per note.
+
+Each term's postings are two growable numpy arrays (note rows and weighted
+term frequencies), so scoring a term is a handful of vectorized operations.
+Deleted notes are tombstoned and dropped from the postings when enough of
+them accumulate. Indexes are built lazily from Mongo, updated on note
+create/delete and cached in the same memory-bounded LRU as the vector index.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from bson import ObjectId
+from django.conf import settings
+
+from .vector_index import OBJECT_ID_DTYPE, VectorIndexCache, INDEX_TTL_SECONDS, top_k
+
+MAX_LEXICAL_INDEX_BYTES = getattr(settings, "NOTES_LEXICAL_INDEX_MAX_BYTES", 256 * 1024 * 1024)
+FIELD_WEIGHTS = getattr(settings, "NOTES_LEXICAL_FIELD_WEIGHTS", {
+    "title": 3.0,
+    "keywords": 2.0,
+    "tags": 2.0,
+    "transcript": 1.0,
+})
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Compact the postings once this share of rows belongs to deleted notes
+COMPACT_DEAD_FRACTION = 0.25
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercased alphanumeric terms, e.g. "CS-101 notes" -> cs, 101, notes, cs101"""
+    terms = _TOKEN.findall(text.lower())
+    # Also index hyphen/space-joined letter+digit codes as one term
+    joined = [a + b for a, b in zip(terms, terms[1:]) if a.isalpha() and b.isdigit() and len(b) <= 4]
+    return terms + joined
+
+
+def note_terms(title=None, keywords=None, tags=None, transcript=None):
+    """Weighted term frequencies of a note and its weighted length"""
+    frequencies = Counter()
+    fields = {
+        "title": title or "",
+        "keywords": " ".join(keywords or []),
+        "tags": " ".join(tags or []),
+        "transcript": transcript or "",
+    }
+    for field, text in fields.items():
+        weight = FIELD_WEIGHTS.get(field, 1.0)
+        for term, count in Counter(tokenize(text)).items():
+            frequencies[term] += weight * count
+    return frequencies, sum(frequencies.values())
+
+
+class _Postings:
+    """Rows and weighted term frequencies of one term, with capacity doubling"""
+
+    __slots__ = ("rows", "tfs", "size")
+
+    def __init__(self, rows=(), tfs=()):
+        self.rows = np.array(rows, dtype=np.int32)
+        self.tfs = np.array(tfs, dtype=np.float32)
+        self.size = len(self.rows)
+
+    def append(self, row, tf):
+        if self.size == len(self.rows):
+            capacity = max(4, self.size * 2)
+            self.rows = np.resize(self.rows, capacity)
+            self.tfs = np.resize(self.tfs, capacity)
+        self.rows[self.size] = row
+        self.tfs[self.size] = tf
+        self.size += 1
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes + self.tfs.nbytes
+
+
+class UserLexicalIndex:
+    """BM25 inverted index over one user's notes"""
+
+    def __init__(self, capacity=16):
+        self.size = 0  # rows, including deleted ones
+        self.live = 0
+        self.ids = np.empty(capacity, dtype=OBJECT_ID_DTYPE)
+        self.lengths = np.zeros(capacity, dtype=np.float32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.postings = {}
+        self.total_length = 0.0
+        self.built_at = time.monotonic()
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Bulk build from (note_id, term frequencies, length) tuples"""
+        documents = list(documents)
+        index = cls(capacity=max(16, len(documents)))
+        vocabulary = {}
+        term_ids, tfs, counts = [], [], []
+        for row, (note_id, frequencies, length) in enumerate(documents):
+            index.ids[row] = str(note_id)
+            index.lengths[row] = length
+            index._positions[str(note_id)] = row
+            term_ids.extend(vocabulary.setdefault(term, len(vocabulary)) for term in frequencies)
+            tfs.extend(frequencies.values())
+            counts.append(len(frequencies))
+        index.size = index.live = len(documents)
+        index.alive[:index.size] = True
+        index.total_length = float(index.lengths[:index.size].sum())
+
+        # Group (term, row, tf) triples by term with one stable sort
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        rows = np.repeat(np.arange(len(documents), dtype=np.int32), counts)
+        tfs = np.asarray(tfs, dtype=np.float32)
+        order = np.argsort(term_ids, kind='stable')
+        boundaries = np.searchsorted(term_ids[order], np.arange(len(vocabulary) + 1))
+        rows, tfs = rows[order], tfs[order]
+        index.postings = {
+            term: _Postings(rows[boundaries[term_id]:boundaries[term_id + 1]],
+                            tfs[boundaries[term_id]:boundaries[term_id + 1]])
+            for term, term_id in vocabulary.items()
+        }
+        return index
+
+    @property
+    def nbytes(self):
+        return (self.ids.nbytes + self.lengths.nbytes + self.alive.nbytes
+                + sum(postings.nbytes for postings in self.postings.values()))
+
+    def __len__(self):
+        return self.live
+
+    def _grow(self):
+        capacity = max(16, len(self.ids) * 2)
+        self.ids = np.resize(self.ids, capacity)
+        self.lengths = np.resize(self.lengths, capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.size] = self.alive[:self.size]
+        self.alive = alive
+
+    def add(self, note_id, frequencies, length):
+        """Insert or replace a note"""
+        note_id = str(note_id)
+        with self._lock:
+            self._remove(note_id)
+            if self.size == len(self.ids):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.live += 1
+            self.ids[row] = note_id
+            self.lengths[row] = length
+            self.alive[row] = True
+            self.total_length += length
+            self._positions[note_id] = row
+            for term, tf in frequencies.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = _Postings()
+                postings.append(row, tf)
+
+    def remove(self, note_id):
+        with self._lock:
+            return self._remove(str(note_id))
+
+    def _remove(self, note_id):
+        row = self._positions.pop(note_id, None)
+        if row is None:
+            return False
+        self.alive[row] = False
+        self.live -= 1
+        self.total_length -= float(self.lengths[row])
+        if self.size - self.live > max(64, COMPACT_DEAD_FRACTION * self.size):
+            self._compact()
+        return True
+
+    def _compact(self):
+        """Drop deleted rows from every array and renumber the rest"""
+        alive = self.alive[:self.size]
+        remap = np.cumsum(alive, dtype=np.int32) - 1
+        for term in list(self.postings):
+            postings = self.postings[term]
+            rows, tfs = postings.rows[:postings.size], postings.tfs[:postings.size]
+            keep = alive[rows]
+            if not keep.any():
+                del self.postings[term]
+                continue
+            self.postings[term] = _Postings(remap[rows[keep]], tfs[keep])
+        self.ids[:self.live] = self.ids[:self.size][alive]
+        self.lengths[:self.live] = self.lengths[:self.size][alive]
+        self.alive[:self.size] = False
+        self.alive[:self.live] = True
+        self.size = self.live
+        self._positions = {str(note_id): row for row, note_id in enumerate(self.ids[:self.size])}
+
+    def search(self, query, k=None, offset=0):
+        """
+        BM25-score every note containing a query term and return one page as
+        (results, total): results is a list of (note_id, score), best first,
+        total the number of notes matching at least one term
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not self.live or not terms:
+                return [], 0
+            scores = np.zeros(self.size, dtype=np.float32)
+            alive = self.alive[:self.size]
+            average_length = self.total_length / self.live or 1.0
+            norms = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[:self.size] / average_length)
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                rows, tfs = postings.rows[:postings.size], postings.tfs[:postings.size]
+                live_rows = alive[rows]
+                frequency = int(live_rows.sum())
+                if not frequency:
+                    continue
+                idf = math.log(1 + (self.live - frequency + 0.5) / (frequency + 0.5))
+                # Each row appears once per term, so fancy-indexed += is safe
+                scores[rows] += idf * tfs * (BM25_K1 + 1) / (tfs + norms[rows]) * live_rows
+            candidates = np.flatnonzero(scores > 0)
+            total = len(candidates)
+            top = top_k(scores[candidates], k, offset)
+            return [(str(self.ids[candidates[i]]), float(scores[candidates[i]])) for i in top], total
+
+
+_cache = VectorIndexCache(max_bytes=MAX_LEXICAL_INDEX_BYTES, ttl=INDEX_TTL_SECONDS)
+
+
+def build_lexical_index(user_id):
+    """Index every note of a user from Mongo"""
+    from .models import Note
+
+    notes = (
+        Note.objects(user=ObjectId(user_id))
+        .only('id', 'title', 'keywords', 'tags', 'transcript')
+        .as_pymongo()
+    )
+    documents = []
+    for note in notes:
+        frequencies, length = note_terms(note.get('title'), note.get('keywords'),
+                                         note.get('tags'), note.get('transcript'))
+        documents.append((str(note['_id']), frequencies, length))
+    return UserLexicalIndex.from_documents(documents)
+
+
+def get_lexical_index(user):
+    """Return the cached inverted index for a user, building it from Mongo if needed"""
+    user_id = str(getattr(user, 'id', user))
+    index = _cache.get(user_id)
+    if index is None:
+        index = _cache.put(user_id, build_lexical_index(user_id))
+    return index
+
+
+def index_note_terms(note):
+    """Add a freshly saved note to its owner's inverted index if that index is loaded"""
+    index = _cache.get(str(note.user.id))
+    if index is not None:
+        frequencies, length = note_terms(note.title, note.keywords, note.tags, note.transcript)
+        index.add(note.id, frequencies, length)
+
+
+def unindex_note_terms(user_id, note_id):
+    """Remove a deleted note from its owner's inverted index if that index is loaded"""
+    index = _cache.get(str(user_id))
+    if index is not None:
+        index.remove(note_id)
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine.queryset.visitor import Q
+
+from assistu_project.llm_cache import CachedLLMResponse, LLMCacheStats
+from events.models import Event
+from notes.allMiniLm_utils import EMBEDDING_MODEL_VERSION
+from notes.models import DocumentArtifact, Note, NoteChunk, NoteJob
+from planner.models import StudyPlan
+from tasks.models import Task
+from users.models import User, UserStats
+
+MODELS = (User, UserStats, Note, NoteJob, NoteChunk, DocumentArtifact, Task, Event, StudyPlan,
+          CachedLLMResponse, LLMCacheStats)
+
+
+def view_queries(user_id):
+    """(label, queryset) for the query shapes the API views issue per request"""
+    now = datetime.now()
+    month = now + timedelta(days=30)
+    return [
+        ('notes.get_all_notes', Note.objects(user=user_id)),
+        ('notes.search (index build)', Note.objects(user=user_id, summary__nin=[None, ''])),
+        ('notes.search (ann tail)', Note.objects(user=user_id, embedding_model=EMBEDDING_MODEL_VERSION,
+                                                 id__gte=ObjectId.from_datetime(now))),
+        ('notes.search (passages)', NoteChunk.objects(user=user_id, embedding_model=EMBEDDING_MODEL_VERSION)),
+        ('notes.delete_note (chunks)', NoteChunk.objects(note=ObjectId())),
+        ('notes.create_note_from_pdf (artifact)', DocumentArtifact.objects(content_hash='0' * 64)),
+        ('notes.run_note_worker (claim)', NoteJob.objects(Q(retry_at=None) | Q(retry_at__lte=now), status='queued')
+            .order_by('created_at')),
+        ('tasks.user_tasks_view', Task.objects(user=user_id)),
+        ('tasks.dashboard (notes)', Note.objects(user=user_id).order_by('-id')),
+        ('tasks.dashboard (tasks)', Task.objects(user=user_id, due_date__gte=now, due_date__lte=month)
+            .order_by('due_date')),
+        ('tasks.dashboard (events)', Event.objects(user=user_id, start_time__gte=now, start_time__lte=month)
+            .order_by('start_time')),
+        ('tasks.dashboard (plans)', StudyPlan.objects(user=user_id).order_by('-id')),
+        ('tasks.dashboard_v2 (notes)', Note.objects(user=user_id).order_by('-id')),
+        ('tasks.dashboard_v2 (plans)', StudyPlan.objects(user=user_id).order_by('-id')),
+        ('events.list_events', Event.objects(user=user_id)),
+        ('planner.list_and_create_plan', StudyPlan.objects(user=user_id).order_by('-id')),
+        # $match stages of the profile aggregations (users.stats)
+        ('users.get_user_profile (notes)', Note.objects(user=user_id)),
+        ('users.get_user_profile (tasks)', Task.objects(user=user_id)),
+        ('users.get_user_profile (events)', Event.objects(user=user_id)),
+        ('users.get_user_profile (materialized)', UserStats.objects(user=user_id)),
+        ('users.login', User.objects(email='audit@example.com')),
+        # Every LLM call of a cached endpoint (assistu_project.llm_cache)
+        ('llm_cache.lookup', CachedLLMResponse.objects(key='0' * 64)),
+        ('llm_cache.lookup (stats)', LLMCacheStats.objects(endpoint='notes.summary')),
+        ('llm_cache.prune', CachedLLMResponse.objects.order_by('created_at')),
+    ]
+
+
+def plan_stages(plan):
+    """Every stage name in an explain() plan tree, outermost first"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for key, value in plan.items():
+            if key != 'rejectedPlans':
+                stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+class Command(BaseCommand):
+    help = "Explain the queries the API views issue and fail if any of them scans a whole collection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='User id to plan the queries for (default: any existing user)')
+        parser.add_argument('--create', action='store_true',
+                            help='Create the indexes declared on the models before auditing')
+
+    def handle(self, *args, **options):
+        if options['create']:
+            for model in MODELS:
+                model.ensure_indexes()
+                self.stdout.write(f"Ensured indexes of {model._get_collection_name()}")
+
+        user_id = options['user']
+        if not user_id:
+            user = User.objects.only('id').first()
+            user_id = user.id if user else ObjectId()
+        user_id = ObjectId(str(user_id))
+
+        scans = []
+        for label, queryset in view_queries(user_id):
+            stages = plan_stages(queryset.explain()['queryPlanner']['winningPlan'])
+            if 'COLLSCAN' in stages:
+                scans.append(label)
+                verdict = self.style.ERROR('COLLSCAN')
+            elif 'SORT' in stages:
+                verdict = self.style.WARNING('in-memory sort')
+            elif stages == ['EOF']:
+                verdict = self.style.WARNING('collection missing, not verified')
+            else:
+                verdict = self.style.SUCCESS('ok')
+            self.stdout.write(f"{label:<40} {' <- '.join(stages):<50} {verdict}")
+
+        if scans:
+            raise CommandError(f"{len(scans)} queries scan a whole collection: {', '.join(scans)}")
+        self.stdout.write(self.style.SUCCESS("No collection scans"))
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+
+from notes.models import Note, NoteChunk
+from notes.allMiniLm_utils import EMBEDDING_MODEL_VERSION, embed_notes
+from notes.passages import embed_note_chunks
+from notes.embedding_store import store_note
+
+
+class Command(BaseCommand):
+    help = "Compute and store summary embeddings for notes that are missing one or use an older model version"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=64,
+                            help='Number of summaries embedded per ONNX forward pass')
+        parser.add_argument('--force', action='store_true',
+                            help='Re-embed every note, even ones already on the current model version')
+        parser.add_argument('--chunks', action='store_true',
+                            help='Also chunk and embed transcripts for passage search')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+
+        notes = Note.objects(summary__nin=[None, '']).only('id', 'user', 'summary').no_dereference()
+        if not options['force']:
+            notes = notes.filter(embedding_model__ne=EMBEDDING_MODEL_VERSION)
+
+        total = notes.count()
+        self.stdout.write(f"Embedding {total} notes with {EMBEDDING_MODEL_VERSION}")
+
+        done = 0
+        batch = []
+        for note in notes.no_cache():
+            batch.append(note)
+            if len(batch) >= batch_size:
+                done += self._save_batch(batch)
+                batch = []
+                self.stdout.write(f"  {done}/{total}")
+
+        if batch:
+            done += self._save_batch(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled embeddings for {done} notes"))
+
+        if options['chunks']:
+            self._backfill_chunks(options['force'])
+
+    def _backfill_chunks(self, force):
+        notes = Note.objects(transcript__nin=[None, '']).only('id', 'user', 'transcript')
+        if not force:
+            current = NoteChunk.objects(embedding_model=EMBEDDING_MODEL_VERSION).no_dereference().distinct('note')
+            notes = notes.filter(id__nin=current)
+
+        total = notes.count()
+        self.stdout.write(f"Embedding transcript passages of {total} notes")
+        chunks = 0
+        for done, note in enumerate(notes.no_cache(), start=1):
+            chunks += embed_note_chunks(note)
+            self.stdout.write(f"  {done}/{total}")
+        self.stdout.write(self.style.SUCCESS(f"Stored {chunks} passages for {total} notes"))
+
+    def _save_batch(self, batch):
+        embed_notes(batch)
+        for note in batch:
+            Note.objects(id=note.id).update_one(
+                set__embedding=note.embedding,
+                set__embedding_model=note.embedding_model
+            )
+            store_note(note)
+        return len(batch)
@@ -0,0 +1,83 @@
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from notes.allMiniLm_utils import EMBEDDING_DIM
+from notes.ann_index import IVFIndex
+from notes.vector_index import top_k
+
+
+def clustered_vectors(count, topics, spread, rng):
+    """Unit vectors scattered around `topics` random directions, like note embeddings of many subjects"""
+    centers = rng.standard_normal((topics, EMBEDDING_DIM)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    vectors = np.empty((count, EMBEDDING_DIM), dtype=np.float32)
+    for start in range(0, count, 65536):
+        end = min(count, start + 65536)
+        block = centers[rng.integers(0, topics, end - start)]
+        block += rng.standard_normal(block.shape).astype(np.float32) * spread
+        vectors[start:end] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Recall@k and query latency of the IVF index against brute force on synthetic clustered embeddings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 16, 64])
+        parser.add_argument('--topics', type=int, default=2000)
+        parser.add_argument('--spread', type=float, default=0.06,
+                            help='Per-dimension noise around each topic direction')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        k = options['k']
+        self.stdout.write(f"{'vectors':>9}{'lists':>7}{'build s':>9}{'load ms':>9}  {'method':<12}"
+                          f"{'recall@' + str(k):>10}{'p50 ms':>9}{'p95 ms':>9}")
+        for size in options['sizes']:
+            data = clustered_vectors(size + options['queries'], options['topics'], options['spread'], rng)
+            vectors, queries = data[:size], data[size:]
+            ids = [f"{row:024x}" for row in range(size)]
+
+            started = time.perf_counter()
+            index = IVFIndex.build(ids, vectors)
+            build_seconds = time.perf_counter() - started
+
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'ivf')
+                index.save(path)
+                del index
+                started = time.perf_counter()
+                index = IVFIndex.load(path)
+                load_ms = (time.perf_counter() - started) * 1000
+
+                exact, brute_times = [], []
+                for query in queries:
+                    started = time.perf_counter()
+                    exact.append(set(top_k(vectors @ query, k)))
+                    brute_times.append((time.perf_counter() - started) * 1000)
+                prefix = f"{size:>9}{index.n_lists:>7}{build_seconds:>9.1f}{load_ms:>9.1f}  "
+                self.stdout.write(f"{prefix}{'brute force':<12}{1.0:>10.3f}"
+                                  f"{statistics.median(brute_times):>9.2f}{percentile(brute_times, 0.95):>9.2f}")
+
+                for nprobe in options['nprobe']:
+                    hits, times = 0, []
+                    for query, truth in zip(queries, exact):
+                        started = time.perf_counter()
+                        results, _ = index.search(query, k=k, nprobe=nprobe)
+                        times.append((time.perf_counter() - started) * 1000)
+                        hits += len(truth & {int(note_id, 16) for note_id, _ in results})
+                    self.stdout.write(f"{prefix}{'nprobe ' + str(nprobe):<12}{hits / (k * len(queries)):>10.3f}"
+                                      f"{statistics.median(times):>9.2f}{percentile(times, 0.95):>9.2f}")
+                del index
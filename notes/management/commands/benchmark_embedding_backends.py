@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.corpus import load_embedding_corpus
+
+
+def rss_mb(pid='self'):
+    """Resident set size of a process from /proc (Linux)"""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_worker(mode, socket_path, texts, requests, results):
+    """Body of one simulated Django worker, run in a fresh spawned process"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'assistu_project.settings')
+    import django
+    django.setup()
+
+    if mode == 'socket':
+        from notes.embedding_server import SocketEmbeddingClient
+        embed = SocketEmbeddingClient(socket_path).embed
+    else:
+        from notes.allMiniLm_utils import embed_texts_local as embed
+
+    embed(texts[:1])
+    started = time.perf_counter()
+    for i in range(requests):
+        embed([texts[i % len(texts)]])
+    results.put((time.perf_counter() - started, rss_mb()))
+
+
+class Command(BaseCommand):
+    help = "Compare per-worker memory and throughput of in-process embedding against the shared embedding server"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=200, help='Single-query embeds per worker')
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/status'):
+            raise CommandError("RSS is read from /proc; run this benchmark on Linux")
+
+        corpus = load_embedding_corpus()
+        texts = corpus['queries'] + corpus['summaries']
+
+        self.stdout.write(f"{options['workers']} workers x {options['requests']} single-query embeds")
+        self.stdout.write(f"{'mode':<10}{'worker RSS MB':>15}{'server RSS MB':>15}{'total RSS MB':>14}{'embeds/s':>10}")
+
+        self._report('local', None, None, texts, options)
+
+        socket_path = os.path.join(tempfile.mkdtemp(), 'embeddings.sock')
+        server = subprocess.Popen(
+            [sys.executable, 'manage.py', 'run_embedding_server', '--socket', socket_path],
+            cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL,
+        )
+        try:
+            deadline = time.monotonic() + 120
+            while not os.path.exists(socket_path):
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise CommandError("Embedding server did not start")
+                time.sleep(0.1)
+            self._report('socket', socket_path, server.pid, texts, options)
+        finally:
+            server.terminate()
+            server.wait()
+
+    def _report(self, mode, socket_path, server_pid, texts, options):
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        workers = [
+            context.Process(target=run_worker, args=(mode, socket_path, texts, options['requests'], results))
+            for _ in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        server_rss = rss_mb(server_pid) if server_pid else 0.0
+        worker_rss = sum(rss for _, rss in outcomes) / len(outcomes)
+        slowest = max(elapsed for elapsed, _ in outcomes)
+        throughput = options['requests'] * len(outcomes) / slowest
+        total_rss = worker_rss * len(outcomes) + server_rss
+        self.stdout.write(f"{mode:<10}{worker_rss:>15.0f}{server_rss:>15.0f}{total_rss:>14.0f}{throughput:>10.0f}")
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from notes import allMiniLm_utils
+from notes.corpus import load_embedding_corpus
+
+
+def embed_single_batch(texts):
+    """The previous embed_texts: one batch padded to the longest text"""
+    token_ids = allMiniLm_utils.tokenize(texts)
+    input_ids, attention_mask = allMiniLm_utils.pad_batch(token_ids)
+    return allMiniLm_utils.run_model(input_ids, attention_mask)
+
+
+class Command(BaseCommand):
+    help = "Compare padded tokens and wall time of length-bucketed embed_texts against a single padded batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per strategy')
+        parser.add_argument('--copies', type=int, default=4,
+                            help='How many times the fixture corpus is repeated to form the workload')
+
+    def handle(self, *args, **options):
+        corpus = load_embedding_corpus()
+
+        # A backfill/index-build style mix: many short summaries, a few long
+        # transcript passages and the odd query
+        texts = (corpus['summaries'] + corpus['passages'] + corpus['queries'][:4]) * options['copies']
+        lengths = [len(ids) for ids in allMiniLm_utils.tokenize(texts)]
+        real_tokens = sum(lengths)
+
+        single_tokens = len(lengths) * max(lengths)
+        buckets = allMiniLm_utils.plan_buckets(lengths)
+        bucketed_tokens = sum(len(bucket) * max(lengths[i] for i in bucket) for bucket in buckets)
+
+        # Warm up the session so neither strategy pays first-run allocation
+        embed_single_batch(texts[:2])
+
+        single_time, single = self._time(embed_single_batch, texts, options['repeat'])
+        bucketed_time, bucketed = self._time(allMiniLm_utils.embed_texts, texts, options['repeat'])
+
+        self.stdout.write(f"Texts: {len(texts)}, real tokens: {real_tokens}, "
+                          f"lengths min/median/max: {min(lengths)}/{int(np.median(lengths))}/{max(lengths)}")
+        self.stdout.write(f"{'strategy':<16}{'model calls':>12}{'tokens':>10}{'padding':>10}{'wall ms':>10}")
+        self.stdout.write(f"{'single batch':<16}{1:>12}{single_tokens:>10}"
+                          f"{1 - real_tokens / single_tokens:>10.1%}{single_time * 1000:>10.1f}")
+        self.stdout.write(f"{'bucketed':<16}{len(buckets):>12}{bucketed_tokens:>10}"
+                          f"{1 - real_tokens / bucketed_tokens:>10.1%}{bucketed_time * 1000:>10.1f}")
+
+        # Padding is masked out of the mean pool, so both must agree
+        max_diff = float(np.abs(single - bucketed).max())
+        self.stdout.write(f"Max abs difference between strategies: {max_diff:.2e}")
+
+    def _time(self, fn, texts, repeat):
+        best = float('inf')
+        result = None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            result = fn(texts)
+            best = min(best, time.perf_counter() - started)
+        return best, result
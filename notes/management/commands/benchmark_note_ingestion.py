@@ -0,0 +1,68 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from assistu_project import llm, llm_cache
+from assistu_project.llm_stub import StubLLMServer
+from notes.chunking import iter_chunks
+from notes.corpus import load_embedding_corpus
+from notes.utils import generate_note_content, SUMMARY_MODE
+
+STRATEGIES = ('sequential', 'parallel', 'combined')
+
+
+def stub_note_content(payload):
+    # Superset of every note prompt's schema; each parser keeps its own keys
+    return {
+        "summary": "Stub summary of the uploaded lecture.",
+        "explanation": ["First point", "Second point"],
+        "tags": ["stub"],
+        "categories": ["General"],
+        "keywords": ["stub"],
+        "importance": "medium"
+    }
+
+
+class Command(BaseCommand):
+    help = "Time note ingestion with each LLM metadata strategy against a local stub LLM with injected delay"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delay', type=float, default=0.8, help='Seconds the stub LLM takes per call')
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--embed', action='store_true', help='Include summary embedding (needs the ONNX model)')
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Repeat the corpus passages this many times to simulate a long PDF')
+        parser.add_argument('--summary-mode', choices=('map_reduce', 'excerpt'), default=SUMMARY_MODE)
+
+    def handle(self, *args, **options):
+        text = " ".join(load_embedding_corpus()['passages'] * max(1, options['scale']))
+
+        server = StubLLMServer(delay=options['delay'], respond=stub_note_content).start()
+        previous_client = llm.get_client()
+        llm.set_client(llm.LLMClient(url=server.url, api_key='stub'))
+        # Every run sends the same prompts; cached responses would hide the LLM latency
+        cached_endpoints, llm_cache.CACHE_ENDPOINTS = llm_cache.CACHE_ENDPOINTS, set()
+        try:
+            self.stdout.write(f"Stub LLM delay {options['delay'] * 1000:.0f} ms, {options['runs']} runs per strategy, "
+                              f"{len(text)} chars, {options['summary_mode']} summaries")
+            self.stdout.write(f"{'strategy':<12}{'LLM calls':>10}{'mean ms':>10}{'min ms':>10}{'max ms':>10}")
+            for strategy in STRATEGIES:
+                calls_before = server.requests
+                timings = [self._ingest(text, strategy, options['summary_mode'], options['embed'])
+                           for _ in range(options['runs'])]
+                calls = (server.requests - calls_before) / options['runs']
+                self.stdout.write(f"{strategy:<12}{calls:>10.0f}{statistics.mean(timings):>10.0f}"
+                                  f"{min(timings):>10.0f}{max(timings):>10.0f}")
+        finally:
+            llm.set_client(previous_client)
+            llm_cache.CACHE_ENDPOINTS = cached_endpoints
+            server.stop()
+
+    def _ingest(self, text, strategy, summary_mode, embed):
+        started = time.perf_counter()
+        summary, _, _ = generate_note_content(list(iter_chunks(text)), strategy=strategy, summary_mode=summary_mode)
+        if embed:
+            from notes.allMiniLm_utils import embed_texts
+            embed_texts([summary])
+        return (time.perf_counter() - started) * 1000
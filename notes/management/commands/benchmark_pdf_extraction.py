@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from io import BytesIO
+
+import fitz  # PyMuPDF
+from django.core.management.base import BaseCommand
+
+from notes.corpus import load_embedding_corpus
+from notes.pdf_extract import extract_text, shutdown_pool
+
+MODES = ('legacy', 'streaming', 'processes')
+
+
+def build_fixture(path, pages, paragraphs):
+    """Write a text-only PDF with `pages` pages of corpus text"""
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        text = f"Page {page_num + 1}\n\n" + "\n\n".join(
+            paragraphs[(page_num + offset) % len(paragraphs)] for offset in range(3)
+        )
+        page.insert_textbox(fitz.Rect(50, 50, 545, 800), text, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def legacy_extract(path):
+    """The previous implementation: whole file in memory, BytesIO copy, += per page"""
+    with open(path, 'rb') as f:
+        file_content = f.read()
+    doc = fitz.open(stream=BytesIO(file_content), filetype="pdf")
+    text = ""
+    for page_num in range(len(doc)):
+        text += doc.load_page(page_num).get_text() + "\n"
+    doc.close()
+    return text
+
+
+def run_extraction(mode, path, processes, results):
+    """Body of one measurement, run in a fresh spawned process so peak RSS is its own"""
+    if mode == 'processes':
+        # A web process keeps its pool; measure extraction, not worker start-up
+        extract_text(path, processes=processes, min_pages=1)
+    started = time.perf_counter()
+    if mode == 'legacy':
+        text = legacy_extract(path)
+    else:
+        text = extract_text(path, processes=processes if mode == 'processes' else 0, min_pages=1)
+    elapsed = time.perf_counter() - started
+    shutdown_pool()
+    # ru_maxrss is in KiB on Linux; pool workers are reported as children
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    results.put((elapsed, peak, children, len(text)))
+
+
+class Command(BaseCommand):
+    help = "Wall time and peak RSS of PDF text extraction (legacy, streaming, process pool) on generated fixtures"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 500])
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 2)
+
+    def handle(self, *args, **options):
+        corpus = load_embedding_corpus()
+        paragraphs = corpus['passages'] + corpus['summaries']
+        context = multiprocessing.get_context('spawn')
+
+        self.stdout.write(f"{'pages':>6}  {'mode':<11}{'wall ms':>10}{'peak RSS MB':>13}{'pool RSS MB':>13}{'chars':>10}")
+        with tempfile.TemporaryDirectory() as tmp:
+            for pages in options['pages']:
+                path = os.path.join(tmp, f'fixture_{pages}.pdf')
+                build_fixture(path, pages, paragraphs)
+                for mode in MODES:
+                    results = context.Queue()
+                    worker = context.Process(target=run_extraction,
+                                             args=(mode, path, options['processes'], results))
+                    worker.start()
+                    elapsed, peak, children, chars = results.get()
+                    worker.join()
+                    pool = f"{children:.0f}" if mode == 'processes' else '-'
+                    self.stdout.write(f"{pages:>6}  {mode:<11}{elapsed * 1000:>10.0f}{peak:>13.0f}{pool:>13}{chars:>10}")
@@ -0,0 +1,174 @@
+import statistics
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from assistu_project import read_models
+from events.models import Event
+from events.utils import get_user_events
+from notes.allMiniLm_utils import EMBEDDING_DIM
+from notes.models import Note
+from planner.models import StudyPlan
+from planner.utils import get_user_plans
+from tasks.models import Task
+from tasks.utils import get_user_tasks
+from users.models import User
+
+
+# The list view bodies before assistu_project.read_models, over the hydrated
+# Documents of the apps' get_user_* helpers
+def legacy_notes(user):
+    return {'notes': [{
+        'id': str(n.id),
+        'title': n.title,
+        'subject': n.subject,
+        'importance': n.importance,
+        'created_at': n.created_at
+    } for n in Note.objects(user=user)]}
+
+
+def legacy_tasks(user):
+    return {"tasks": [{
+        "id": str(t.id),
+        "title": t.title,
+        "subject": t.subject,
+        "status": t.status,
+        "priority": t.priority,
+        "due_date": t.due_date
+    } for t in get_user_tasks(user)]}
+
+
+def legacy_events(user):
+    return [{
+        "id": str(e.id),
+        "title": e.title,
+        "description": e.description,
+        "event_type": e.event_type,
+        "start_time": e.start_time,
+        "end_time": e.end_time,
+        "related_task": str(e.related_task.id) if e.related_task else None
+    } for e in get_user_events(user)]
+
+
+def legacy_plans(user):
+    return [{
+        "id": str(plan.id),
+        "user_id": str(plan.user.id),
+        "title": plan.title,
+        "duration": plan.duration,
+        "sessions": plan.sessions,
+        "created_at": plan.created_at,
+        "updated_at": plan.updated_at,
+    } for plan in get_user_plans(user)]
+
+
+ENDPOINTS = (
+    ('get_all_notes', legacy_notes, lambda user: {'notes': read_models.list_notes(user)}),
+    ('user_tasks_view', legacy_tasks, lambda user: {"tasks": read_models.list_tasks(user)}),
+    ('list_events', legacy_events, read_models.list_events),
+    ('list_and_create_plan', legacy_plans, read_models.list_plans),
+)
+
+
+def seed(user_id, count):
+    """`count` notes, tasks, events and plans shaped like real ones (full transcripts, embeddings, sessions)"""
+    now = datetime.now()
+    task_ids = [ObjectId() for _ in range(count)]
+    Note._get_collection().insert_many([{
+        'user': user_id,
+        'title': f"Lecture {row}",
+        'transcript': "lecture transcript text " * 400,
+        'summary': "summary of the lecture " * 40,
+        'explanation': ["a bullet point of the explanation"] * 8,
+        'subject': 'Computer Science',
+        'categories': ['General'],
+        'keywords': ['graphs', 'trees', 'sorting'],
+        'importance': 'medium',
+        'tags': ['exam'],
+        'embedding': bytes(EMBEDDING_DIM * 4),
+        'embedding_model': 'benchmark',
+    } for row in range(count)])
+    Task._get_collection().insert_many([{
+        '_id': task_ids[row],
+        'user': user_id,
+        'title': f"Assignment {row}",
+        'description': "assignment description " * 10,
+        'subject': 'Computer Science',
+        'type': 'assignment',
+        'priority': 'medium',
+        'status': 'pending',
+        'due_date': now + timedelta(days=row % 60),
+        'estimated_duration': 60,
+        'tags': ['homework'],
+    } for row in range(count)])
+    Event._get_collection().insert_many([{
+        'user': user_id,
+        'title': f"Study session {row}",
+        'description': "study session description " * 10,
+        'event_type': 'study_session',
+        'start_time': now + timedelta(hours=row),
+        'end_time': now + timedelta(hours=row + 1),
+        'related_task': task_ids[row],
+    } for row in range(count)])
+    StudyPlan._get_collection().insert_many([{
+        'user': user_id,
+        'title': f"Plan {row}",
+        'duration': '4 weeks',
+        'sessions': [{'day': day, 'topic': 'revision', 'minutes': 60} for day in range(14)],
+    } for row in range(count)])
+
+
+def cleanup(user_id):
+    for model in (Note, Task, Event, StudyPlan):
+        model._get_collection().delete_many({'user': user_id})
+    User._get_collection().delete_one({'_id': user_id})
+
+
+def measure(build, user, runs):
+    """Median wall time of building and rendering a response, and the traced allocation peak of one"""
+    renderer = JSONRenderer()
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        renderer.render(build(user))
+        times.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    renderer.render(build(user))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1024
+
+
+class Command(BaseCommand):
+    help = "Per-request latency and allocations of the list views, hydrated Documents vs raw read models"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000],
+                            help='Documents per collection of the benchmark user')
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        runs = max(1, options['runs'])
+        self.stdout.write(f"{'docs':>7}  {'endpoint':<22}{'legacy ms':>11}{'read ms':>9}{'speedup':>9}"
+                          f"{'legacy KiB':>12}{'read KiB':>10}")
+        for size in options['sizes']:
+            suffix = uuid.uuid4().hex[:12]
+            user = User(username=f"benchmark-{suffix}", email=f"benchmark-{suffix}@example.com",
+                        password='!', name='Benchmark')
+            user.save()
+            try:
+                seed(user.id, size)
+                for label, legacy, fast in ENDPOINTS:
+                    assert legacy(user) == fast(user), f"{label} responses differ"
+                    legacy_ms, legacy_kib = measure(legacy, user, runs)
+                    fast_ms, fast_kib = measure(fast, user, runs)
+                    self.stdout.write(f"{size:>7}  {label:<22}{legacy_ms:>11.1f}{fast_ms:>9.1f}"
+                                      f"{legacy_ms / fast_ms:>8.1f}x{legacy_kib:>12.0f}{fast_kib:>10.0f}")
+            finally:
+                cleanup(user.id)
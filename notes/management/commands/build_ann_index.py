@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from notes.models import Note
+from notes.allMiniLm_utils import EMBEDDING_MODEL_VERSION
+from notes.ann_index import ANN_MIN_VECTORS, ann_path, build_user_ann_index
+
+
+class Command(BaseCommand):
+    help = "Build memory-mapped IVF indexes for users with at least NOTES_ANN_MIN_VECTORS embedded notes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Build for this user id only, whatever their note count')
+        parser.add_argument('--min-notes', type=int, default=ANN_MIN_VECTORS)
+        parser.add_argument('--lists', type=int, help='Number of k-means lists (default sqrt(notes))')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user_ids = [options['user']]
+        else:
+            counts = Note.objects(embedding_model=EMBEDDING_MODEL_VERSION).aggregate(
+                {'$group': {'_id': '$user', 'notes': {'$sum': 1}}},
+                {'$match': {'notes': {'$gte': options['min_notes']}}},
+            )
+            user_ids = [str(row['_id']) for row in counts]
+
+        self.stdout.write(f"Building IVF indexes for {len(user_ids)} users")
+        for user_id in user_ids:
+            index = build_user_ann_index(user_id, n_lists=options['lists'])
+            if index is None:
+                self.stdout.write(f"  {user_id}: no embedded notes")
+                continue
+            self.stdout.write(f"  {user_id}: {len(index)} vectors in {index.n_lists} lists -> {ann_path(user_id)}")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,54 @@
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.models import Note
+from notes.allMiniLm_utils import EMBEDDING_DIM, EMBEDDING_MODEL_VERSION
+from notes.embedding_store import get_store
+
+
+class Command(BaseCommand):
+    help = "Drop deleted rows from the on-disk embedding store, or reload it from Mongo with --rebuild"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Clear the store and append every current-model note embedding from Mongo')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Notes appended per write while rebuilding')
+
+    def handle(self, *args, **options):
+        store = get_store()
+        if store is None:
+            raise CommandError("NOTES_EMBEDDING_STORE_ENABLED is off")
+
+        if options['rebuild']:
+            self._rebuild(store, max(1, options['batch_size']))
+        else:
+            before = len(store)
+            kept, dropped = store.compact()
+            self.stdout.write(f"Compacted {before} rows: kept {kept}, dropped {dropped}")
+        self.stdout.write(self.style.SUCCESS(f"{store.live_count()} live vectors in {store.path}"))
+
+    def _rebuild(self, store, batch_size):
+        notes = (
+            Note.objects(embedding_model=EMBEDDING_MODEL_VERSION, summary__nin=[None, ''])
+            .only('id', 'user', 'embedding')
+            .as_pymongo()
+        )
+        store.clear()
+        done = 0
+        batch = []
+        for note in notes:
+            batch.append(note)
+            if len(batch) >= batch_size:
+                done += self._append(store, batch)
+                batch = []
+                self.stdout.write(f"  {done}")
+        if batch:
+            done += self._append(store, batch)
+        self.stdout.write(f"Loaded {done} embeddings with {EMBEDDING_MODEL_VERSION}")
+
+    def _append(self, store, batch):
+        matrix = np.frombuffer(b''.join(note['embedding'] for note in batch), dtype=np.float32)
+        store.extend([note['_id'] for note in batch], [note['user'] for note in batch],
+                     matrix.reshape(len(batch), EMBEDDING_DIM))
+        return len(batch)
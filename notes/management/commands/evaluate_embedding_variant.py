@@ -0,0 +1,74 @@
+import os
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.allMiniLm_utils import MODEL_FILES, embed_texts, model_path
+from notes.corpus import CORPUS_PATH, load_embedding_corpus
+
+
+class Command(BaseCommand):
+    help = ("Compare a model variant against the fp32 reference on the fixture corpus and "
+            "fail if recall@k of its rankings drops below a threshold")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variant', default='int8', choices=sorted(MODEL_FILES))
+        parser.add_argument('--reference', default='fp32', choices=sorted(MODEL_FILES))
+        parser.add_argument('--k', type=int, default=5)
+        parser.add_argument('--min-recall', type=float, default=0.9,
+                            help='Mean recall@k against the reference ranking required to pass')
+        parser.add_argument('--corpus', default=CORPUS_PATH,
+                            help='JSON file with "queries" and "summaries"/"passages" lists')
+
+    def handle(self, *args, **options):
+        for variant in (options['reference'], options['variant']):
+            if not os.path.exists(model_path(variant)):
+                raise CommandError(f"Model for variant '{variant}' not found at {model_path(variant)}")
+
+        corpus = load_embedding_corpus(options['corpus'])
+        documents = corpus.get('summaries', []) + corpus.get('passages', [])
+        queries = corpus['queries']
+        k = min(options['k'], len(documents))
+
+        reference_docs, reference_queries, reference_time = self._embed(options['reference'], documents, queries)
+        variant_docs, variant_queries, variant_time = self._embed(options['variant'], documents, queries)
+
+        # How far each vector moved between models
+        doc_cosines = np.sum(reference_docs * variant_docs, axis=1)
+        query_cosines = np.sum(reference_queries * variant_queries, axis=1)
+
+        reference_scores = reference_queries @ reference_docs.T
+        variant_scores = variant_queries @ variant_docs.T
+        recalls = []
+        for reference_row, variant_row in zip(reference_scores, variant_scores):
+            expected = set(np.argsort(-reference_row)[:k])
+            found = set(np.argsort(-variant_row)[:k])
+            recalls.append(len(expected & found) / k)
+        recall = float(np.mean(recalls))
+        score_error = float(np.abs(reference_scores - variant_scores).max())
+
+        self.stdout.write(f"Corpus: {len(documents)} documents, {len(queries)} queries")
+        self.stdout.write(f"Embedding time: {options['reference']} {reference_time * 1000:.0f} ms, "
+                          f"{options['variant']} {variant_time * 1000:.0f} ms "
+                          f"({reference_time / variant_time:.2f}x)")
+        self.stdout.write(f"Cosine(reference, variant): documents min {doc_cosines.min():.4f} "
+                          f"mean {doc_cosines.mean():.4f}, queries min {query_cosines.min():.4f}")
+        self.stdout.write(f"Max similarity score error: {score_error:.4f}")
+        self.stdout.write(f"Recall@{k}: mean {recall:.3f}, worst query {min(recalls):.3f}")
+
+        if recall < options['min_recall']:
+            raise CommandError(f"Recall@{k} {recall:.3f} is below the required {options['min_recall']:.3f}; "
+                               f"keep EMBEDDING_MODEL_VARIANT='{options['reference']}'")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Variant '{options['variant']}' passes (recall@{k} >= {options['min_recall']:.3f})"
+        ))
+
+    def _embed(self, variant, documents, queries):
+        # One untimed pass loads the session
+        embed_texts(queries[:1], variant=variant)
+        started = time.perf_counter()
+        docs = embed_texts(documents, variant=variant)
+        query_vectors = embed_texts(queries, variant=variant)
+        return docs, query_vectors, time.perf_counter() - started
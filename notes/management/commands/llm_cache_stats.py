@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from assistu_project import llm_cache
+
+
+class Command(BaseCommand):
+    help = "Show LLM response cache hit rates per endpoint (all processes) and optionally prune it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help='Drop the oldest entries beyond LLM_CACHE_MAX_ENTRIES')
+        parser.add_argument('--reset', action='store_true', help='Clear the hit/miss counters')
+
+    def handle(self, *args, **options):
+        if options['prune']:
+            removed = llm_cache.prune()
+            self.stdout.write(f"Pruned {removed} cached responses")
+
+        entries = llm_cache.CachedLLMResponse.objects.count()
+        self.stdout.write(f"{entries} cached responses (max {llm_cache.CACHE_MAX_ENTRIES}, "
+                          f"TTL {llm_cache.CACHE_TTL}s)")
+        self.stdout.write(f"{'endpoint':<18}{'enabled':>9}{'hits':>10}{'misses':>10}{'hit rate':>10}")
+        shared = llm_cache.metrics()['all']
+        for endpoint in sorted(set(shared) | llm_cache.CACHE_ENDPOINTS):
+            stats = shared.get(endpoint, {'hits': 0, 'misses': 0, 'hit_rate': 0.0})
+            enabled = 'yes' if llm_cache.is_enabled(endpoint) else 'no'
+            self.stdout.write(f"{endpoint:<18}{enabled:>9}{stats['hits']:>10}{stats['misses']:>10}"
+                              f"{stats['hit_rate']:>10.1%}")
+
+        if options['reset']:
+            llm_cache.LLMCacheStats.objects.delete()
+            self.stdout.write("Counters reset")
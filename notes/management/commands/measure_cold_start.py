@@ -0,0 +1,44 @@
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Each probe runs in a fresh interpreter so nothing is already imported
+PROBES = {
+    'manage.py check': [sys.executable, 'manage.py', 'check'],
+    'ASGI app + URLconf': [sys.executable, '-c', (
+        "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'assistu_project.settings');"
+        "import assistu_project.asgi; from django.urls import get_resolver; get_resolver().url_patterns"
+    )],
+    'first embedding': [sys.executable, '-c', (
+        "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'assistu_project.settings');"
+        "import django; django.setup(); from notes.allMiniLm_utils import embed_texts; embed_texts(['cold start'])"
+    )],
+}
+
+
+class Command(BaseCommand):
+    help = "Measure cold-start time of manage.py, the ASGI app and the first embedding in fresh processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Fresh processes started per probe')
+
+    def handle(self, *args, **options):
+        repeat = max(1, options['repeat'])
+        self.stdout.write(f"{'probe':<22}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+
+        for name, command in PROBES.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = subprocess.run(command, cwd=settings.BASE_DIR, capture_output=True, text=True)
+                timings.append((time.perf_counter() - started) * 1000)
+                if result.returncode != 0:
+                    self.stderr.write(f"{name} failed:\n{result.stderr}")
+                    break
+            else:
+                self.stdout.write(f"{name:<22}{statistics.median(timings):>12.0f}"
+                                  f"{min(timings):>10.0f}{max(timings):>10.0f}")
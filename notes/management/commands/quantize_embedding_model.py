@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.allMiniLm_utils import model_path
+
+
+class Command(BaseCommand):
+    help = "Produce the graph-optimized, INT8 dynamically quantized variant of all-MiniLM-L6-v2"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-channel', action='store_true',
+                            help='Quantize weights per output channel (slower to build, usually more accurate)')
+        parser.add_argument('--output', default=None,
+                            help='Where to write the model (defaults to the "int8" variant path)')
+
+    def handle(self, *args, **options):
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            from onnxruntime.quantization.shape_inference import quant_pre_process
+        except ImportError as e:
+            raise CommandError(f"onnxruntime quantization tools are not available: {e}")
+
+        source = model_path('fp32')
+        output = options['output'] or model_path('int8')
+        if not os.path.exists(source):
+            raise CommandError(f"Source model not found: {source}")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Fold constants, fuse attention/layer-norm and infer shapes first so
+            # the quantizer sees the optimized graph
+            preprocessed = os.path.join(tmp_dir, 'model.preprocessed.onnx')
+            self.stdout.write("Optimizing graph...")
+            quant_pre_process(source, preprocessed, skip_symbolic_shape=False)
+
+            self.stdout.write("Quantizing weights to INT8...")
+            quantize_dynamic(
+                preprocessed,
+                output,
+                weight_type=QuantType.QInt8,
+                per_channel=options['per_channel'],
+            )
+
+        source_mb = os.path.getsize(source) / (1024 * 1024)
+        output_mb = os.path.getsize(output) / (1024 * 1024)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output} ({output_mb:.1f} MB, was {source_mb:.1f} MB). "
+            f"Run `manage.py evaluate_embedding_variant` before setting EMBEDDING_MODEL_VARIANT='int8'."
+        ))
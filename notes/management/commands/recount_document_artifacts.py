@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from notes.artifacts import recount_artifacts
+
+
+class Command(BaseCommand):
+    help = "Reset DocumentArtifact reference counts from the notes using them and delete unreferenced artifacts"
+
+    def handle(self, *args, **options):
+        kept, deleted = recount_artifacts()
+        self.stdout.write(self.style.SUCCESS(f"Kept {kept} artifacts, deleted {deleted}"))
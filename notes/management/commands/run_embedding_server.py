@@ -0,0 +1,45 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notes import allMiniLm_utils
+from notes.embedding_server import EmbeddingServer
+from notes.embedding_worker import EmbeddingBatcher
+
+
+class Command(BaseCommand):
+    help = "Own the ONNX embedding model in one process and serve Django workers over a Unix socket"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=allMiniLm_utils.EMBEDDING_SOCKET_PATH,
+                            help='Unix socket path (EMBEDDING_SOCKET_PATH)')
+        parser.add_argument('--no-batching', action='store_true',
+                            help='Run each client request as its own model call')
+
+    def handle(self, *args, **options):
+        # Always embed in this process, whatever EMBEDDING_BACKEND says
+        embed_fn = allMiniLm_utils.embed_texts_local
+        if not options['no_batching']:
+            # Requests from all connected workers share model calls
+            batcher = EmbeddingBatcher(
+                allMiniLm_utils.embed_texts_local,
+                max_batch_size=getattr(settings, "EMBEDDING_BATCH_MAX_SIZE", 32),
+                max_wait_ms=getattr(settings, "EMBEDDING_BATCH_MAX_WAIT_MS", 5),
+                timeout=getattr(settings, "EMBEDDING_BATCH_TIMEOUT", 10),
+            )
+            embed_fn = batcher.embed
+
+        self.stdout.write(f"Loading {allMiniLm_utils.model_path()}...")
+        allMiniLm_utils.embed_texts_local(["warm up"])
+
+        server = EmbeddingServer(options['socket'], embed_fn)
+        self.stdout.write(self.style.SUCCESS(f"Embedding server (pid {os.getpid()}) listening on {options['socket']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if os.path.exists(options['socket']):
+                os.unlink(options['socket'])
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notes.jobs import requeue_stale_jobs, run_next_job
+
+
+class Command(BaseCommand):
+    help = "Process queued PDF ingestion jobs from Mongo (for NOTE_JOB_MODE = 'worker')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Note worker started")
+        last_recovery = 0.0
+        while True:
+            if time.monotonic() - last_recovery > 60:
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    self.stdout.write(f"Re-queued {requeued} stale jobs")
+                last_recovery = time.monotonic()
+
+            if run_next_job():
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
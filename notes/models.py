@@ -1,5 +1,6 @@
 from mongoengine import Document, fields, CASCADE
 from users.models import User
+from datetime import datetime
 
 class Note(Document):
     user = fields.ReferenceField(User, reverse_delete_rule=CASCADE)
@@ -12,7 +13,89 @@ class Note(Document):
     keywords = fields.ListField(fields.StringField(), default=[])
     importance = fields.StringField(default='medium', choices=('low', 'medium', 'high'))
     tags = fields.ListField(fields.StringField(), default=[])
+    embedding = fields.BinaryField()  # float32 summary vector, see allMiniLm_utils.embedding_to_bytes
+    embedding_model = fields.StringField()  # model version the embedding was computed with
+    content_hash = fields.StringField(null=True)  # sha256 of the source PDF, see DocumentArtifact
     created_at = fields.DateTimeField(auto_now_add=True)
     updated_at = fields.DateTimeField(auto_now=True)
     
-    meta = {'collection': 'notes'}
\ No newline at end of file
+    meta = {
+        'collection': 'notes',
+        'indexes': [
+            {'fields': ['user', '-id']}  # newest first; created_at is not populated
+        ]
+    }
+
+class NoteJob(Document):
+    """Background ingestion of an uploaded PDF into a Note (see notes.jobs)"""
+    user = fields.ReferenceField(User, reverse_delete_rule=CASCADE)
+    title = fields.StringField(required=True)
+    subject = fields.StringField(required=True)
+    file_path = fields.StringField()  # stored upload, removed once the job finishes
+    content_hash = fields.StringField(null=True)  # sha256 of the upload
+    status = fields.StringField(default='queued', choices=('queued', 'running', 'completed', 'failed'))
+    stage = fields.StringField(default='queued')  # extracting, summarizing, tagging, embedding, saving, indexing
+    progress = fields.IntField(default=0)  # 0-100
+    attempts = fields.IntField(default=0)
+    retry_at = fields.DateTimeField(null=True)  # a failed job is not claimed again before this
+    note = fields.ReferenceField(Note, null=True)
+    error = fields.StringField()
+    created_at = fields.DateTimeField(default=datetime.utcnow)
+    updated_at = fields.DateTimeField(default=datetime.utcnow)
+    started_at = fields.DateTimeField(null=True)
+    finished_at = fields.DateTimeField(null=True)
+
+    meta = {
+        'collection': 'note_jobs',
+        'indexes': [
+            {'fields': ['status', 'created_at']},
+            {'fields': ['user', '-created_at']}
+        ]
+    }
+
+class NoteChunk(Document):
+    """A passage of a note's transcript with its own embedding (see notes.passages)"""
+    user = fields.ReferenceField(User, reverse_delete_rule=CASCADE)
+    note = fields.ReferenceField(Note, reverse_delete_rule=CASCADE)
+    position = fields.IntField(required=True)  # order within the note
+    text = fields.StringField()
+    start = fields.IntField()  # character offsets into Note.transcript
+    end = fields.IntField()
+    tokens = fields.IntField()
+    embedding = fields.BinaryField()  # float32, see allMiniLm_utils.embedding_to_bytes
+    embedding_model = fields.StringField()
+
+    meta = {
+        'collection': 'note_chunks',
+        'indexes': [
+            {'fields': ['user', 'note', 'position']},
+            {'fields': ['note']}
+        ]
+    }
+
+class DocumentArtifact(Document):
+    """
+    Ingestion results of one PDF, shared by every note created from an
+    identical upload (see notes.artifacts)
+    """
+    content_hash = fields.StringField(required=True, unique=True)  # sha256 of the PDF bytes
+    size = fields.IntField()
+    transcript = fields.StringField()
+    summary = fields.StringField()
+    explanation = fields.ListField(fields.StringField(), default=[])
+    categories = fields.ListField(fields.StringField(), default=[])
+    keywords = fields.ListField(fields.StringField(), default=[])
+    importance = fields.StringField(default='medium')
+    tags = fields.ListField(fields.StringField(), default=[])
+    embedding = fields.BinaryField()
+    embedding_model = fields.StringField()
+    # Transcript chunks as character offsets, plus one float32 (chunks x dim) matrix
+    chunk_starts = fields.ListField(fields.IntField(), default=[])
+    chunk_ends = fields.ListField(fields.IntField(), default=[])
+    chunk_tokens = fields.ListField(fields.IntField(), default=[])
+    chunk_embeddings = fields.BinaryField()
+    refcount = fields.IntField(default=0)  # notes referencing this artifact by content_hash
+    created_at = fields.DateTimeField(default=datetime.utcnow)
+    last_used_at = fields.DateTimeField(default=datetime.utcnow)
+
+    meta = {'collection': 'document_artifacts'}
@@ -0,0 +1,122 @@
+"""
+Passage-level search over note transcripts.
+
+At ingestion the transcript is split into sentence-aligned chunks
+(notes.chunking), each chunk is embedded and stored as a NoteChunk with its
+character offsets. Passage search scores every chunk of the user in one
+matrix-vector product (notes.vector_index.PassageVectorIndex) and returns
+notes ranked by their best chunk, with the max/mean chunk scores and the
+best passages of each note.
+"""
+import logging
+
+import numpy as np
+from bson import ObjectId
+
+from .allMiniLm_utils import (
+    EMBEDDING_MODEL_VERSION, SEARCH_RESULT_FIELDS, embed_query, embed_texts, embedding_to_bytes,
+)
+from .chunking import iter_chunks
+from .models import Note, NoteChunk
+from .vector_index import get_passage_index, index_note_passages
+
+logger = logging.getLogger(__name__)
+
+# Chunks embedded per call (the embedding path buckets them by length)
+CHUNK_EMBED_BATCH = 64
+
+
+def embed_note_chunks(note):
+    """
+    Chunk, embed and store a saved note's transcript, replacing any chunks it
+    already had. Returns the number of chunks stored.
+    """
+    NoteChunk.objects(note=note.id).delete()
+
+    documents = []
+    vectors = []
+    batch = []
+    for position, chunk in enumerate(iter_chunks(note.transcript or "")):
+        batch.append((position, chunk))
+        if len(batch) >= CHUNK_EMBED_BATCH:
+            _embed_batch(note, batch, documents, vectors)
+            batch = []
+    if batch:
+        _embed_batch(note, batch, documents, vectors)
+
+    if not documents:
+        return 0
+
+    chunk_ids = NoteChunk.objects.insert(documents, load_bulk=False)
+    index_note_passages(note.user.id, note.id, chunk_ids, np.vstack(vectors))
+    return len(documents)
+
+
+def _embed_batch(note, batch, documents, vectors):
+    embeddings = embed_texts([chunk.text for _, chunk in batch])
+    for (position, chunk), embedding in zip(batch, embeddings):
+        documents.append(NoteChunk(
+            user=note.user,
+            note=note,
+            position=position,
+            text=chunk.text,
+            start=chunk.start,
+            end=chunk.end,
+            tokens=chunk.tokens,
+            embedding=embedding_to_bytes(embedding),
+            embedding_model=EMBEDDING_MODEL_VERSION,
+        ))
+        vectors.append(embedding)
+
+
+def search_passages(user, query_text, limit=None, offset=0, min_score=None, passages=3):
+    """
+    Search note transcripts chunk by chunk
+
+    Returns:
+        (results, total) where results is a list of dicts with 'note',
+        'similarity' (best chunk, 0-100%), 'mean_similarity' (all chunks of
+        the note, 0-100%) and 'passages' ([{'text', 'start', 'end',
+        'similarity'}], best first), and total is the number of notes whose
+        best chunk passed min_score
+    """
+    index = get_passage_index(user)
+    if not len(index):
+        return [], 0
+
+    ranked, total = index.search(embed_query(query_text), k=limit, offset=offset,
+                                 min_score=min_score, passages=passages)
+    if not ranked:
+        return [], total
+
+    notes = Note.objects(id__in=[note_id for note_id, _, _, _ in ranked]).only(*SEARCH_RESULT_FIELDS)
+    notes_by_id = {str(note.id): note for note in notes}
+    chunk_ids = [ObjectId(chunk_id) for _, _, _, hits in ranked for chunk_id, _ in hits]
+    chunks = NoteChunk.objects(id__in=chunk_ids).only('id', 'text', 'start', 'end').as_pymongo()
+    chunks_by_id = {str(chunk['_id']): chunk for chunk in chunks}
+
+    results = []
+    for note_id, best, mean, hits in ranked:
+        if note_id not in notes_by_id:
+            continue
+        results.append({
+            'note': notes_by_id[note_id],
+            'similarity': best * 100,
+            'mean_similarity': mean * 100,
+            'passages': [{
+                'text': chunks_by_id[chunk_id]['text'],
+                'start': chunks_by_id[chunk_id]['start'],
+                'end': chunks_by_id[chunk_id]['end'],
+                'similarity': score * 100,
+            } for chunk_id, score in hits if chunk_id in chunks_by_id],
+        })
+    return results, total
+
+
+def store_note_chunks(note):
+    """embed_note_chunks for ingestion: a failure leaves the note searchable by summary"""
+    try:
+        return embed_note_chunks(note)
+    except Exception:
+        logger.exception("Embedding passages of note %s failed", note.id)
+        return 0
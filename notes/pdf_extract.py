@@ -0,0 +1,106 @@
+"""
+PDF text extraction.
+
+Pages are read one at a time from a generator and joined once, so memory
+stays proportional to the extracted text rather than to repeated string
+copies. Files are opened by path whenever one exists (stored uploads and
+Django's TemporaryUploadedFile), so PyMuPDF maps the file itself instead of
+a second in-memory copy.
+
+Large documents can be split into page ranges handled by a process pool.
+This module deliberately imports nothing from Django so pool workers start
+without loading the project.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def open_pdf(pdf_file):
+    """Open a path, an upload with a temporary file path, or an in-memory upload"""
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return fitz.open(pdf_file, filetype="pdf")
+    if hasattr(pdf_file, "temporary_file_path"):
+        return fitz.open(pdf_file.temporary_file_path(), filetype="pdf")
+    # Small uploads are already in memory; hand the bytes over as they are
+    return fitz.open(stream=pdf_file.read(), filetype="pdf")
+
+
+def pdf_path(pdf_file):
+    """Filesystem path of the PDF, or None for in-memory uploads"""
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return os.fspath(pdf_file)
+    if hasattr(pdf_file, "temporary_file_path"):
+        return pdf_file.temporary_file_path()
+    return None
+
+
+def iter_pages(doc, start=0, stop=None):
+    """Yield the text of pages [start, stop) of an open document"""
+    stop = len(doc) if stop is None else min(stop, len(doc))
+    for page_num in range(start, stop):
+        yield doc.load_page(page_num).get_text()
+
+
+def extract_page_range(path, start, stop):
+    """Pool task: text of pages [start, stop) of the PDF at path"""
+    with fitz.open(path, filetype="pdf") as doc:
+        return list(iter_pages(doc, start, stop))
+
+
+def _get_pool(processes):
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: forking a process that already runs threads and Mongo clients is unsafe
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+            _pool_size = processes
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the pool's workers (needed before a multiprocessing child exits)"""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool, _pool_size = None, 0
+
+
+def page_ranges(page_count, parts):
+    """Split page_count pages into at most `parts` contiguous (start, stop) ranges"""
+    parts = max(1, min(parts, page_count))
+    size, extra = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for part in range(parts):
+        stop = start + size + (1 if part < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def extract_text(pdf_file, processes=0, min_pages=200):
+    """
+    Text of every page, each followed by a newline. With processes > 1, PDFs
+    on disk with at least min_pages pages are split across a process pool.
+    """
+    with open_pdf(pdf_file) as doc:
+        path = pdf_path(pdf_file)
+        if processes > 1 and path is not None and len(doc) >= min_pages:
+            ranges = page_ranges(len(doc), processes * 2)
+            pool = _get_pool(processes)
+            futures = [pool.submit(extract_page_range, path, start, stop) for start, stop in ranges]
+            pages = (page for future in futures for page in future.result())
+        else:
+            pages = iter_pages(doc)
+        return "".join(page + "\n" for page in pages)
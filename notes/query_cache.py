@@ -0,0 +1,98 @@
+"""
+Bounded LRU + TTL cache of search query embeddings.
+
+Keys combine the model fingerprint with the normalized query text, so the
+same question typed with different casing or spacing, retried, or asked by
+another student reuses one tokenizer + ONNX pass. The default backend is
+in-process and shared across request threads; setting
+QUERY_EMBEDDING_CACHE_BACKEND to a Django cache alias (e.g. one backed by
+Redis or Memcached) shares entries across uvicorn workers instead.
+"""
+import hashlib
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from assistu_project.caching import LocalCache
+
+
+def normalize_query(text):
+    """Case-fold and collapse whitespace; the MiniLM tokenizer is uncased anyway"""
+    return " ".join(text.casefold().split())
+
+
+class DjangoCacheBackend:
+    """Stores float32 bytes in a configured Django cache so workers share entries"""
+
+    def __init__(self, alias, ttl):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, key):
+        data = self.cache.get(key)
+        if data is None:
+            return None
+        return np.frombuffer(data, dtype=np.float32)
+
+    def set(self, key, vector, timeout=None):
+        timeout = self.ttl if timeout is None else timeout
+        self.cache.set(key, np.asarray(vector, dtype=np.float32).tobytes(), timeout)
+
+    def __len__(self):
+        # Not tracked for shared caches
+        return -1
+
+
+class QueryEmbeddingCache:
+    def __init__(self, backend, model_fingerprint):
+        self.backend = backend
+        self.model_fingerprint = model_fingerprint
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, normalized):
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        return f"query-embedding:{self.model_fingerprint}:{digest}"
+
+    def get_or_compute(self, text, compute):
+        """Return the cached vector for text, computing and storing it on a miss"""
+        normalized = normalize_query(text)
+        key = self.key(normalized)
+
+        vector = self.backend.get(key)
+        with self._lock:
+            if vector is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        if vector is not None:
+            return vector
+
+        vector = np.asarray(compute(normalized), dtype=np.float32)
+        # Cached vectors are shared between threads
+        vector.setflags(write=False)
+        self.backend.set(key, vector)
+        return vector
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": len(self.backend),
+            }
+
+
+def build_query_cache(model_fingerprint):
+    ttl = getattr(settings, "QUERY_EMBEDDING_CACHE_TTL", 3600)
+    alias = getattr(settings, "QUERY_EMBEDDING_CACHE_BACKEND", None)
+    if alias:
+        backend = DjangoCacheBackend(alias, ttl)
+    else:
+        backend = LocalCache(getattr(settings, "QUERY_EMBEDDING_CACHE_SIZE", 2048), ttl)
+    return QueryEmbeddingCache(backend, model_fingerprint)
@@ -4,8 +4,10 @@ from . import views
 urlpatterns = [
     path('all/', views.get_all_notes, name='get_all_notes'),
     path('create/pdf/', views.create_note_from_pdf, name='create_note_from_pdf'),
+    path('jobs/<str:job_id>/', views.get_note_job, name='get_note_job'),
     path('create/text/', views.create_note_from_text, name='create_note_from_text'),
     path('search-notes/', views.search_notes, name='search_notes'),
+    path('search-metrics/', views.search_metrics, name='search_metrics'),
 
     path('<str:note_id>/', views.get_note_by_id, name='get_note_by_id'),
     path('delete/<str:note_id>', views.delete_note, name='delete_note'),
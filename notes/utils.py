@@ -1,60 +1,147 @@
-import fitz  # PyMuPDF
-import json
-import requests
+import logging
+from assistu_project.llm import chat_completion, json_content, LLMError
+from assistu_project.executors import LazyExecutor
 from django.conf import settings
 from .models import Note
+from .allMiniLm_utils import embed_note, count_tokens
+from .vector_index import index_note
+from .passages import store_note_chunks
+from .lexical_index import index_note_terms
+from users.stats import record_change
+from tasks.dashboard import invalidate_dashboard
+from .artifacts import DEDUP_ENABLED, content_hash, note_from_artifact, share_artifact
+from .pdf_extract import extract_text
+from .chunking import iter_chunks
 from datetime import datetime
+from concurrent.futures import wait, FIRST_COMPLETED
+
+# How the summary and tag LLM calls are issued for a new note; see generate_note_content
+METADATA_STRATEGY = getattr(settings, "NOTE_METADATA_STRATEGY", "parallel")
+# "map_reduce" summarizes the whole document (see summary_source); "excerpt"
+# only sends the opening SUMMARY_INPUT_TOKENS
+SUMMARY_MODE = getattr(settings, "NOTE_SUMMARY_MODE", "map_reduce")
+# Source tokens sent in one LLM call, counted with the local tokenizer
+SUMMARY_INPUT_TOKENS = getattr(settings, "NOTE_SUMMARY_INPUT_TOKENS", 3000)
+# Section summaries in flight at once for a single document
+SUMMARY_MAP_CONCURRENCY = getattr(settings, "NOTE_SUMMARY_MAP_CONCURRENCY", 4)
+# Process pool size for page-parallel PDF extraction (0 = extract in the calling thread)
+PDF_PROCESSES = getattr(settings, "NOTE_PDF_PROCESSES", 0)
+PDF_PARALLEL_MIN_PAGES = getattr(settings, "NOTE_PDF_PARALLEL_MIN_PAGES", 200)
+
+logger = logging.getLogger(__name__)
+
+_llm_executor = LazyExecutor(getattr(settings, "NOTE_LLM_THREADS", 8), "note-llm")
 
 def extract_text_from_pdf(pdf_file):
-    """Extract text from uploaded PDF file"""
+    """Extract text from an uploaded PDF file or the path of a stored one"""
     try:
-        file_content = pdf_file.read()
-        from io import BytesIO
-        pdf_stream = BytesIO(file_content)
-        doc = fitz.open(stream=pdf_stream, filetype="pdf")
-        text = ""
-        
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text += page.get_text() + "\n"
-        
-        doc.close()
-        return text
+        return extract_text(pdf_file, processes=PDF_PROCESSES, min_pages=PDF_PARALLEL_MIN_PAGES)
     except Exception as e:
         raise Exception(f"Error extracting text from PDF: {str(e)}")
 
-def chunk_text(text, chunk_size=1000):
-    """Split text into chunks separated by sentences"""
-    sentences = text.split('. ')
-    chunks = []
-    current_chunk = ""
-    
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) < chunk_size:
-            current_chunk += sentence + ". "
-        else:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            current_chunk = sentence + ". "
-    
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    
-    return chunks
+def group_chunks(texts, token_counts, max_tokens=None):
+    """
+    Pack consecutive texts, whose token counts are given, into groups of at
+    most max_tokens tokens each (a single oversized text forms its own group)
+    """
+    max_tokens = max_tokens or SUMMARY_INPUT_TOKENS
+    groups = []
+    current, current_tokens = [], 0
+    for chunk, tokens in zip(texts, token_counts):
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(chunk)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def _source_groups(text_chunks):
+    """SUMMARY_INPUT_TOKENS sections of the source, from the token counts iter_chunks already made"""
+    return group_chunks([chunk.text for chunk in text_chunks], [chunk.tokens for chunk in text_chunks])
 
-def generate_summary_with_llm(text_chunks):
-    """Generate summary from text chunks using LLM"""
-    llm_url = getattr(settings, "GROQ_LLM_URL", "https://api.groq.com/openai/v1/chat/completions").strip()  # Removed extra spaces
-    api_key = settings.GROQ_API_KEY
+def source_excerpt(text_chunks):
+    """The opening SUMMARY_INPUT_TOKENS of the source text"""
+    groups = _source_groups(text_chunks)
+    return " ".join(groups[0]) if groups else ""
+
+def summary_source(text_chunks, mode=None):
+    """
+    Text the summary is generated from, given the source's notes.chunking
+    Chunks. In "map_reduce" mode a document that
+    does not fit in one call is split into SUMMARY_INPUT_TOKENS sections that
+    are summarized in parallel; the section summaries are regrouped and
+    reduced again until they fit, so every page is covered and latency grows
+    with the number of levels rather than the number of pages.
+    """
+    mode = mode or SUMMARY_MODE
+    if mode != "map_reduce":
+        return source_excerpt(text_chunks)
     
-    if not api_key:
-        raise Exception("GROQ_API_KEY is not set in settings")
+    groups = _source_groups(text_chunks)
+    while len(groups) > 1:
+        partials = _map_bounded(summarize_section, [" ".join(group) for group in groups])
+        partials = [partial for partial in partials if partial]
+        regrouped = group_chunks(partials, count_tokens(partials) if partials else [])
+        if not regrouped:
+            # Every section summary came back empty; use the opening section as is
+            regrouped = groups[:1]
+        elif len(regrouped) >= len(groups):
+            # Sections are not getting shorter; fall back to the opening ones
+            regrouped = regrouped[:1]
+        groups = regrouped
+    return " ".join(groups[0]) if groups else ""
+
+def _map_bounded(fn, items, limit=None):
+    """fn over items on the LLM pool with at most `limit` calls in flight, in order"""
+    limit = limit or SUMMARY_MAP_CONCURRENCY
+    executor = _llm_executor.get()
+    results = [None] * len(items)
+    pending = {}
+    for position, item in enumerate(items):
+        if len(pending) >= limit:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+        pending[executor.submit(fn, item)] = position
+    for future, position in pending.items():
+        results[position] = future.result()
+    return results
+
+def summarize_section(text):
+    """Map step: condensed summary of one section of a longer document"""
+    prompt = f"""
+    This is one section of a longer document. Summarize it in 3-5 sentences, keeping key facts, definitions and terms. Return ONLY this JSON format:
+    {{
+        "summary": "summary text"
+    }}
     
-    full_text = " ".join(text_chunks[:3]) if len(text_chunks) > 3 else " ".join(text_chunks)
+    Text: {text}
+    """
     
-    # Limit text length
-    if len(full_text) > 3000:
-        full_text = full_text[:3000]
+    payload = {
+        "model": "llama-3.3-70b-versatile",
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant that returns only valid JSON."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 300,
+        "temperature": 0.2,
+        "response_format": {"type": "json_object"}
+    }
+
+    try:
+        return chat_completion(payload, timeout=30, cache="notes.summary_map", parse=json_content).get('summary', '')
+        
+    except LLMError as e:
+        raise Exception(f"API request failed: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Error summarizing section: {str(e)}")
+
+def generate_summary_with_llm(text_chunks, source_text=None):
+    """Generate summary from text chunks (or an already prepared summary_source) using LLM"""
+    full_text = source_text if source_text is not None else summary_source(text_chunks)
     
     prompt = f"""
     Summarize this text in 2-3 sentences and provide key explanations as bullet points. Return ONLY this JSON format:
@@ -77,54 +164,26 @@ def generate_summary_with_llm(text_chunks):
         "response_format": {"type": "json_object"}
     }
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
     try:
-        res = requests.post(llm_url, json=payload, headers=headers, timeout=30)
-        res.raise_for_status()
-        
-        data = res.json()
-        
-        if "choices" not in data or len(data["choices"]) == 0:
-            raise Exception("No choices in response")
-        
-        content = data["choices"][0]["message"]["content"].strip()
-        
-        # Clean response
-        if content.startswith('```json'):
-            content = content[7:]
-        if content.startswith('```'):
-            content = content[3:]
-        if content.endswith('```'):
-            content = content[:-3]
-        content = content.strip()
-        
-        result = json.loads(content)
+        result = chat_completion(payload, timeout=30, cache="notes.summary", parse=json_content)
         return result.get('summary', ''), result.get('explanation', [])
         
-    except requests.exceptions.RequestException as e:
+    except LLMError as e:
         raise Exception(f"API request failed: {str(e)}")
-    except json.JSONDecodeError:
-        raise Exception(f"Invalid JSON response: {content}")
     except Exception as e:
         raise Exception(f"Error generating summary: {str(e)}")
 
-def generate_tags_with_llm(summary):
-    """Generate tags from summary using LLM"""
-    llm_url = getattr(settings, "GROQ_LLM_URL", "https://api.groq.com/openai/v1/chat/completions").strip()  # Removed extra spaces
-    api_key = settings.GROQ_API_KEY
-    
-    if not api_key:
-        raise Exception("GROQ_API_KEY is not set in settings")
-    
-    if len(summary) > 1000:
-        summary = summary[:1000]
+def generate_tags_with_llm(summary, source="summary", max_chars=1000):
+    """
+    Generate tags from summary using LLM. With source="text" the tags are
+    generated from the source excerpt instead, so the call does not have to
+    wait for the summary.
+    """
+    if len(summary) > max_chars:
+        summary = summary[:max_chars]
     
     prompt = f"""
-    From this summary: {summary}
+    From this {source}: {summary}
     Return ONLY this JSON format:
     {{
         "tags": ["tag1", "tag2"],
@@ -145,32 +204,8 @@ def generate_tags_with_llm(summary):
         "response_format": {"type": "json_object"}
     }
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
     try:
-        res = requests.post(llm_url, json=payload, headers=headers, timeout=30)
-        res.raise_for_status()
-        
-        data = res.json()
-        
-        if "choices" not in data or len(data["choices"]) == 0:
-            raise Exception("No choices in response")
-        
-        content = data["choices"][0]["message"]["content"].strip()
-        
-        # Clean response
-        if content.startswith('```json'):
-            content = content[7:]
-        if content.startswith('```'):
-            content = content[3:]
-        if content.endswith('```'):
-            content = content[:-3]
-        content = content.strip()
-        
-        result = json.loads(content)
+        result = chat_completion(payload, timeout=30, cache="notes.tags", parse=json_content)
         return {
             'tags': result.get('tags', []),
             'categories': result.get('categories', ['General']),
@@ -178,26 +213,97 @@ def generate_tags_with_llm(summary):
             'importance': result.get('importance', 'medium')
         }
         
-    except requests.exceptions.RequestException as e:
+    except LLMError as e:
         raise Exception(f"API request failed: {str(e)}")
-    except json.JSONDecodeError:
-        raise Exception(f"Invalid JSON response: {content}")
     except Exception as e:
         raise Exception(f"Error generating tags: {str(e)}")
 
+def generate_note_content_with_llm(text_chunks, source_text=None):
+    """Generate summary, explanation and tags in one structured-output call"""
+    full_text = source_text if source_text is not None else summary_source(text_chunks)
+    
+    prompt = f"""
+    Summarize this text in 2-3 sentences, provide key explanations as bullet points and classify it. Return ONLY this JSON format:
+    {{
+        "summary": "summary text",
+        "explanation": ["bullet point 1", "bullet point 2", "bullet point 3"],
+        "tags": ["tag1", "tag2"],
+        "categories": ["cat1"],
+        "keywords": ["keyword1", "keyword2"],
+        "importance": "low|medium|high"
+    }}
+    
+    Text: {full_text}
+    """
+    
+    payload = {
+        "model": "llama-3.3-70b-versatile",
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant that returns only valid JSON."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 800,
+        "temperature": 0.3,
+        "response_format": {"type": "json_object"}
+    }
+
+    try:
+        result = chat_completion(payload, timeout=30, cache="notes.content", parse=json_content)
+        metadata = {
+            'tags': result.get('tags', []),
+            'categories': result.get('categories', ['General']),
+            'keywords': result.get('keywords', []),
+            'importance': result.get('importance', 'medium')
+        }
+        return result.get('summary', ''), result.get('explanation', []), metadata
+        
+    except LLMError as e:
+        raise Exception(f"API request failed: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Error generating note content: {str(e)}")
 
-def process_pdf_note(user, pdf_file, title, subject):
-    """Process PDF file and create a Note"""
-    pdf_text = extract_text_from_pdf(pdf_file)
+def generate_note_content(text_chunks, strategy=None, progress=None, summary_mode=None):
+    """
+    Summary, explanation and tag metadata for a note, using one of:
+    - "sequential": summary call, then tags from the summary (two round-trips)
+    - "parallel": summary and tags-from-source calls in flight together
+    - "combined": one structured-output call returning everything
+    """
+    strategy = strategy or METADATA_STRATEGY
     
-    if not pdf_text.strip():
-        raise ValueError("PDF contains no readable text")
+    # Long documents are condensed (map-reduce) once, before any strategy runs
+    _report(progress, 'summarizing', 30)
+    source_text = summary_source(text_chunks, summary_mode)
     
-    text_chunks = chunk_text(pdf_text)
-    transcript = ", ".join(text_chunks)
+    if strategy == 'combined':
+        return generate_note_content_with_llm(text_chunks, source_text)
     
-    summary, explanation = generate_summary_with_llm(text_chunks)
-    metadata = generate_tags_with_llm(summary)
+    if strategy == 'parallel':
+        tags_future = _llm_executor.get().submit(
+            generate_tags_with_llm, source_text, "text", 3000
+        )
+        summary, explanation = generate_summary_with_llm(text_chunks, source_text)
+        return summary, explanation, tags_future.result()
+    
+    summary, explanation = generate_summary_with_llm(text_chunks, source_text)
+    _report(progress, 'tagging', 60)
+    return summary, explanation, generate_tags_with_llm(summary)
+
+
+def _report(progress, stage, percent):
+    if progress is not None:
+        progress(stage, percent)
+
+def build_note(user, title, text, subject, progress=None, source_hash=None):
+    """
+    Summarize, tag and embed source text and save it as a Note.
+    `progress(stage, percent)` is called as each step starts.
+    """
+    text_chunks = list(iter_chunks(text))
+    # Stored as extracted, so chunk offsets (notes.chunking) index into it
+    transcript = text
+    
+    summary, explanation, metadata = generate_note_content(text_chunks, progress=progress)
     
     note = Note(
         user=user,
@@ -209,37 +315,49 @@ def process_pdf_note(user, pdf_file, title, subject):
         categories=metadata['categories'],
         keywords=metadata['keywords'],
         importance=metadata['importance'],
-        tags=metadata['tags']
+        tags=metadata['tags'],
+        content_hash=source_hash
     )
     
+    # Embed once at creation so search only has to embed the query
+    _report(progress, 'embedding', 85)
+    embed_note(note)
+    _report(progress, 'saving', 90)
     note.save()
+    # The note exists from here on: a failing cache or index update must not
+    # fail the job, whose retry would build a second note. Loaded indexes
+    # missing it are rebuilt from Mongo once their TTL expires.
+    record_change(user.id, notes=1)
+    try:
+        invalidate_dashboard(user.id)
+        index_note(note)
+        index_note_terms(note)
+    except Exception:
+        logger.exception("Indexing note %s failed", note.id)
+    # Passage embeddings of the transcript, for detail-level search
+    _report(progress, 'indexing', 93)
+    store_note_chunks(note)
     return note
 
-def create_note_from_text(user, title, text, subject):
-    """Create a note from provided text"""
-    if not text.strip():
-        raise ValueError("Text content cannot be empty")
-    
-    text_chunks = chunk_text(text)
-    transcript = ", ".join(text_chunks)
+def process_pdf_note(user, pdf_file, title, subject, progress=None, source_hash=None):
+    """
+    Process PDF file (upload or stored path) and create a Note. A PDF seen
+    before is copied from its DocumentArtifact (see notes.artifacts).
+    """
+    if DEDUP_ENABLED:
+        source_hash = source_hash or content_hash(pdf_file)
+        note = note_from_artifact(user, source_hash, title, subject)
+        if note is not None:
+            return note
     
-    summary, explanation = generate_summary_with_llm(text_chunks)
-    metadata = generate_tags_with_llm(summary)
+    _report(progress, 'extracting', 10)
+    pdf_text = extract_text_from_pdf(pdf_file)
     
-    note = Note(
-        user=user,
-        title=title,
-        transcript=transcript,
-        summary=summary,
-        explanation=explanation,
-        subject=subject,
-        categories=metadata['categories'],
-        keywords=metadata['keywords'],
-        importance=metadata['importance'],
-        tags=metadata['tags']
-    )
+    if not pdf_text.strip():
+        raise ValueError("PDF contains no readable text")
     
-    note.save()
+    note = build_note(user, title, pdf_text, subject, progress, source_hash)
+    share_artifact(note, pdf_file)
     return note
 
 def create_note_from_text(user, title, text, subject):
@@ -247,22 +365,4 @@ def create_note_from_text(user, title, text, subject):
     if not text.strip():
         raise ValueError("Text content cannot be empty")
     
-    text_chunks = chunk_text(text)
-    transcript = ", ".join(text_chunks)
-    
-    summary = generate_summary_with_llm(text_chunks)
-    metadata = generate_tags_with_llm(summary)
-    
-    note = Note(
-        user=user,
-        title=title,
-        transcript=transcript,
-        summary=summary,
-        subject=subject,
-        categories=metadata['categories'],
-        importance=metadata['importance'],
-        tags=metadata['tags']
-    )
-    
-    note.save()
-    return note
\ No newline at end of file
+    return build_note(user, title, text, subject)
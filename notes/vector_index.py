@@ -0,0 +1,413 @@
+"""
+In-process per-user vector index for semantic note search.
+
+Each user's note embeddings live in one contiguous float32 matrix with a
+parallel array of note ids, so scoring every note is a single matrix-vector
+product and the top-k comes from `argpartition`. Indexes are built lazily
+from Mongo on first search (e.g. after a restart), updated incrementally when
+notes are created or deleted, and kept in an LRU bounded by a memory budget.
+
+PassageVectorIndex does the same for transcript chunks (notes.passages),
+ranking notes by their best-matching chunk.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from bson import ObjectId
+from django.conf import settings
+
+# Memory budget shared by all cached user indexes (bytes)
+MAX_INDEX_BYTES = getattr(settings, "NOTES_VECTOR_INDEX_MAX_BYTES", 256 * 1024 * 1024)
+# Rebuild an index from Mongo after this many seconds so writes handled by
+# other worker processes become visible
+INDEX_TTL_SECONDS = getattr(settings, "NOTES_VECTOR_INDEX_TTL", 300)
+# Separate budget for chunk-level indexes, which hold many rows per note
+MAX_PASSAGE_INDEX_BYTES = getattr(settings, "NOTES_PASSAGE_INDEX_MAX_BYTES", 512 * 1024 * 1024)
+
+OBJECT_ID_DTYPE = "<U24"
+
+
+def top_k(scores, k=None, offset=0):
+    """Positions of the ranks [offset, offset + k) of scores, best first (k=None for all)"""
+    total = len(scores)
+    end = total if k is None else min(total, offset + k)
+    if offset >= end:
+        return np.empty(0, dtype=np.intp)
+    if end < total:
+        # Only the first `end` positions need to be ordered
+        top = np.argpartition(-scores, end - 1)[:end]
+    else:
+        top = np.arange(total)
+    return top[np.argsort(-scores[top], kind='stable')][offset:end]
+
+
+class UserVectorIndex:
+    """Contiguous embedding matrix plus parallel note id array for one user"""
+
+    def __init__(self, dim, capacity=16):
+        self.dim = dim
+        self.size = 0
+        self.matrix = np.empty((capacity, dim), dtype=np.float32)
+        self.ids = np.empty(capacity, dtype=OBJECT_ID_DTYPE)
+        self.built_at = time.monotonic()
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, ids, matrix):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        index = cls(matrix.shape[1], capacity=max(16, len(ids)))
+        index.size = len(ids)
+        index.matrix[:index.size] = matrix
+        index.ids[:index.size] = ids
+        index._positions = {note_id: row for row, note_id in enumerate(index.ids[:index.size])}
+        return index
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + self.ids.nbytes
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        capacity = max(16, len(self.ids) * 2)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        ids = np.empty(capacity, dtype=OBJECT_ID_DTYPE)
+        matrix[:self.size] = self.matrix[:self.size]
+        ids[:self.size] = self.ids[:self.size]
+        self.matrix, self.ids = matrix, ids
+
+    def add(self, note_id, embedding):
+        """Insert or replace the vector for a note"""
+        note_id = str(note_id)
+        with self._lock:
+            row = self._positions.get(note_id)
+            if row is None:
+                if self.size == len(self.ids):
+                    self._grow()
+                row = self.size
+                self.size += 1
+                self.ids[row] = note_id
+                self._positions[note_id] = row
+            self.matrix[row] = embedding
+
+    def remove(self, note_id):
+        """Drop a note by moving the last row into its slot"""
+        note_id = str(note_id)
+        with self._lock:
+            row = self._positions.pop(note_id, None)
+            if row is None:
+                return False
+            last = self.size - 1
+            if row != last:
+                self.matrix[row] = self.matrix[last]
+                self.ids[row] = self.ids[last]
+                self._positions[str(self.ids[row])] = row
+            self.size = last
+            return True
+
+    def search(self, query_embedding, k=None, offset=0, min_score=None):
+        """
+        Score every note against the query and return one page of the ranking
+        as (results, total) where results is a list of (note_id, cosine_similarity),
+        best first, and total is how many notes reached min_score
+        """
+        with self._lock:
+            if self.size == 0:
+                return [], 0
+            scores = self.matrix[:self.size] @ np.asarray(query_embedding, dtype=np.float32)
+            ids = self.ids[:self.size].copy()
+
+        candidates = np.arange(len(scores))
+        if min_score is not None:
+            candidates = np.flatnonzero(scores >= min_score)
+        total = len(candidates)
+
+        candidate_scores = scores[candidates]
+        top = top_k(candidate_scores, k, offset)
+        return [(str(ids[candidates[i]]), float(candidate_scores[i])) for i in top], total
+
+
+class PassageVectorIndex:
+    """
+    Chunk embeddings of one user's notes. The chunks of a note occupy one
+    contiguous run of rows, so per-note max/mean scores are `reduceat` calls
+    over a single matrix-vector product.
+    """
+
+    def __init__(self, dim, capacity=64):
+        self.dim = dim
+        self.size = 0
+        self.matrix = np.empty((capacity, dim), dtype=np.float32)
+        self.chunk_ids = np.empty(capacity, dtype=OBJECT_ID_DTYPE)
+        self.labels = np.empty(capacity, dtype=np.int32)
+        self.note_ids = []  # label -> note id
+        self.built_at = time.monotonic()
+        self._labels = {}  # note id -> label
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, chunk_ids, note_ids, matrix):
+        """Build from rows already grouped by note"""
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        index = cls(matrix.shape[1], capacity=max(64, len(chunk_ids)))
+        index.size = len(chunk_ids)
+        index.matrix[:index.size] = matrix
+        index.chunk_ids[:index.size] = chunk_ids
+        index.labels[:index.size] = [index._label(str(note_id)) for note_id in note_ids]
+        return index
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + self.chunk_ids.nbytes + self.labels.nbytes
+
+    def __len__(self):
+        return self.size
+
+    def _label(self, note_id):
+        label = self._labels.get(note_id)
+        if label is None:
+            label = len(self.note_ids)
+            self.note_ids.append(note_id)
+            self._labels[note_id] = label
+        return label
+
+    def _reserve(self, rows):
+        needed = self.size + rows
+        if needed <= len(self.chunk_ids):
+            return
+        capacity = max(64, len(self.chunk_ids) * 2, needed)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        chunk_ids = np.empty(capacity, dtype=OBJECT_ID_DTYPE)
+        labels = np.empty(capacity, dtype=np.int32)
+        matrix[:self.size] = self.matrix[:self.size]
+        chunk_ids[:self.size] = self.chunk_ids[:self.size]
+        labels[:self.size] = self.labels[:self.size]
+        self.matrix, self.chunk_ids, self.labels = matrix, chunk_ids, labels
+
+    def _remove(self, note_id):
+        label = self._labels.get(note_id)
+        if label is None:
+            return False
+        keep = np.flatnonzero(self.labels[:self.size] != label)
+        if len(keep) < self.size:
+            # Compacting preserves row order, so every note stays one run
+            self.matrix[:len(keep)] = self.matrix[keep]
+            self.chunk_ids[:len(keep)] = self.chunk_ids[keep]
+            self.labels[:len(keep)] = self.labels[keep]
+            self.size = len(keep)
+        return True
+
+    def add_note(self, note_id, chunk_ids, matrix):
+        """Insert or replace all chunks of a note"""
+        note_id = str(note_id)
+        with self._lock:
+            self._remove(note_id)
+            rows = len(chunk_ids)
+            if not rows:
+                return
+            self._reserve(rows)
+            end = self.size + rows
+            self.matrix[self.size:end] = matrix
+            self.chunk_ids[self.size:end] = [str(chunk_id) for chunk_id in chunk_ids]
+            self.labels[self.size:end] = self._label(note_id)
+            self.size = end
+
+    def remove_note(self, note_id):
+        with self._lock:
+            return self._remove(str(note_id))
+
+    def search(self, query_embedding, k=None, offset=0, min_score=None, passages=3):
+        """
+        Rank notes by their best chunk and return one page as (results, total).
+        Each result is (note_id, max_score, mean_score, [(chunk_id, score), ...])
+        with up to `passages` best chunks; total counts notes whose best chunk
+        reached min_score.
+        """
+        with self._lock:
+            if self.size == 0:
+                return [], 0
+            scores = self.matrix[:self.size] @ np.asarray(query_embedding, dtype=np.float32)
+            labels = self.labels[:self.size]
+            starts = np.flatnonzero(np.concatenate(([True], labels[1:] != labels[:-1])))
+            ends = np.append(starts[1:], self.size)
+            best = np.maximum.reduceat(scores, starts)
+            mean = np.add.reduceat(scores, starts) / (ends - starts)
+
+            runs = np.arange(len(starts))
+            if min_score is not None:
+                runs = np.flatnonzero(best >= min_score)
+            total = len(runs)
+            page = runs[top_k(best[runs], k, offset)]
+
+            results = []
+            for run in page:
+                start, end = starts[run], ends[run]
+                top = top_k(scores[start:end], passages)
+                results.append((
+                    self.note_ids[labels[start]],
+                    float(best[run]),
+                    float(mean[run]),
+                    [(str(self.chunk_ids[start + row]), float(scores[start + row])) for row in top],
+                ))
+            return results, total
+
+
+class VectorIndexCache:
+    """Thread-safe LRU of user indexes bounded by total matrix memory"""
+
+    def __init__(self, max_bytes=MAX_INDEX_BYTES, ttl=INDEX_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                return None
+            if self.ttl and time.monotonic() - index.built_at > self.ttl:
+                del self._indexes[user_id]
+                return None
+            self._indexes.move_to_end(user_id)
+            return index
+
+    def put(self, user_id, index):
+        """Cache an index, keeping one that was stored concurrently if present"""
+        with self._lock:
+            existing = self._indexes.get(user_id)
+            if existing is not None:
+                self._indexes.move_to_end(user_id)
+                return existing
+            self._indexes[user_id] = index
+            self._evict()
+            return index
+
+    def discard(self, user_id):
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(index.nbytes for index in self._indexes.values())
+
+    def _evict(self):
+        # Never evicts the most recently used entry, so a single user larger
+        # than the budget still gets served
+        total = sum(index.nbytes for index in self._indexes.values())
+        while total > self.max_bytes and len(self._indexes) > 1:
+            _, evicted = self._indexes.popitem(last=False)
+            total -= evicted.nbytes
+
+
+_cache = VectorIndexCache()
+_passage_cache = VectorIndexCache(max_bytes=MAX_PASSAGE_INDEX_BYTES)
+
+
+def build_user_index(user_id):
+    """Load every embedded note of a user from Mongo into a fresh index"""
+    from .models import Note
+    from .allMiniLm_utils import EMBEDDING_DIM, embedding_from_bytes, ensure_embeddings
+
+    notes = list(
+        Note.objects(user=ObjectId(user_id), summary__nin=[None, ''])
+        .only('id', 'user', 'summary', 'embedding', 'embedding_model')
+        .no_dereference()
+    )
+    ensure_embeddings(notes)
+
+    if not notes:
+        return UserVectorIndex(EMBEDDING_DIM)
+
+    ids = [str(note.id) for note in notes]
+    matrix = np.vstack([embedding_from_bytes(note.embedding) for note in notes])
+    return UserVectorIndex.from_arrays(ids, matrix)
+
+
+def get_user_index(user):
+    """Return the cached index for a user, building it from Mongo if needed"""
+    user_id = str(getattr(user, 'id', user))
+    index = _cache.get(user_id)
+    if index is None:
+        index = _cache.put(user_id, build_user_index(user_id))
+    return index
+
+
+def index_note(note):
+    """Add a freshly saved note to its owner's indexes if they are loaded"""
+    from .allMiniLm_utils import embedding_from_bytes, has_current_embedding
+    from .ann_index import ann_index_note
+    from .embedding_store import store_note
+
+    ann_index_note(note)
+    store_note(note)
+
+    index = _cache.get(str(note.user.id))
+    if index is None:
+        # Not loaded; the next search builds it from Mongo including this note
+        return
+    if has_current_embedding(note):
+        index.add(note.id, embedding_from_bytes(note.embedding))
+    else:
+        index.remove(note.id)
+
+
+def unindex_note(user_id, note_id):
+    """Remove a deleted note from its owner's indexes if they are loaded"""
+    from .ann_index import ann_unindex_note
+    from .embedding_store import unstore_note
+
+    ann_unindex_note(user_id, note_id)
+    unstore_note(note_id, user_id)
+    index = _cache.get(str(user_id))
+    if index is not None:
+        index.remove(note_id)
+    passage_index = _passage_cache.get(str(user_id))
+    if passage_index is not None:
+        passage_index.remove_note(note_id)
+
+
+def build_passage_index(user_id):
+    """Load every current-model chunk embedding of a user from Mongo"""
+    from .models import NoteChunk
+    from .allMiniLm_utils import EMBEDDING_DIM, EMBEDDING_MODEL_VERSION
+
+    chunks = list(
+        NoteChunk.objects(user=ObjectId(user_id), embedding_model=EMBEDDING_MODEL_VERSION)
+        .order_by('note', 'position')
+        .only('id', 'note', 'embedding')
+        .as_pymongo()
+    )
+    if not chunks:
+        return PassageVectorIndex(EMBEDDING_DIM)
+
+    matrix = np.frombuffer(b''.join(chunk['embedding'] for chunk in chunks), dtype=np.float32)
+    return PassageVectorIndex.from_arrays(
+        [str(chunk['_id']) for chunk in chunks],
+        [str(chunk['note']) for chunk in chunks],
+        matrix.reshape(len(chunks), EMBEDDING_DIM),
+    )
+
+
+def get_passage_index(user):
+    """Return the cached chunk index for a user, building it from Mongo if needed"""
+    user_id = str(getattr(user, 'id', user))
+    index = _passage_cache.get(user_id)
+    if index is None:
+        index = _passage_cache.put(user_id, build_passage_index(user_id))
+    return index
+
+
+def index_note_passages(user_id, note_id, chunk_ids, matrix):
+    """Add (or replace) a note's chunks in its owner's chunk index if loaded"""
+    index = _passage_cache.get(str(user_id))
+    if index is not None:
+        index.add_note(note_id, chunk_ids, matrix)
@@ -1,28 +1,42 @@
+import logging
+
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.decorators import parser_classes
-from .models import Note
-from .utils import process_pdf_note, create_note_from_text
+from .models import Note, NoteJob
+from .jobs import enqueue_pdf_job
+from .utils import process_pdf_note
+from .utils import create_note_from_text as create_text_note
 from bson import ObjectId
+from django.conf import settings
+
+from .allMiniLm_utils import search_similar_notes, get_embedding_metrics
+from .passages import search_passages
+from .hybrid_search import search_lexical_notes, search_hybrid_notes
+from .vector_index import unindex_note
+from .lexical_index import unindex_note_terms
+from .artifacts import release_artifact
+from users.stats import record_change
+from tasks.dashboard import invalidate_dashboard
+from assistu_project import read_models
+
+logger = logging.getLogger(__name__)
 
-from .allMiniLm_utils import search_similar_notes
+SEARCH_DEFAULT_LIMIT = getattr(settings, 'NOTES_SEARCH_DEFAULT_LIMIT', 20)
+SEARCH_MAX_LIMIT = getattr(settings, 'NOTES_SEARCH_MAX_LIMIT', 100)
+SEARCH_MAX_PASSAGES = getattr(settings, 'NOTES_SEARCH_MAX_PASSAGES', 10)
+SEARCH_MODES = ('summary', 'passage', 'lexical', 'hybrid')
+SEARCH_DEFAULT_MODE = getattr(settings, 'NOTES_SEARCH_DEFAULT_MODE', 'summary')
+# Return 202 + job id for PDF uploads instead of processing inside the request
+INGESTION_ASYNC = getattr(settings, 'NOTE_INGESTION_ASYNC', True)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_all_notes(request):
     user = request.user
-    notes = Note.objects(user=user)
-    return Response({
-        'notes': [{
-            'id': str(n.id),
-            'title': n.title,
-            'subject': n.subject,
-            'importance': n.importance,
-            'created_at': n.created_at
-        } for n in notes]
-    })
+    return Response({'notes': read_models.list_notes(user)})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -76,15 +90,63 @@ def create_note_from_pdf(request):
     title = request.data.get('title', 'Untitled Note')
     subject = request.data.get('subject', 'General')
     
+    if not INGESTION_ASYNC:
+        try:
+            note = process_pdf_note(user, pdf_file, title, subject)
+            return Response({
+                'message': 'Note created from PDF',
+                'id': str(note.id),
+                'title': note.title
+            })
+        except Exception as e:
+            return Response({'error': str(e)}, status=400)
+    
+    # Extraction, LLM calls and embedding run in the background; poll the job
     try:
-        note = process_pdf_note(user, pdf_file, title, subject)
+        job = enqueue_pdf_job(user, pdf_file, title, subject)
+    except Exception as e:
+        return Response({'error': f'Could not queue PDF: {str(e)}'}, status=500)
+    
+    # A PDF uploaded before completes immediately from its DocumentArtifact
+    if job.status == 'completed':
         return Response({
             'message': 'Note created from PDF',
-            'id': str(note.id),
-            'title': note.title
-        })
-    except Exception as e:
-        return Response({'error': str(e)}, status=400)
+            'id': str(job.note.id),
+            'title': job.note.title,
+            'job_id': str(job.id),
+            'status': job.status
+        }, status=201)
+    
+    return Response({
+        'message': 'Note processing started',
+        'job_id': str(job.id),
+        'status': job.status,
+        'title': job.title
+    }, status=202)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_note_job(request, job_id):
+    user = request.user
+    try:
+        job = NoteJob.objects(id=ObjectId(job_id), user=user).exclude('file_path').first()
+    except Exception:
+        return Response({'error': 'Invalid job ID'}, status=400)
+    
+    if not job:
+        return Response({'error': 'Job not found'}, status=404)
+    
+    return Response({
+        'id': str(job.id),
+        'title': job.title,
+        'status': job.status,
+        'stage': job.stage,
+        'progress': job.progress,
+        'note_id': str(job.note.id) if job.note else None,
+        'error': job.error,
+        'created_at': job.created_at,
+        'updated_at': job.updated_at
+    })
     
 
 @api_view(['POST'])
@@ -102,7 +164,7 @@ def create_note_from_text(request):
         return Response({'error': 'Text content is required'}, status=400)
     
     try:
-        note = create_note_from_text(user, title, text, subject)
+        note = create_text_note(user, title, text, subject)
         return Response({
             'message': 'Note created',
             'id': str(note.id),
@@ -117,13 +179,23 @@ def delete_note(request, note_id):
     user = request.user
     try:
         note = Note.objects(id=ObjectId(note_id), user=user).first()
-        if not note:
-            return Response({'error': 'Note not found'}, status=404)
-        
-        note.delete()
-        return Response({'message': 'Note deleted'})
     except Exception:
         return Response({'error': 'Invalid note ID'}, status=400)
+    if not note:
+        return Response({'error': 'Note not found'}, status=404)
+    
+    note.delete()
+    # The note is gone; a failing cleanup step must not turn that into an error response
+    for cleanup in (lambda: record_change(user.id, notes=-1),
+                    lambda: invalidate_dashboard(user.id),
+                    lambda: unindex_note(user.id, note_id),
+                    lambda: unindex_note_terms(user.id, note_id),
+                    lambda: release_artifact(note.content_hash)):
+        try:
+            cleanup()
+        except Exception:
+            logger.exception("Cleanup after deleting note %s failed", note_id)
+    return Response({'message': 'Note deleted'})
     
 # ---------------------------------------------------------------------------------------
 # ---------------------------------------------------------------------------------------
@@ -134,44 +206,117 @@ def delete_note(request, note_id):
 def search_notes(request):
     """
     Search notes using semantic similarity
-    Returns ALL notes with relevance scores (0-100%), sorted by relevance
+    Returns one page of notes with relevance scores (0-100%), sorted by relevance
     
     Request body:
     {
         "query": "search text",
-        "threshold": 0.2  // optional, kept for backward compatibility (not used for filtering)
+        "mode": "summary",  // optional, "summary" (embeddings), "passage" (embeddings of
+                            // transcript chunks), "lexical" (BM25) or "hybrid" (BM25 + embeddings)
+        "limit": 20,        // optional, page size (max NOTES_SEARCH_MAX_LIMIT)
+        "offset": 0,        // optional, pass back `next_offset` for the next page
+        "min_score": 0.2,   // optional, minimum cosine similarity (0-1)
+        "threshold": 0.2,   // optional, legacy alias for min_score
+        "passages": 3       // optional, passage mode: best passages returned per note
     }
+    
+    In passage mode relevance_score is the best passage's score, mean_score the
+    average over all of the note's passages, and each result carries its best
+    passages with start/end offsets into the transcript. In lexical mode it is
+    the BM25 score (unbounded) and min_score is ignored; in hybrid mode it is
+    the fused rank score (100 = first in both rankings), with vector_score and
+    lexical_score alongside, and min_score filters the embedding candidates.
     """
     user = request.user
     query = request.data.get('query', '').strip()
-    threshold = float(request.data.get('threshold', 0.2))
+    mode = request.data.get('mode', SEARCH_DEFAULT_MODE)
     
     if not query:
         return Response({'error': 'Query text is required'}, status=400)
     
-    # Validate threshold (kept for backward compatibility)
-    if not 0 <= threshold <= 1:
-        return Response({'error': 'Threshold must be between 0 and 1'}, status=400)
+    if mode not in SEARCH_MODES:
+        return Response({'error': f'Mode must be one of {", ".join(SEARCH_MODES)}'}, status=400)
+    
+    try:
+        passages = int(request.data.get('passages', 3))
+        limit = int(request.data.get('limit', SEARCH_DEFAULT_LIMIT))
+        offset = int(request.data.get('offset', 0))
+        min_score = request.data.get('min_score', request.data.get('threshold'))
+        min_score = float(min_score) if min_score is not None else None
+    except (TypeError, ValueError):
+        return Response({'error': 'limit, offset, min_score and passages must be numbers'}, status=400)
     
-    # Get all notes with relevance scores
-    results = search_similar_notes(user, query, threshold)
+    if not 1 <= limit <= SEARCH_MAX_LIMIT:
+        return Response({'error': f'Limit must be between 1 and {SEARCH_MAX_LIMIT}'}, status=400)
+    
+    if offset < 0:
+        return Response({'error': 'Offset cannot be negative'}, status=400)
+    
+    if min_score is not None and not 0 <= min_score <= 1:
+        return Response({'error': 'Min score must be between 0 and 1'}, status=400)
+    
+    if not 1 <= passages <= SEARCH_MAX_PASSAGES:
+        return Response({'error': f'Passages must be between 1 and {SEARCH_MAX_PASSAGES}'}, status=400)
+    
+    if mode == 'passage':
+        results, total = search_passages(user, query, limit=limit, offset=offset,
+                                         min_score=min_score, passages=passages)
+    elif mode == 'lexical':
+        results, total = search_lexical_notes(user, query, limit=limit, offset=offset)
+    elif mode == 'hybrid':
+        results, total = search_hybrid_notes(user, query, limit=limit, offset=offset, min_score=min_score)
+    else:
+        results, total = search_similar_notes(user, query, limit=limit, offset=offset, min_score=min_score)
+    next_offset = offset + limit if offset + limit < total else None
+    
+    serialized = []
+    for result in results:
+        item = {
+            'id': str(result['note'].id),
+            'title': result['note'].title,
+            'subject': result['note'].subject,
+            'summary': result['note'].summary,
+            'importance': result['note'].importance,
+            'relevance_score': round(result['similarity'], 2),  # 0-100% relevance score
+            'created_at': result['note'].created_at,
+            'keywords': result['note'].keywords,
+            'tags': result['note'].tags
+        }
+        if mode == 'passage':
+            item['mean_score'] = round(result['mean_similarity'], 2)
+            item['passages'] = [{
+                'text': passage['text'],
+                'start': passage['start'],
+                'end': passage['end'],
+                'relevance_score': round(passage['similarity'], 2)
+            } for passage in result['passages']]
+        elif mode == 'hybrid':
+            item['vector_score'] = (round(result['vector_similarity'], 2)
+                                    if result['vector_similarity'] is not None else None)
+            item['lexical_score'] = (round(result['lexical_score'], 2)
+                                     if result['lexical_score'] is not None else None)
+        serialized.append(item)
         
     return Response({
             'query': query,
+            'mode': mode,
             'count': len(results),
-            'results': [{
-                'id': str(result['note'].id),
-                'title': result['note'].title,
-                'subject': result['note'].subject,
-                'summary': result['note'].summary,
-                'importance': result['note'].importance,
-                'relevance_score': round(result['similarity'], 2),  # 0-100% relevance score
-                'created_at': result['note'].created_at,
-                'keywords': result['note'].keywords,
-                'tags': result['note'].tags
-            } for result in results]
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'next_offset': next_offset,
+            'results': serialized
     })
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_metrics(request):
+    """
+    Embedding micro-batching and query cache counters of the worker process
+    that serves the request
+    """
+    return Response(get_embedding_metrics())
+
 # def search_notes(request):
 #     """
 #     Search notes using semantic similarity
@@ -18,6 +18,6 @@ class StudyPlan(Document):
     meta = {
         'collection': 'study_plans',
         'indexes': [
-            {'fields': ['user']}
+            {'fields': ['user', '-id']}  # newest first; created_at is not populated
         ]
     }
\ No newline at end of file
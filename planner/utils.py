@@ -1,6 +1,6 @@
 import json
-import requests
-from django.conf import settings
+from assistu_project.llm import chat_completion, json_with_fields, LLMError
+from tasks.dashboard import invalidate_dashboard
 from .models import StudyPlan
 from bson import ObjectId
 from datetime import datetime
@@ -11,9 +11,6 @@ def plan_from_llm(user, plan_description):
     """
     Calls the LLM to generate a structured StudyPlan based on the user's description.
     """
-    llm_url = getattr(settings, "GROQ_LLM_URL", "https://api.groq.com/openai/v1/chat/completions").strip()
-    api_key = settings.GROQ_API_KEY
-    
     # Generate schema description for the LLM
     session_schema = json.dumps({
         "subject": "string", 
@@ -21,10 +18,12 @@ def plan_from_llm(user, plan_description):
         "goal": "string"
     })
     
+    current_date = datetime.now().strftime("%Y-%m-%d")
+
     prompt = f"""
     You are a professional study planner. The user wants to create a comprehensive study plan based on this description: "{plan_description}"
 
-    Current date: {datetime.now().strftime("%Y-%m-%d")}
+    Current date: {current_date}
 
     Return ONLY a valid JSON object with these exact fields:
     {{
@@ -69,29 +68,10 @@ def plan_from_llm(user, plan_description):
         "response_format": {"type": "json_object"}
     }
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
     try:
-        res = requests.post(llm_url, json=payload, headers=headers, timeout=45)
-        res.raise_for_status()
-        
-        data = res.json()
-        content = data["choices"][0]["message"]["content"].strip()
-        
-        # Clean response (remove markdown fences if LLM fails to honor the prompt)
-        if content.startswith('```json'): content = content[7:].strip()
-        if content.endswith('```'): content = content[:-3].strip()
-        
-        event_data = json.loads(content)
-        
-        # Validate required fields
-        required_fields = ['title', 'duration', 'sessions']
-        for f in required_fields:
-            if f not in event_data:
-                raise ValueError(f"LLM response missing required field: {f}")
+        # Replies without the required fields raise ValueError and are not cached
+        event_data = chat_completion(payload, timeout=45, cache="planner.create", cache_scope=current_date,
+                                     parse=json_with_fields('title', 'duration', 'sessions'))
         
         # Create StudyPlan instance
         study_plan = StudyPlan(
@@ -102,7 +82,7 @@ def plan_from_llm(user, plan_description):
         )
         return study_plan
         
-    except requests.exceptions.RequestException as e:
+    except LLMError as e:
         raise ValueError(f"Failed to connect to LLM service: {str(e)}")
     except Exception as e:
         raise ValueError(f"Error processing LLM response: {str(e)}")
@@ -132,9 +112,10 @@ def delete_plan(user, plan_id):
     if not plan:
         raise ValueError("StudyPlan not found or access denied")
     plan.delete()
+    invalidate_dashboard(user.id)
     return True
 
 def get_user_plans(user):
     """Retrieves all StudyPlans for a given user."""
-    # Orders by creation date, most recent first
-    return list(StudyPlan.objects(user=user).order_by('-created_at'))
\ No newline at end of file
+    # Most recent first (by ObjectId, created_at is not populated)
+    return list(StudyPlan.objects(user=user).order_by('-id'))
\ No newline at end of file
@@ -1,7 +1,9 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .utils import plan_from_llm, get_user_plans, delete_plan, get_plan_by_id_and_user
+from tasks.dashboard import invalidate_dashboard
+from assistu_project import read_models
+from .utils import plan_from_llm, delete_plan, get_plan_by_id_and_user
 
 # Helper function to serialize the StudyPlan object
 def serialize_plan(plan):
@@ -22,8 +24,7 @@ def list_and_create_plan(request):
     
     if request.method == "GET":
         # GET: List all plans for the user
-        plans = get_user_plans(user)
-        return Response([serialize_plan(p) for p in plans])
+        return Response(read_models.list_plans(user))
 
     elif request.method == "POST":
         # POST: Create a new plan from LLM prompt
@@ -36,6 +37,7 @@ def list_and_create_plan(request):
             # Plan is generated by the LLM utility
             study_plan = plan_from_llm(user, plan_description)
             study_plan.save()
+            invalidate_dashboard(user.id)
             return Response(
                 {"success": True, "plan": serialize_plan(study_plan)}, 
                 status=201 # HTTP 201 Created
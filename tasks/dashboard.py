@@ -0,0 +1,196 @@
+"""
+Dashboard v2: capped, paginated sections built from projected raw documents.
+
+Each section (latest notes, tasks due and events starting in the next
+DASHBOARD_WINDOW_DAYS, latest study plans) is one projected query plus a
+count, and the four sections are queried concurrently. Notes are previews -
+title, tags and the first DASHBOARD_PREVIEW_CHARS of the summary, cut
+server-side - never transcripts or explanations; plans carry their session
+count instead of the sessions.
+
+The first page (no offsets, default limit) is cached per user for
+DASHBOARD_CACHE_TTL seconds and dropped by invalidate_dashboard, which the
+note, task, event and plan write paths call. The default cache is
+in-process, so other workers may serve a stale page until the TTL; setting
+DASHBOARD_CACHE_BACKEND to a shared Django cache alias invalidates across
+workers.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+
+from assistu_project.caching import LocalCache
+from assistu_project.executors import LazyExecutor
+
+DEFAULT_LIMIT = getattr(settings, "DASHBOARD_SECTION_LIMIT", 10)
+MAX_LIMIT = getattr(settings, "DASHBOARD_SECTION_MAX_LIMIT", 50)
+WINDOW_DAYS = getattr(settings, "DASHBOARD_WINDOW_DAYS", 30)
+PREVIEW_CHARS = getattr(settings, "DASHBOARD_PREVIEW_CHARS", 280)
+CACHE_TTL = getattr(settings, "DASHBOARD_CACHE_TTL", 60)
+CACHE_SIZE = getattr(settings, "DASHBOARD_CACHE_SIZE", 1024)
+CACHE_BACKEND = getattr(settings, "DASHBOARD_CACHE_BACKEND", None)
+
+SECTIONS = ('notes', 'tasks', 'events', 'study_plans')
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_executor = LazyExecutor(len(SECTIONS), "dashboard")
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if CACHE_BACKEND:
+                    from django.core.cache import caches
+                    _cache = caches[CACHE_BACKEND]
+                else:
+                    _cache = LocalCache(CACHE_SIZE, CACHE_TTL)
+    return _cache
+
+
+def _cache_key(user_id):
+    return f"dashboard:v2:{user_id}"
+
+
+def invalidate_dashboard(user_id):
+    """Drop a user's cached dashboard after one of their notes, tasks, events or plans changed"""
+    if CACHE_TTL:
+        _get_cache().delete(_cache_key(user_id))
+
+
+def _page(collection, match, sort, projection, offset, limit):
+    """One projected page of a section and the section's total"""
+    items = list(collection.aggregate([
+        {'$match': match},
+        {'$sort': sort},
+        {'$skip': offset},
+        {'$limit': limit},
+        {'$project': projection},
+    ]))
+    total = collection.count_documents(match)
+    next_offset = offset + len(items)
+    return {
+        'items': items,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset if next_offset < total else None,
+    }
+
+
+def _created_at(document):
+    # created_at is not populated on these documents; the ObjectId holds the insert time
+    return document.get('created_at') or document['_id'].generation_time
+
+
+def _note_section(user_id, offset, limit):
+    from notes.models import Note
+
+    section = _page(Note._get_collection(), {'user': user_id}, {'_id': -1}, {
+        'title': 1, 'subject': 1, 'importance': 1, 'tags': 1, 'created_at': 1,
+        'preview': {'$substrCP': [{'$ifNull': ['$summary', '']}, 0, PREVIEW_CHARS]},
+    }, offset, limit)
+    section['items'] = [{
+        'id': str(note['_id']),
+        'title': note.get('title'),
+        'subject': note.get('subject'),
+        'importance': note.get('importance'),
+        'tags': note.get('tags', []),
+        'preview': note.get('preview', ''),
+        'created_at': _created_at(note),
+    } for note in section['items']]
+    return section
+
+
+def _task_section(user_id, start, end, offset, limit):
+    from tasks.models import Task
+
+    section = _page(Task._get_collection(), {'user': user_id, 'due_date': {'$gte': start, '$lte': end}},
+                    {'due_date': 1}, {'title': 1, 'subject': 1, 'type': 1, 'priority': 1, 'status': 1,
+                                      'due_date': 1, 'estimated_duration': 1, 'tags': 1}, offset, limit)
+    section['items'] = [{
+        'id': str(task['_id']),
+        'title': task.get('title'),
+        'subject': task.get('subject'),
+        'type': task.get('type'),
+        'priority': task.get('priority'),
+        'status': task.get('status'),
+        'due_date': task.get('due_date'),
+        'estimated_duration': task.get('estimated_duration'),
+        'tags': task.get('tags', []),
+    } for task in section['items']]
+    return section
+
+
+def _event_section(user_id, start, end, offset, limit):
+    from events.models import Event
+
+    section = _page(Event._get_collection(), {'user': user_id, 'start_time': {'$gte': start, '$lte': end}},
+                    {'start_time': 1}, {'title': 1, 'event_type': 1, 'start_time': 1, 'end_time': 1,
+                                        'related_task': 1}, offset, limit)
+    section['items'] = [{
+        'id': str(event['_id']),
+        'title': event.get('title'),
+        'event_type': event.get('event_type'),
+        'start_time': event.get('start_time'),
+        'end_time': event.get('end_time'),
+        'related_task': str(event['related_task']) if event.get('related_task') else None,
+    } for event in section['items']]
+    return section
+
+
+def _plan_section(user_id, offset, limit):
+    from planner.models import StudyPlan
+
+    section = _page(StudyPlan._get_collection(), {'user': user_id}, {'_id': -1}, {
+        'title': 1, 'duration': 1, 'created_at': 1, 'updated_at': 1,
+        'session_count': {'$size': {'$ifNull': ['$sessions', []]}},
+    }, offset, limit)
+    section['items'] = [{
+        'id': str(plan['_id']),
+        'title': plan.get('title'),
+        'duration': plan.get('duration'),
+        'session_count': plan.get('session_count', 0),
+        'created_at': _created_at(plan),
+        'updated_at': plan.get('updated_at'),
+    } for plan in section['items']]
+    return section
+
+
+def build_dashboard(user_id, offsets=None, limit=None):
+    """
+    The dashboard payload of a user: {section: {items, total, offset, limit,
+    next_offset}} for each of SECTIONS. offsets maps section -> offset; the
+    first page with the default limit is served from the per-user cache.
+    """
+    user_id = ObjectId(str(user_id))
+    offsets = {section: max(0, int((offsets or {}).get(section) or 0)) for section in SECTIONS}
+    limit = min(max(1, limit or DEFAULT_LIMIT), MAX_LIMIT)
+    cacheable = CACHE_TTL and limit == DEFAULT_LIMIT and not any(offsets.values())
+
+    if cacheable:
+        cached = _get_cache().get(_cache_key(user_id))
+        if cached is not None:
+            return cached
+
+    now = datetime.now()
+    end = now + timedelta(days=WINDOW_DAYS)
+    executor = _executor.get()
+    futures = {
+        'notes': executor.submit(_note_section, user_id, offsets['notes'], limit),
+        'tasks': executor.submit(_task_section, user_id, now, end, offsets['tasks'], limit),
+        'events': executor.submit(_event_section, user_id, now, end, offsets['events'], limit),
+        'study_plans': executor.submit(_plan_section, user_id, offsets['study_plans'], limit),
+    }
+    payload = {section: future.result() for section, future in futures.items()}
+    payload['window_days'] = WINDOW_DAYS
+    payload['generated_at'] = now
+
+    if cacheable:
+        _get_cache().set(_cache_key(user_id), payload, CACHE_TTL)
+    return payload
@@ -17,7 +17,13 @@ class Task(Document):
     completed_at = fields.DateTimeField(null=True)
     original_command = fields.StringField()
 
-    meta = {'collection': 'tasks'}
+    meta = {
+        'collection': 'tasks',
+        'indexes': [
+            {'fields': ['user', 'due_date']},
+            {'fields': ['user', 'status']}
+        ]
+    }
 
 # from mongoengine import Document, fields
 # from users.models import User
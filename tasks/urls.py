@@ -14,6 +14,7 @@ urlpatterns = [
     # Get all tasks for logged-in user
     path('user/', views.user_tasks_view, name='user_tasks'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/v2/', views.dashboard_v2, name='dashboard_v2'),
     
     # Get single task by ID
     path('<str:task_id>/', views.task_detail_view, name='task_detail'),
@@ -1,14 +1,11 @@
-import json
-import requests
-from django.conf import settings
+from assistu_project.llm import chat_completion, json_with_fields, LLMError
+from users.stats import record_change
+from .dashboard import invalidate_dashboard
 from .models import Task
-from datetime import datetime
+from datetime import datetime, timedelta
 from bson import ObjectId  # for ObjectId validation
 
 def generate_task_from_llm(user, task_description):
-    llm_url = getattr(settings, "GROQ_LLM_URL", "https://api.groq.com/openai/v1/chat/completions").strip()
-    api_key = settings.GROQ_API_KEY
-
     prompt = f"""
     You are a professional task planner. The user wants to create a task with this description: "{task_description}"
 
@@ -53,51 +50,12 @@ def generate_task_from_llm(user, task_description):
         "response_format": {"type": "json_object"}  # Force JSON response
     }
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-
     try:
-        res = requests.post(llm_url, json=payload, headers=headers, timeout=30)
-        res.raise_for_status()
-        
-        data = res.json()
-        
-        if "choices" not in data or len(data["choices"]) == 0:
-            raise ValueError("Invalid API response: no choices returned")
-        
-        content = data["choices"][0]["message"]["content"]
-        
-        if not content:
-            raise ValueError("Empty response from LLM")
-        
-        print(f"Raw LLM response: {content}")  # Debug
-        
-        # Clean the response - remove any markdown code blocks
-        content = content.strip()
-        if content.startswith('```json'):
-            content = content[7:]  # Remove ```json
-        if content.startswith('```'):
-            content = content[3:]  # Remove ```
-        if content.endswith('```'):
-            content = content[:-3]  # Remove ```
-        content = content.strip()
-        
-        if not content:
-            raise ValueError("Cleaned response is empty")
-        
-        try:
-            task_data = json.loads(content)
-        except json.JSONDecodeError:
-            print(f"Failed to parse JSON: {content}")
-            raise ValueError(f"Invalid JSON response from LLM")
-        
-        # Validate required fields
-        required_fields = ['title', 'subject', 'type', 'priority', 'status', 'due_date']
-        for f in required_fields:
-            if f not in task_data:
-                raise ValueError(f"LLM response missing required field: {f}")
+        # The prompt has no date, but relative due dates ("by Friday") depend on it
+        # Replies without the required fields raise ValueError and are not cached
+        task_data = chat_completion(payload, timeout=30, cache="tasks.create",
+                                    cache_scope=datetime.now().strftime("%Y-%m-%d"),
+                                    parse=json_with_fields('title', 'subject', 'type', 'priority', 'status', 'due_date'))
 
         # Validate field values
         valid_types = ['assignment', 'study', 'project', 'exam']
@@ -148,7 +106,7 @@ def generate_task_from_llm(user, task_description):
         task = Task(user=user, **task_data)
         return task
         
-    except requests.exceptions.RequestException as e:
+    except LLMError as e:
         print(f"API request error: {e}")
         raise ValueError(f"Failed to connect to LLM service: {str(e)}")
     except Exception as e:
@@ -168,6 +126,8 @@ def delete_task(user, task_id):
     if not task or task.user.id != user.id:
         raise ValueError("Task not found or access denied")
     task.delete()
+    record_change(user.id, tasks=-1, task_statuses={task.status: -1})
+    invalidate_dashboard(user.id)
     return True
 
 
@@ -176,12 +136,16 @@ def update_task(user, task_id, update_data):
     if not task or task.user.id != user.id:
         raise ValueError("Task not found or access denied")
     
+    old_status = task.status
     for key, value in update_data.items():
         if hasattr(task, key):
             if key == "due_date":
                 value = datetime.fromisoformat(value)
             setattr(task, key, value)
     task.save()
+    if task.status != old_status:
+        record_change(user.id, task_statuses={old_status: -1, task.status: 1})
+    invalidate_dashboard(user.id)
     return task
 
 
@@ -8,7 +8,11 @@ from tasks.models import Task
 from events.models import Event
 from planner.models import StudyPlan
 
-from .utils import generate_task_from_llm, delete_task, update_task, get_user_tasks, get_task_by_id
+from users.stats import record_change
+from assistu_project import read_models
+
+from .dashboard import build_dashboard, invalidate_dashboard, SECTIONS
+from .utils import generate_task_from_llm, delete_task, update_task, get_task_by_id
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -21,6 +25,8 @@ def create_task(request):
     try: 
         task = generate_task_from_llm(user, task_description)
         task.save()
+        record_change(user.id, tasks=1, task_statuses={task.status: 1})
+        invalidate_dashboard(user.id)
         return Response({"message": "Task created with title", "id": str(task.id), "title": str(task.title)})
     except Exception as e:
         return Response({"error": str(e)}, status=400)
@@ -60,15 +66,7 @@ def update_task_view(request):
 @permission_classes([IsAuthenticated])
 def user_tasks_view(request):
     user = request.user
-    tasks = get_user_tasks(user)
-    return Response({"tasks": [{
-        "id": str(t.id),
-        "title": t.title,
-        "subject": t.subject,
-        "status": t.status,
-        "priority": t.priority,
-        "due_date": t.due_date
-    } for t in tasks]})
+    return Response({"tasks": read_models.list_tasks(user)})
 
 
 @api_view(['GET'])
@@ -105,7 +103,7 @@ def dashboard(request):
     next_month_end = now + timedelta(days=30)
     
     # Get all notes for the user
-    all_notes = Note.objects(user=user.id).order_by('-created_at')
+    all_notes = Note.objects(user=user.id).order_by('-id')
     notes_count = all_notes.count()
     
     notes_data = [
@@ -177,7 +175,7 @@ def dashboard(request):
     # Get all study plans (event plans) within the next month
     # Note: StudyPlan doesn't have a date field, so we'll get all plans for the user
     # If you want to filter by date, you'll need to add a date field to StudyPlan model
-    study_plans = StudyPlan.objects(user=user.id).order_by('-created_at')
+    study_plans = StudyPlan.objects(user=user.id).order_by('-id')
     
     plans_data = [
         {
@@ -197,4 +195,23 @@ def dashboard(request):
         "tasks_next_month": tasks_data,
         "events_next_month": events_data,
         "study_plans": plans_data
-    })
\ No newline at end of file
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def dashboard_v2(request):
+    """
+    Capped, paginated dashboard sections with note previews (see tasks.dashboard)
+
+    Query params: limit (items per section), notes_offset, tasks_offset,
+    events_offset, study_plans_offset - pass back a section's `next_offset`
+    to page through it.
+    """
+    user = request.user
+    try:
+        limit = int(request.query_params['limit']) if 'limit' in request.query_params else None
+        offsets = {section: int(request.query_params.get(f'{section}_offset', 0)) for section in SECTIONS}
+    except (TypeError, ValueError):
+        return Response({"error": "limit and offsets must be integers"}, status=400)
+    
+    return Response(build_dashboard(user.id, offsets=offsets, limit=limit))
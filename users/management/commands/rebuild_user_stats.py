@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from users.models import User
+from users.stats import seed_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized profile counters (user_stats) of every user, or one with --user"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Rebuild this user id only')
+
+    def handle(self, *args, **options):
+        user_ids = [options['user']] if options['user'] else User.objects.scalar('id')
+        done = 0
+        for user_id in user_ids:
+            seed_counters(user_id, replace=True)
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt statistics of {done} users"))
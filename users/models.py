@@ -22,4 +22,15 @@ class User(Document):
         self.password = make_password(password)
     
     def check_password(self, password):
-        return check_password(password, self.password)
\ No newline at end of file
+        return check_password(password, self.password)
+
+class UserStats(Document):
+    """Materialized profile counters of one user, see users.stats"""
+    user = fields.ObjectIdField(primary_key=True)
+    notes = fields.IntField(default=0)
+    tasks = fields.IntField(default=0)
+    events = fields.IntField(default=0)
+    task_statuses = fields.DictField()  # status -> number of tasks
+    updated_at = fields.DateTimeField()
+
+    meta = {'collection': 'user_stats'}
@@ -0,0 +1,123 @@
+"""
+Per-user statistics for the profile endpoint.
+
+By default they are aggregated on request: one pipeline per collection
+(notes and events are counted, tasks are grouped by status), with the three
+collections queried concurrently.
+
+With USER_STATS_MATERIALIZED on, a UserStats document per user holds the
+counters and the profile is a single point read. The note, task and event
+write paths call record_change to increment it; a user's document is seeded
+from the aggregation on their first profile read. Increments for users
+without a document are dropped, so a write that races the seeding can be
+missed - `manage.py rebuild_user_stats` recomputes every document.
+"""
+import logging
+from datetime import datetime
+
+from bson import ObjectId
+from django.conf import settings
+
+from assistu_project.executors import LazyExecutor
+
+from .models import UserStats
+
+logger = logging.getLogger(__name__)
+
+MATERIALIZED = getattr(settings, "USER_STATS_MATERIALIZED", False)
+
+_executor = LazyExecutor(3, "user-stats")
+
+
+def _count(model, user_id):
+    rows = list(model._get_collection().aggregate([
+        {'$match': {'user': user_id}},
+        {'$count': 'n'},
+    ]))
+    return rows[0]['n'] if rows else 0
+
+
+def _task_statuses(user_id):
+    from tasks.models import Task
+
+    rows = Task._get_collection().aggregate([
+        {'$match': {'user': user_id}},
+        {'$group': {'_id': '$status', 'n': {'$sum': 1}}},
+    ])
+    return {row['_id']: row['n'] for row in rows if row['_id']}
+
+
+def aggregate_counters(user_id):
+    """Count a user's notes, events and tasks by status, one query per collection in parallel"""
+    from notes.models import Note
+    from events.models import Event
+
+    user_id = ObjectId(str(user_id))
+    executor = _executor.get()
+    notes = executor.submit(_count, Note, user_id)
+    events = executor.submit(_count, Event, user_id)
+    statuses = executor.submit(_task_statuses, user_id)
+    return {
+        'notes': notes.result(),
+        'tasks': sum(statuses.result().values()),
+        'events': events.result(),
+        'task_statuses': statuses.result(),
+    }
+
+
+def _statistics(counters):
+    statuses = counters['task_statuses']
+    return {
+        'total_notes': counters['notes'],
+        'total_tasks': counters['tasks'],
+        'total_events': counters['events'],
+        'completed_tasks': statuses.get('completed', 0),
+        'pending_tasks': statuses.get('pending', 0),
+    }
+
+
+def seed_counters(user_id, replace=False):
+    """Store freshly aggregated counters; keeps an existing document unless replace"""
+    counters = aggregate_counters(user_id)
+    prefix = 'set' if replace else 'set_on_insert'
+    UserStats.objects(user=ObjectId(str(user_id))).update_one(
+        upsert=True,
+        **{f"{prefix}__{field}": value for field, value in counters.items()},
+        set__updated_at=datetime.utcnow(),
+    )
+    return counters
+
+
+def get_statistics(user_id):
+    """The profile statistics of a user"""
+    if not MATERIALIZED:
+        return _statistics(aggregate_counters(user_id))
+
+    stats = UserStats.objects(user=ObjectId(str(user_id))).as_pymongo().first()
+    if stats is None:
+        return _statistics(seed_counters(user_id))
+    return _statistics({
+        'notes': stats.get('notes', 0),
+        'tasks': stats.get('tasks', 0),
+        'events': stats.get('events', 0),
+        'task_statuses': stats.get('task_statuses', {}),
+    })
+
+
+def record_change(user_id, notes=0, tasks=0, events=0, task_statuses=None):
+    """
+    Apply counter deltas after a write, e.g. record_change(user.id, tasks=1,
+    task_statuses={'pending': 1}). No-op unless USER_STATS_MATERIALIZED;
+    failures are logged and never fail the write.
+    """
+    if not MATERIALIZED:
+        return
+    deltas = {'notes': notes, 'tasks': tasks, 'events': events}
+    deltas.update({f"task_statuses__{status}": n for status, n in (task_statuses or {}).items() if status})
+    deltas = {f"inc__{field}": n for field, n in deltas.items() if n}
+    if not deltas:
+        return
+    try:
+        UserStats.objects(user=ObjectId(str(user_id))).update_one(**deltas, set__updated_at=datetime.utcnow())
+    except Exception:
+        logger.exception("Updating statistics of user %s failed", user_id)
@@ -5,12 +5,9 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import User
+from .stats import get_statistics
 import datetime
 
-from notes.models import Note
-from tasks.models import Task
-from events.models import Event
-
 def format_username(name):
     return " ".join(w.capitalize() for w in name.split())
 
@@ -91,16 +88,8 @@ def get_user_profile(request):
     """
     user = request.user
     
-    # Calculate user statistics
-    total_notes = Note.objects(user=user.id).count()
-    total_tasks = Task.objects(user=user.id).count()
-    total_events = Event.objects(user=user.id).count()
-    
-    # Count completed tasks
-    completed_tasks = Task.objects(user=user.id, status='completed').count()
-    
-    # Count pending tasks
-    pending_tasks = Task.objects(user=user.id, status='pending').count()
+    # Materialized counters, or one aggregation per collection (see users.stats)
+    statistics = get_statistics(user.id)
     
     return Response({
         'profile': {
@@ -114,11 +103,5 @@ def get_user_profile(request):
             'created_at': user.created_at,
             'updated_at': user.updated_at
         },
-        'statistics': {
-            'total_notes': total_notes,
-            'total_tasks': total_tasks,
-            'total_events': total_events,
-            'completed_tasks': completed_tasks,
-            'pending_tasks': pending_tasks
-        }
+        'statistics': statistics
     })